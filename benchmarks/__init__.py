@@ -0,0 +1,7 @@
+"""End-to-end benchmarks of githubscript's actions and publishscript.
+
+Every scenario runs a real task, in a new interpreter like a worker without
+the daemon does, against local stand-ins of Taskcluster, GitHub and the apdiff
+viewer. See `uv run -p 3.13 --frozen --project publishscript python -m
+benchmarks --help`.
+"""
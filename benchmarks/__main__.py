@@ -0,0 +1,344 @@
+"""Run the benchmarks and compare them to the stored baseline.
+
+Each scenario gets a worker of its own, with its artifact, token and checkout
+caches, and runs `--runs` times in a row. The first run is cold, the others
+find the caches the previous ones left, like tasks following each other on a
+worker. A run is reported with:
+- its wall time, interpreter startup included,
+- the requests it made, per service and endpoint,
+- the peak RSS of the task's process and of the git processes it ran.
+
+Tasks run like run.sh runs them, with `uv run -p 3.13 --frozen` in the
+project of their script, so each gets the dependencies its uv.lock pins. The
+benchmarks themselves only need aiohttp and cryptography, publishscript's
+environment has both. From the root of the repository:
+
+    uv run -p 3.13 --frozen --project publishscript python -m benchmarks \
+        [--latency 0.05] [--latency github=0.1] [scenario ...]
+
+Results are compared to `baseline.json`, the exit code is 1 on regressions.
+`--save-baseline` replaces it with the results of the run, along with the
+Python versions the scripts ran with. Wall times and memory only compare on
+the same machine, record a baseline there first.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from .scenarios import DEFAULT_PARAMS, OWNER, REPO, REPO_ALIAS, SCENARIOS, prepare
+from .standins import API_KEY, APP_ID, SERVICES, StandIns
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+PACKAGES = ("githubscript", "publishscript")
+# Same as run.sh.
+UV_RUN = ("uv", "run", "-p", "3.13", "--frozen")
+
+DEFAULT_LATENCY = 0.05
+DEFAULT_RUNS = 3
+DEFAULT_TOLERANCE = 0.25
+# Wall time differences under this are noise, whatever the tolerance.
+WALL_TIME_SLACK = 0.1
+
+
+def _private_key():
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption(),
+    )
+    return base64.b64encode(pem).decode()
+
+
+def _uv_run(package, args):
+    return [*UV_RUN, "--project", os.path.join(ROOT, package), *args]
+
+
+def _child_env(extra=None):
+    env = {**os.environ, **(extra or {})}
+    # uv would use the benchmarks' environment instead of the project's.
+    env.pop("VIRTUAL_ENV", None)
+    return env
+
+
+def _python_versions():
+    """Return the Python version each script runs with, syncing their
+    environments so the first runs don't pay for it."""
+    versions = {}
+    command = ["python", "-c", "import platform; print(platform.python_version())"]
+    for package in PACKAGES:
+        versions[package] = subprocess.run(
+            _uv_run(package, command),
+            env=_child_env(),
+            cwd=ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    return versions
+
+
+def _run_child(args, env, log_path):
+    """Run the task and return its exit code and peak RSS in bytes."""
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen(args, env=env, cwd=ROOT, stdout=log, stderr=log)
+        # Unlike Popen.wait, wait4 tells how much memory it used.
+        _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # Kilobytes on Linux.
+    return proc.returncode, rusage.ru_maxrss * 1024
+
+
+async def _run(standins, worker_dir, private_key, scenario, params, run):
+    task = await scenario(standins, params, run)
+    package = task["package"]
+
+    work_dir = os.path.join(worker_dir, "work")
+    os.makedirs(work_dir, exist_ok=True)
+    with open(os.path.join(work_dir, "task.json"), "w") as fd:
+        json.dump(task["task"], fd)
+
+    config = {
+        "work_dir": work_dir,
+        "artifact_dir": os.path.join(worker_dir, "artifact"),
+        "taskcluster_root_url": standins.urls["taskcluster"],
+        "artifact_cache_dir": os.path.join(worker_dir, "artifact-cache"),
+        "github_token_cache": os.path.join(worker_dir, "github-tokens.json"),
+        "metrics_textfile": os.path.join(worker_dir, "metrics", f"{package}.prom"),
+        "repos": {REPO_ALIAS: f"{OWNER}/{REPO}"},
+        "github": {
+            "app_id": str(APP_ID),
+            "private_key": private_key,
+            "api_url": standins.urls["github"],
+        },
+        "comment_mode": "upsert",
+        "apdiff": {"api_key": API_KEY, "viewer_url": standins.urls["apdiff"]},
+        **task["config"],
+    }
+    config_path = os.path.join(worker_dir, "config.json")
+    with open(config_path, "w") as fd:
+        json.dump(config, fd)
+
+    env = _child_env(
+        {**standins.git_env(), "TASKCLUSTER_ROOT_URL": standins.urls["taskcluster"]}
+    )
+    args = _uv_run(
+        package,
+        [
+            "python", "-m", "benchmarks.child",
+            package, config_path, os.path.join(worker_dir, "repo-cache"),
+        ],
+    )
+    log_path = os.path.join(worker_dir, f"run-{run}.log")
+
+    standins.reset_counts()
+    start = time.monotonic()
+    exit_code, peak_rss = await asyncio.get_running_loop().run_in_executor(
+        None, _run_child, args, env, log_path
+    )
+    wall_time = time.monotonic() - start
+    if exit_code != 0:
+        with open(log_path) as fd:
+            sys.stderr.write(fd.read()[-4000:])
+        raise RuntimeError(f"run {run} failed with exit code {exit_code}")
+
+    return {
+        "wall_time": round(wall_time, 3),
+        "peak_rss": peak_rss,
+        "requests": {
+            service: dict(sorted(standins.requests[service].items()))
+            for service in SERVICES
+        },
+    }
+
+
+def _summarize(runs):
+    """Cold and warm results of a scenario's runs, the warm ones being the
+    median run of the others."""
+    summary = {"cold": runs[0]}
+    if len(runs) > 1:
+        warm = sorted(runs[1:], key=lambda r: r["wall_time"])
+        summary["warm"] = warm[(len(warm) - 1) // 2]
+    return summary
+
+
+async def run_benchmarks(names, params, latency, runs):
+    results = {}
+    private_key = _private_key()
+    with tempfile.TemporaryDirectory(prefix="benchmarks-") as root:
+        async with StandIns(root, latency) as standins:
+            await prepare(standins, params)
+            for name in names:
+                worker_dir = os.path.join(root, "workers", name)
+                scenario_runs = []
+                for run in range(runs):
+                    result = await _run(
+                        standins, worker_dir, private_key, SCENARIOS[name], params, run
+                    )
+                    scenario_runs.append(result)
+                results[name] = _summarize(scenario_runs)
+    return results
+
+
+def _total_requests(result):
+    return {
+        service: sum(result["requests"][service].values()) for service in SERVICES
+    }
+
+
+def _compare(result, baseline, tolerance):
+    """Return the regressions of `result` compared to `baseline`."""
+    regressions = []
+    wall_time, base_wall_time = result["wall_time"], baseline["wall_time"]
+    if (
+        wall_time > base_wall_time * (1 + tolerance)
+        and wall_time - base_wall_time > WALL_TIME_SLACK
+    ):
+        regressions.append(f"wall time {base_wall_time:.2f}s -> {wall_time:.2f}s")
+
+    if result["peak_rss"] > baseline["peak_rss"] * (1 + tolerance):
+        regressions.append(
+            f"peak RSS {baseline['peak_rss'] >> 20}MiB"
+            f" -> {result['peak_rss'] >> 20}MiB"
+        )
+
+    for service in SERVICES:
+        requests = result["requests"][service]
+        base_requests = baseline["requests"][service]
+        if sum(requests.values()) <= sum(base_requests.values()):
+            continue
+        for endpoint in sorted(set(requests) | set(base_requests)):
+            count, base_count = requests.get(endpoint, 0), base_requests.get(endpoint, 0)
+            if count > base_count:
+                regressions.append(f"{service} {endpoint}: {base_count} -> {count}")
+    return regressions
+
+
+def _report(results, baseline, tolerance):
+    columns = ("wall", "RSS") + SERVICES
+    print(f"{'scenario':<22}{'run':<6}" + "".join(f"{c:>13}" for c in columns))
+
+    regressions = []
+    for name, summary in results.items():
+        for run, result in summary.items():
+            base = (baseline or {}).get(name, {}).get(run)
+            requests = _total_requests(result)
+            cells = [
+                f"{result['wall_time']:.2f}s",
+                f"{result['peak_rss'] >> 20}MiB",
+                *(str(requests[service]) for service in SERVICES),
+            ]
+            if base is not None:
+                base_requests = _total_requests(base)
+                cells = [
+                    f"{cells[0]} {result['wall_time'] / base['wall_time'] - 1:+.0%}",
+                    f"{cells[1]} {result['peak_rss'] / base['peak_rss'] - 1:+.0%}",
+                    *(
+                        f"{requests[s]} ({requests[s] - base_requests[s]:+d})"
+                        for s in SERVICES
+                    ),
+                ]
+                regressions += [
+                    f"{name} ({run}): {regression}"
+                    for regression in _compare(result, base, tolerance)
+                ]
+            print(f"{name:<22}{run:<6}" + "".join(f"{c:>13}" for c in cells))
+    return regressions
+
+
+def _parse_latency(values):
+    latency = dict.fromkeys(SERVICES, DEFAULT_LATENCY)
+    for value in values:
+        service, _, seconds = value.rpartition("=")
+        if service and service not in SERVICES:
+            raise argparse.ArgumentTypeError(f"Unknown service {service}")
+        for s in [service] if service else SERVICES:
+            latency[s] = float(seconds)
+    return latency
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "scenarios",
+        nargs="*",
+        metavar="scenario",
+        help=f"Scenarios to run, all of them by default: {', '.join(SCENARIOS)}",
+    )
+    parser.add_argument(
+        "--latency",
+        action="append",
+        default=[],
+        metavar="[SERVICE=]SECONDS",
+        help=f"Latency of the stand-ins, {DEFAULT_LATENCY}s by default",
+    )
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    for param, default in DEFAULT_PARAMS.items():
+        parser.add_argument(f"--{param.replace('_', '-')}", type=int, default=default)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--json", help="Write the results, with every request, there")
+    args = parser.parse_args(argv)
+
+    names = args.scenarios or list(SCENARIOS)
+    for name in names:
+        if name not in SCENARIOS:
+            parser.error(f"Unknown scenario {name}")
+    params = {param: getattr(args, param) for param in DEFAULT_PARAMS}
+    latency = _parse_latency(args.latency)
+    setup = {"params": params, "latency": latency, "runs": args.runs}
+
+    python = _python_versions()
+    results = asyncio.run(run_benchmarks(names, params, latency, args.runs))
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as fd:
+            stored = json.load(fd)
+        if stored["setup"] != setup:
+            print("The baseline was run with other settings, not comparing to it")
+        else:
+            baseline = stored["results"]
+            if stored.get("python") != python:
+                print(
+                    f"The baseline was run with Python {stored.get('python')},"
+                    f" this run with {python}"
+                )
+
+    regressions = _report(results, baseline, args.tolerance)
+
+    output = {"setup": setup, "python": python, "results": results}
+    if args.json:
+        with open(args.json, "w") as fd:
+            json.dump(output, fd, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as fd:
+            json.dump(output, fd, indent=2)
+            fd.write("\n")
+
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
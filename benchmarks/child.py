@@ -0,0 +1,21 @@
+"""Run one task the way scriptworker does, in the process being measured.
+
+Usage: python -m benchmarks.child PACKAGE CONFIG REPO_CACHE_DIR
+"""
+import importlib
+import sys
+
+
+def main(package, config_path, repo_cache_dir):
+    if package == "publishscript":
+        from publishscript import publish
+
+        # The checkout cache isn't configurable, keep it with the rest of the
+        # worker's state.
+        publish.CACHE_DIR = repo_cache_dir
+
+    importlib.import_module(f"{package}.__main__").main(config_path)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
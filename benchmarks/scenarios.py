@@ -0,0 +1,279 @@
+"""The tasks benchmarked, one per githubscript action and publish engine.
+
+`prepare` fills the stand-ins with what every scenario shares: the index
+repository, a PR with a long comment thread, and the diff, test and fuzz
+tasks of a world. Each scenario then returns the task to run for its
+`run`-th run, registering whatever that run needs. Runs of the same scenario
+comment on the same PR, publishes each merge a PR of their own.
+"""
+import difflib
+import json
+
+OWNER = "Eijebong"
+REPO = "Archipelago-index"
+REPO_ALIAS = "archipelago-index"
+WORLD = "test_apworld"
+VERSION = "1.0.0"
+PR_NUMBER = 1
+# Publishes of the git and api engines merge PRs numbered from there.
+PUBLISH_PR_NUMBERS = {"git": 1000, "api": 2000}
+
+DEFAULT_PARAMS = {
+    # Fuzz configs of the apfuzz comment and of the fuzz results upload.
+    "fuzz_tasks": 6,
+    # Size of the world's apdiff, the checksum is at its very end.
+    "apdiff_size": 1024 * 1024,
+    # Worlds in the index, one file each and one line each in index.lock.
+    "repo_files": 2000,
+    # Lines added to index.lock and meta/expectations.toml by a publish.
+    "patch_lines": 50,
+    # Comments already on the PR before the bot's.
+    "comments": 150,
+}
+
+
+def _fuzz_extra_args(i):
+    if i == 0:
+        return None
+    return f"check-{i}" if i % 2 else f"config-{i}"
+
+
+def _apdiff(size):
+    diffs = {}
+    padding = "x" * 16 * 1024
+    i = 0
+    while len(padding) * i < size:
+        diffs[f"0.{i}.0...0.{i + 1}.0"] = {
+            "VersionAdded": {"content": padding, "checksum": f"checksum-{i}"}
+        }
+        i += 1
+    diffs[f"0.{i}.0...{VERSION}"] = {
+        "VersionAdded": {"content": "", "checksum": "benchmarks-checksum"}
+    }
+    return {"world_name": "Test Apworld", "apworld_name": WORLD, "diffs": diffs}
+
+
+def _fuzz_report(i):
+    return {
+        "stats": {
+            "total": 5000,
+            "success": 3480 - i,
+            "failure": i,
+            "timeout": 0,
+            "ignored": 1520,
+        },
+        "errors": {},
+    }
+
+
+def _index_files(count):
+    files = {
+        f"index/world-{i}.toml": f'name = "World {i}"\nversion = "1.0.{i}"\n'
+        for i in range(count)
+    }
+    files["index.lock"] = "[worlds]\n" + "".join(
+        f'world-{i} = "1.0.{i}"\n' for i in range(count)
+    )
+    files["meta/expectations.toml"] = "".join(
+        f'world-{i} = "ok"\n' for i in range(count)
+    )
+    files["README.md"] = "# Archipelago index\n"
+    return files
+
+
+def _append_patch(path, content, lines):
+    old = content.decode().splitlines(keepends=True)
+    return "".join(
+        difflib.unified_diff(old, old + lines, f"a/{path}", f"b/{path}")
+    ).encode()
+
+
+async def prepare(standins, params):
+    await standins.add_repo(OWNER, REPO, _index_files(params["repo_files"]))
+    await standins.add_pull(OWNER, REPO, PR_NUMBER, {"index/new-world.toml": "\n"})
+    standins.add_comments(OWNER, REPO, PR_NUMBER, params["comments"])
+
+    standins.add_task(
+        "diff",
+        artifacts={
+            f"public/diffs/{WORLD}.apdiff": json.dumps(
+                _apdiff(params["apdiff_size"])
+            ).encode()
+        },
+    )
+    standins.add_task(
+        "test",
+        artifacts={
+            f"public/{WORLD}.aptest": json.dumps(
+                {"apworld": WORLD, "version": VERSION}
+            ).encode()
+        },
+    )
+    for i in range(params["fuzz_tasks"]):
+        standins.add_task(
+            f"fuzz-{i}",
+            artifacts={
+                "public/report.json": json.dumps(_fuzz_report(i)).encode(),
+                f"public/fuzz_output_fuzz-{i}.zip": b"PK\x05\x06" + bytes(18),
+            },
+            description=f"Fuzz config {i}",
+        )
+        standins.baselines[_fuzz_extra_args(i)] = [
+            {"match_type": match_type, "success": 3400, "failure": 1, "timeout": 0}
+            for match_type in ("Same checksum", "Previous version")
+        ]
+
+
+def _task_group(standins, name, run, pr_number):
+    task_group_id = f"{name}-{run}"
+    standins.add_task(task_group_id)
+    standins.add_build(pr_number, task_group_id)
+    return task_group_id
+
+
+def _githubscript_task(standins, name, run, action, payload):
+    return {
+        "package": "githubscript",
+        "task": {
+            "taskGroupId": _task_group(standins, name, run, PR_NUMBER),
+            "scopes": [
+                f"ap:github:repo:{REPO_ALIAS}",
+                f"ap:github:action:{action}",
+            ],
+            "payload": payload,
+        },
+        "config": {},
+    }
+
+
+async def apdiff_comment(standins, params, run):
+    return _githubscript_task(
+        standins,
+        "apdiff-comment",
+        run,
+        f"create-apdiff-comment-on-pr:{PR_NUMBER}",
+        {"diff-task": "diff"},
+    )
+
+
+async def aptest_comment(standins, params, run):
+    return _githubscript_task(
+        standins,
+        "aptest-comment",
+        run,
+        f"create-aptest-comment-on-pr:{PR_NUMBER}",
+        {"test-task": "test"},
+    )
+
+
+async def apfuzz_comment(standins, params, run):
+    fuzz_tasks = []
+    for i in range(params["fuzz_tasks"]):
+        fuzz_task = {"task-id": f"fuzz-{i}"}
+        if _fuzz_extra_args(i):
+            fuzz_task["extra-args"] = _fuzz_extra_args(i)
+        fuzz_tasks.append(fuzz_task)
+
+    return _githubscript_task(
+        standins,
+        "apfuzz-comment",
+        run,
+        f"create-apfuzz-comment-on-pr:{PR_NUMBER}",
+        {
+            "fuzz-tasks": fuzz_tasks,
+            "diff-task": "diff",
+            "world-name": WORLD,
+            "world-version": VERSION,
+        },
+    )
+
+
+async def upload_fuzz_results(standins, params, run):
+    results = []
+    for i in range(params["fuzz_tasks"]):
+        result = {
+            "fuzz-task": f"fuzz-{i}",
+            "diff-task": "diff",
+            "world-name": WORLD,
+            "world-version": VERSION,
+        }
+        if _fuzz_extra_args(i):
+            result["extra-args"] = _fuzz_extra_args(i)
+        results.append(result)
+
+    return _githubscript_task(
+        standins,
+        "upload-fuzz-results",
+        run,
+        f"upload-fuzz-results:pr:{PR_NUMBER}",
+        {"results": results},
+    )
+
+
+async def _publish(standins, params, run, engine):
+    pr_number = PUBLISH_PR_NUMBERS[engine] + run
+    head = await standins.add_pull(
+        OWNER, REPO, pr_number, {f"index/new-world-{pr_number}.toml": "\n"}
+    )
+
+    # Patches against main as the previous runs left it.
+    git_repo = standins.repos[OWNER, REPO]
+    lock, expectations = [
+        await git_repo.read_blob(await git_repo.rev_parse(f"refs/heads/main:{path}"))
+        for path in ("index.lock", "meta/expectations.toml")
+    ]
+    lines = range(params["patch_lines"])
+    standins.add_task(
+        f"diff-{pr_number}",
+        artifacts={
+            "public/build/lock.diff": _append_patch(
+                "index.lock",
+                lock,
+                [f'new-world-{pr_number}-{i} = "1.0.0"\n' for i in lines],
+            )
+        },
+    )
+    standins.add_task(
+        f"expectations-{pr_number}",
+        artifacts={
+            "public/expectations.patch": _append_patch(
+                "meta/expectations.toml",
+                expectations,
+                [f'new-world-{pr_number}-{i} = "ok"\n' for i in lines],
+            )
+        },
+    )
+
+    return {
+        "package": "publishscript",
+        "task": {
+            "taskGroupId": _task_group(standins, f"publish-{engine}", run, pr_number),
+            "scopes": [f"ap:publish:repo:{REPO_ALIAS}"],
+            "payload": {
+                "pr-number": pr_number,
+                "head-rev": head,
+                "diff-task": f"diff-{pr_number}",
+                "expectations-task": f"expectations-{pr_number}",
+            },
+        },
+        "config": {"publish_engine": engine},
+    }
+
+
+async def publish_git(standins, params, run):
+    return await _publish(standins, params, run, "git")
+
+
+async def publish_api(standins, params, run):
+    return await _publish(standins, params, run, "api")
+
+
+# apply-patch isn't implemented, there's nothing to benchmark.
+SCENARIOS = {
+    "apdiff-comment": apdiff_comment,
+    "aptest-comment": aptest_comment,
+    "apfuzz-comment": apfuzz_comment,
+    "upload-fuzz-results": upload_fuzz_results,
+    "publish-git": publish_git,
+    "publish-api": publish_api,
+}
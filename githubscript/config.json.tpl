@@ -7,6 +7,7 @@
         "private_key": "${GITHUB_PRIVATE_KEY}",
         "app_id": "${GITHUB_APP_ID}"
     },
+    "comment_mode": "upsert",
     "apdiff": {
         "api_key": "${APDIFF_API_KEY}",
         "viewer_url": "${APDIFF_VIEWER_URL}"
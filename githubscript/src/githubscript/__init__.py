@@ -1,7 +1,5 @@
-import base64
 from scriptworker.exceptions import TaskVerificationError
 from .scopes import extract_actions_from_scopes, extract_target_repo_from_scopes
-from simple_github import AppClient
 from .actions import ACTIONS
 
 
@@ -29,7 +27,24 @@ def _check_requirements(actions, config):
     return requirements
 
 
+async def _run_actions(context, actions):
+    from . import metrics
+    from .tracing import span
+
+    for (action, *args) in actions:
+        with span(f"action {action}", **{"githubscript.action": action}):
+            with metrics.action(action):
+                await ACTIONS[action]["handler"](context, args)
+
+
 async def async_main(context):
+    from . import metrics
+    from .tracing import trace, trace_path
+    from .transport import get_session
+
+    # Route every HTTP call of the task, including the Taskcluster clients
+    # bound to `context.session`, through the pooled transport.
+    context.session = get_session(context.config)
     task_scopes = context.task["scopes"]
     config = context.config
 
@@ -42,19 +57,23 @@ async def async_main(context):
     }
 
     actions = extract_actions_from_scopes(task_scopes)
-    requirements = _check_requirements(actions, config)
-
-    if "github" in requirements:
-        async with AppClient(
-            config["github"]["app_id"],
-            base64.b64decode(config["github"]["private_key"]),
-            owner,
-            repositories=[repo],
-        ) as github:
-            context.github = github
-
-            for (action, *args) in actions:
-                await ACTIONS[action]["handler"](context, args)
-    else:
-        for (action, *args) in actions:
-            await ACTIONS[action]["handler"](context, args)
+    with metrics.collect(config.get("metrics_textfile")), trace(
+        "async_main",
+        trace_path(config),
+        **{
+            "githubscript.repo": target_repo,
+            "githubscript.actions": [action for action, *_ in actions],
+        },
+    ):
+        requirements = _check_requirements(actions, config)
+
+        if "github" in requirements:
+            # Only import the GitHub client when an action needs it, it's slow
+            # to import and upload-fuzz-results never talks to GitHub.
+            from .github_auth import get_github_client
+
+            async with get_github_client(context, owner, repo) as github:
+                context.github = github
+                await _run_actions(context, actions)
+        else:
+            await _run_actions(context, actions)
@@ -1,13 +1,23 @@
-from scriptworker.exceptions import TaskVerificationError
-from taskcluster import Queue
+from scriptworker.exceptions import ConfigError, TaskVerificationError
+import asyncio
 import logging
+from .artifacts import open_artifact, read_json_artifact
+from .baselines import FuzzBaselines
+from .clients import get_queue
+from .comments import upsert_comment
+from .tracing import span
 from .utils import is_task_coming_from_pr
-import json
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_FUZZ_COMMENT_CONCURRENCY = 8
+DEFAULT_FUZZ_UPLOAD_CONCURRENCY = 8
+DEFAULT_FUZZ_UPLOAD_BATCH_SIZE = 50
 
-def _get_pr_info(context, args):
+FUZZ_RESULT_FIELDS = ("fuzz-task", "diff-task", "world-name", "world-version")
+
+
+async def _get_pr_info(context, args):
     if len(args) != 1:
         raise TaskVerificationError("You should provide one, and only one PR number")
 
@@ -23,7 +33,7 @@ def _get_pr_info(context, args):
     repo = context.config["target"]["repo"]
     task_id = context.task["taskGroupId"]
 
-    if not is_task_coming_from_pr(context, task_id, owner, repo, pr_number):
+    if not await is_task_coming_from_pr(context, task_id, owner, repo, pr_number):
         raise TaskVerificationError(
             f"This task was scheduled for pr {pr_number} but it doesn't seem to be coming from it"
         )
@@ -31,7 +41,19 @@ def _get_pr_info(context, args):
     return owner, repo, pr_number
 
 
-async def _create_github_comment(context, owner, repo, pr_number, comment):
+async def _create_github_comment(context, owner, repo, pr_number, comment, kind):
+    if context.config.get("comment_mode", "create") == "upsert":
+        await upsert_comment(
+            context.github,
+            owner,
+            repo,
+            pr_number,
+            kind,
+            comment,
+            context.config["github"]["app_id"],
+        )
+        return
+
     path = f"/repos/{owner}/{repo}/issues/{pr_number}/comments"
 
     logging.info(
@@ -45,7 +67,7 @@ async def _create_github_comment(context, owner, repo, pr_number, comment):
 
 
 async def create_apdiff_comment_on_pr(context, args):
-    owner, repo, pr_number = _get_pr_info(context, args)
+    owner, repo, pr_number = await _get_pr_info(context, args)
 
     logger.info("Creating apdiff comment for PR %s" % pr_number)
 
@@ -56,13 +78,9 @@ async def create_apdiff_comment_on_pr(context, args):
     diff_task_id = payload["diff-task"]
 
     logger.debug("Diff task ID is %s" % diff_task_id)
-    queue = Queue(
-        {
-            "rootUrl": context.config["taskcluster_root_url"],
-        }
-    )
+    queue = get_queue(context)
 
-    artifacts = queue.listLatestArtifacts(diff_task_id)["artifacts"]
+    artifacts = (await queue.listLatestArtifacts(diff_task_id))["artifacts"]
     found_diff = None
     for artifact in artifacts:
         if artifact["name"].endswith(".apdiff"):
@@ -74,7 +92,7 @@ async def create_apdiff_comment_on_pr(context, args):
     else:
         comment = "No reviewable change"
 
-    await _create_github_comment(context, owner, repo, pr_number, comment)
+    await _create_github_comment(context, owner, repo, pr_number, comment, "apdiff")
 
 
 def apply_patch(context, args):
@@ -82,7 +100,7 @@ def apply_patch(context, args):
 
 
 async def create_aptest_comment_on_pr(context, args):
-    owner, repo, pr_number = _get_pr_info(context, args)
+    owner, repo, pr_number = await _get_pr_info(context, args)
 
     logger.info("Creating aptest comment for PR %s" % pr_number)
     payload = context.task["payload"]
@@ -92,13 +110,9 @@ async def create_aptest_comment_on_pr(context, args):
     test_task_id = payload["test-task"]
 
     logger.debug("Test task ID is %s" % test_task_id)
-    queue = Queue(
-        {
-            "rootUrl": context.config["taskcluster_root_url"],
-        }
-    )
+    queue = get_queue(context)
 
-    artifacts = queue.listLatestArtifacts(test_task_id)["artifacts"]
+    artifacts = (await queue.listLatestArtifacts(test_task_id))["artifacts"]
     found_test = None
     for artifact in artifacts:
         if artifact["name"].endswith(".aptest"):
@@ -106,18 +120,17 @@ async def create_aptest_comment_on_pr(context, args):
             break
 
     if found_test:
-        aptest_url = queue.getLatestArtifact(test_task_id, found_test)["url"]
-        async with context.session.get(aptest_url) as r:
-            r.raise_for_status()
-            aptest_info = json.loads((await r.read()).decode())
-            apworld_name = aptest_info["apworld"]
-            apworld_version = aptest_info["version"]
+        aptest_info = await read_json_artifact(context, test_task_id, found_test)
+        apworld_name = aptest_info["apworld"]
+        apworld_version = aptest_info["version"]
 
         comment = f"[Test failures for {apworld_name}:{apworld_version}](https://apdiff.bananium.fr/tests/{test_task_id})"
-        await _create_github_comment(context, owner, repo, pr_number, comment)
+        await _create_github_comment(
+            context, owner, repo, pr_number, comment, f"aptest:{apworld_name}"
+        )
 
 
-def _get_fuzz_target_info(context, args):
+async def _get_fuzz_target_info(context, args):
     if len(args) != 2:
         raise TaskVerificationError(
             "Expected two arguments: type (pr/branch) and value"
@@ -129,32 +142,104 @@ def _get_fuzz_target_info(context, args):
         raise TaskVerificationError(f"Invalid target type '{target_type}'")
 
     if target_type == "pr":
-        _, _, pr_number = _get_pr_info(context, [target_value])
+        _, _, pr_number = await _get_pr_info(context, [target_value])
         return ("pr", pr_number)
     else:
         return ("branch", target_value)
 
 
-def _extract_checksum_from_apdiff(apdiff, version):
-    for version_range, diff in apdiff.get("diffs", {}).items():
-        if "..." not in version_range:
-            continue
-        _, to_version = version_range.split("...", 1)
-        if to_version != version:
-            continue
-        if "VersionAdded" not in diff:
-            continue
-        return diff["VersionAdded"]["checksum"]
+async def _extract_checksum_from_apdiff(reader, version):
+    """Find the VersionAdded checksum of the diff ending at `version`.
+
+    The apdiff is parsed incrementally from `reader` and parsing stops as soon
+    as the checksum is found, so large apdiffs are never held in memory.
+    """
+    import ijson
+
+    # Keys of the maps enclosing the current event, None for arrays and maps
+    # whose first key hasn't been seen yet.
+    path = []
+    async for event, value in ijson.basic_parse_async(reader):
+        if event in ("start_map", "start_array"):
+            path.append(None)
+        elif event in ("end_map", "end_array"):
+            path.pop()
+        elif event == "map_key":
+            path[-1] = value
+        elif (
+            event == "string"
+            and len(path) == 4
+            and path[0] == "diffs"
+            and path[2:] == ["VersionAdded", "checksum"]
+        ):
+            version_range = path[1]
+            if "..." not in version_range:
+                continue
+            _, to_version = version_range.split("...", 1)
+            if to_version == version:
+                return value
     return None
 
 
+async def _get_apdiff_checksum(context, diff_task_id, world_name, version):
+    logger.debug("Getting apdiff artifact from task %s" % diff_task_id)
+    async with open_artifact(
+        context, diff_task_id, f"public/diffs/{world_name}.apdiff"
+    ) as reader:
+        return await _extract_checksum_from_apdiff(reader, version)
+
+
+def _get_fuzz_result_entries(payload):
+    """Return the (fuzz-task, diff-task, world, version) entries to upload,
+    either the ones listed in `results` or the single one of the payload."""
+    if "results" in payload:
+        entries = payload["results"]
+        if not entries:
+            raise TaskVerificationError("results can't be empty")
+    else:
+        entries = [payload]
+
+    for entry in entries:
+        for field in FUZZ_RESULT_FIELDS:
+            if field not in entry:
+                raise TaskVerificationError(f"{field} is missing from the payload")
+
+    return entries
+
+
+async def _resolve_fuzz_result(context, entry):
+    fuzz_task_id = entry["fuzz-task"]
+    world_name = entry["world-name"]
+    world_version = entry["world-version"]
+
+    logger.debug("Getting fuzz artifact from task %s" % fuzz_task_id)
+    fuzz_report, checksum = await asyncio.gather(
+        read_json_artifact(context, fuzz_task_id, "public/report.json"),
+        _get_apdiff_checksum(context, entry["diff-task"], world_name, world_version),
+    )
+
+    if not checksum:
+        raise TaskVerificationError(
+            f"Could not find checksum for version {world_version} in apdiff"
+        )
+
+    stats = fuzz_report["stats"]
+    return {
+        "world_name": world_name,
+        "version": world_version,
+        "checksum": checksum,
+        "total": stats["total"],
+        "success": stats["success"],
+        "failure": stats["failure"],
+        "timeout": stats["timeout"],
+        "ignored": stats["ignored"],
+    }
+
+
 async def upload_fuzz_results(context, args):
-    target_type, target_value = _get_fuzz_target_info(context, args)
+    target_type, target_value = await _get_fuzz_target_info(context, args)
     payload = context.task["payload"]
-
-    for field in ("fuzz-task", "diff-task", "world-name", "world-version"):
-        if field not in payload:
-            raise TaskVerificationError(f"{field} is missing from the payload")
+    entries = _get_fuzz_result_entries(payload)
 
     if target_type == "branch" and target_value != "main":
         logger.info(
@@ -165,71 +250,62 @@ async def upload_fuzz_results(context, args):
     apdiff_config = context.config["apdiff"]
     api_key = apdiff_config["api_key"]
 
-    logger.info("Uploading fuzz results for %s %s" % (target_type, target_value))
-
-    fuzz_task_id = payload["fuzz-task"]
-    diff_task_id = payload["diff-task"]
-    world_name = payload["world-name"]
-    world_version = payload["world-version"]
-    extra_args = payload.get("extra-args")
+    logger.info(
+        "Uploading %s fuzz results for %s %s"
+        % (len(entries), target_type, target_value)
+    )
 
-    queue = Queue(
-        {
-            "rootUrl": context.config["taskcluster_root_url"],
-        }
+    semaphore = asyncio.Semaphore(
+        context.config.get("fuzz_upload_concurrency", DEFAULT_FUZZ_UPLOAD_CONCURRENCY)
     )
 
-    logger.debug("Getting fuzz artifact from task %s" % fuzz_task_id)
-    fuzz_report_url = queue.getLatestArtifact(fuzz_task_id, "public/report.json")["url"]
-    async with context.session.get(fuzz_report_url) as r:
-        r.raise_for_status()
-        fuzz_report = json.loads((await r.read()).decode())
-    stats = fuzz_report["stats"]
+    async def _resolve(entry):
+        async with semaphore:
+            return await _resolve_fuzz_result(context, entry)
 
-    logger.debug("Getting apdiff artifact from task %s" % diff_task_id)
-    apdiff_url = queue.getLatestArtifact(
-        diff_task_id, f"public/diffs/{world_name}.apdiff"
-    )["url"]
-    async with context.session.get(apdiff_url) as r:
-        r.raise_for_status()
-        apdiff = json.loads((await r.read()).decode())
-    checksum = _extract_checksum_from_apdiff(apdiff, world_version)
+    # Resolve everything before uploading anything, so a bad entry doesn't
+    # leave a partial upload behind.
+    results = await asyncio.gather(*(_resolve(entry) for entry in entries))
 
-    if not checksum:
-        raise TaskVerificationError(
-            f"Could not find checksum for version {world_version} in apdiff"
-        )
+    # The task ID and extra args are per request, results sharing them go in
+    # the same requests.
+    groups = {}
+    for entry, result in zip(entries, results):
+        key = (entry["fuzz-task"], entry.get("extra-args", payload.get("extra-args")))
+        groups.setdefault(key, []).append(result)
 
     apdiff_viewer_url = context.config["apdiff"]["viewer_url"]
     pr_number = target_value if target_type == "pr" else None
+    batch_size = context.config.get(
+        "fuzz_upload_batch_size", DEFAULT_FUZZ_UPLOAD_BATCH_SIZE
+    )
 
-    request_body = {
-        "task_id": fuzz_task_id,
-        "pr_number": pr_number,
-        "results": [
-            {
-                "world_name": world_name,
-                "version": world_version,
-                "checksum": checksum,
-                "total": stats["total"],
-                "success": stats["success"],
-                "failure": stats["failure"],
-                "timeout": stats["timeout"],
-                "ignored": stats["ignored"],
-            }
-        ],
-    }
-
-    if extra_args:
-        request_body["extra_args"] = extra_args
+    async def _post(fuzz_task_id, extra_args, batch):
+        request_body = {
+            "task_id": fuzz_task_id,
+            "pr_number": pr_number,
+            "results": batch,
+        }
 
-    logger.info("Posting fuzz results to API")
-    async with context.session.post(
-        f"{apdiff_viewer_url}/api/fuzz-results",
-        json=request_body,
-        headers={"X-Api-Key": api_key},
-    ) as r:
-        r.raise_for_status()
+        if extra_args:
+            request_body["extra_args"] = extra_args
+
+        async with semaphore:
+            logger.info("Posting %s fuzz results to API" % len(batch))
+            async with context.session.post(
+                f"{apdiff_viewer_url}/api/fuzz-results",
+                json=request_body,
+                headers={"X-Api-Key": api_key},
+            ) as r:
+                r.raise_for_status()
+
+    await asyncio.gather(
+        *(
+            _post(fuzz_task_id, extra_args, group[i : i + batch_size])
+            for (fuzz_task_id, extra_args), group in groups.items()
+            for i in range(0, len(group), batch_size)
+        )
+    )
 
 
 def _format_diff(val):
@@ -243,17 +319,12 @@ def _format_pct(count, total, ignored):
     return f"{100 * count / effective:.1f}%"
 
 
-async def _build_fuzz_comment_section(
-    context, queue, fuzz_task, world_name, world_version, checksum, apdiff_viewer_url
-):
+async def _build_fuzz_comment_section(context, queue, fuzz_task, baselines):
     fuzz_task_id = fuzz_task["task-id"]
     extra_args = fuzz_task.get("extra-args")
 
     logger.debug("Getting fuzz artifact from task %s" % fuzz_task_id)
-    fuzz_report_url = queue.getLatestArtifact(fuzz_task_id, "public/report.json")["url"]
-    async with context.session.get(fuzz_report_url) as r:
-        r.raise_for_status()
-        fuzz_report = json.loads((await r.read()).decode())
+    fuzz_report = await read_json_artifact(context, fuzz_task_id, "public/report.json")
     current_stats = fuzz_report["stats"]
 
     total = current_stats["total"]
@@ -264,9 +335,9 @@ async def _build_fuzz_comment_section(
     config_name = extra_args if extra_args else "default"
 
     results_link = ""
-    runs = queue.status(fuzz_task_id)["status"]["runs"]
+    runs = (await queue.status(fuzz_task_id))["status"]["runs"]
     run_id = runs[-1]["runId"]
-    artifacts = queue.listArtifacts(fuzz_task_id, run_id).get("artifacts", [])
+    artifacts = (await queue.listArtifacts(fuzz_task_id, run_id)).get("artifacts", [])
     for artifact in artifacts:
         if artifact["name"].startswith("public/fuzz_output"):
             tc_root = context.config["taskcluster_root_url"]
@@ -296,15 +367,7 @@ async def _build_fuzz_comment_section(
     body += "```\n"
     body += f"**Failure rate**: {failure_pct}\n"
 
-    url = f"{apdiff_viewer_url}/api/fuzz-results/{world_name}/previous"
-    params = {"version": world_version, "checksum": checksum}
-    if extra_args:
-        params["extra_args"] = extra_args
-
-    async with context.session.get(url, params=params) as r:
-        r.raise_for_status()
-        response = json.loads((await r.read()).decode())
-        previous_results = response.get("previous_results", [])
+    previous_results = await baselines.get(extra_args)
 
     if previous_results:
         body += "\n**Comparison with baselines:**\n"
@@ -321,7 +384,7 @@ async def _build_fuzz_comment_section(
         body += "\nNo previous results found for comparison.\n"
 
     if is_check:
-        task_desc = queue.task(fuzz_task_id).get("metadata", {}).get("description", "")
+        task_desc = (await queue.task(fuzz_task_id)).get("metadata", {}).get("description", "")
         details_body = ""
         if task_desc:
             details_body += f"{task_desc}\n\n"
@@ -334,11 +397,20 @@ async def _build_fuzz_comment_section(
 
 
 async def create_apfuzz_comment_on_pr(context, args):
-    owner, repo, pr_number = _get_pr_info(context, args)
+    owner, repo, pr_number = await _get_pr_info(context, args)
 
     logger.info("Creating apfuzz comment for PR %s" % pr_number)
     payload = context.task["payload"]
 
+    concurrency = context.config.get(
+        "fuzz_comment_concurrency", DEFAULT_FUZZ_COMMENT_CONCURRENCY
+    )
+    if concurrency < 1:
+        # No section would ever be built.
+        raise ConfigError(
+            f"fuzz_comment_concurrency must be at least 1, not {concurrency}"
+        )
+
     for field in ("fuzz-tasks", "diff-task", "world-name", "world-version"):
         if field not in payload:
             raise TaskVerificationError(f"{field} is missing from the payload")
@@ -348,19 +420,11 @@ async def create_apfuzz_comment_on_pr(context, args):
     world_name = payload["world-name"]
     world_version = payload["world-version"]
 
-    queue = Queue(
-        {
-            "rootUrl": context.config["taskcluster_root_url"],
-        }
-    )
+    queue = get_queue(context)
 
-    apdiff_url = queue.getLatestArtifact(
-        diff_task_id, f"public/diffs/{world_name}.apdiff"
-    )["url"]
-    async with context.session.get(apdiff_url) as r:
-        r.raise_for_status()
-        apdiff = json.loads((await r.read()).decode())
-    checksum = _extract_checksum_from_apdiff(apdiff, world_version)
+    checksum = await _get_apdiff_checksum(
+        context, diff_task_id, world_name, world_version
+    )
 
     if not checksum:
         raise TaskVerificationError(
@@ -374,18 +438,38 @@ async def create_apfuzz_comment_on_pr(context, args):
         fuzz_tasks,
         key=lambda t: (t.get("extra-args", "").startswith("check-"), t.get("extra-args", "")),
     )
-    for fuzz_task in fuzz_tasks:
-        comment += await _build_fuzz_comment_section(
-            context,
-            queue,
-            fuzz_task,
-            world_name,
-            world_version,
-            checksum,
-            apdiff_viewer_url,
-        )
 
-    await _create_github_comment(context, owner, repo, pr_number, comment)
+    # Every config is compared against the same world version, look all their
+    # baselines up at once.
+    baselines = FuzzBaselines(
+        context.session,
+        apdiff_viewer_url,
+        world_name,
+        world_version,
+        checksum,
+        [t.get("extra-args") for t in fuzz_tasks],
+    )
+
+    # Sections are independent, build them concurrently but keep the sorted
+    # order when assembling the comment.
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _build_section(fuzz_task):
+        async with semaphore:
+            with span(
+                "fuzz comment section",
+                **{"githubscript.extra_args": fuzz_task.get("extra-args")},
+            ):
+                return await _build_fuzz_comment_section(
+                    context, queue, fuzz_task, baselines
+                )
+
+    sections = await asyncio.gather(*(_build_section(t) for t in fuzz_tasks))
+    comment += "".join(sections)
+
+    await _create_github_comment(
+        context, owner, repo, pr_number, comment, f"apfuzz:{world_name}"
+    )
 
 
 ACTIONS = {
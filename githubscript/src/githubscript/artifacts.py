@@ -0,0 +1,91 @@
+from contextlib import asynccontextmanager
+from .artifact_cache import ArtifactCache, RESOLVED_STATES
+from .clients import get_queue
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _FileReader:
+    def __init__(self, fileobj):
+        self._file = fileobj
+
+    async def read(self, n=-1):
+        return self._file.read(n)
+
+
+class _TeeReader:
+    """Copy everything read from `stream` to `fileobj`."""
+
+    def __init__(self, stream, fileobj):
+        self._stream = stream
+        self._file = fileobj
+
+    async def read(self, n=-1):
+        chunk = await self._stream.read(n)
+        self._file.write(chunk)
+        return chunk
+
+
+def get_artifact_cache(context):
+    return ArtifactCache.from_config(context.config)
+
+
+async def _latest_resolved_run_id(queue, task_id):
+    runs = (await queue.status(task_id))["status"]["runs"]
+    if not runs or runs[-1].get("state") not in RESOLVED_STATES:
+        return None
+    return runs[-1]["runId"]
+
+
+@asynccontextmanager
+async def open_artifact(context, task_id, name):
+    """Open the `name` artifact of the latest run of `task_id`.
+
+    Yields a reader with an async `read(n=-1)` method. Artifacts of resolved
+    runs are read through the on-disk artifact cache when it's configured.
+    """
+    queue = get_queue(context)
+    cache = get_artifact_cache(context)
+    run_id = None
+    if cache is not None:
+        run_id = await _latest_resolved_run_id(queue, task_id)
+
+    if run_id is None:
+        url = (await queue.getLatestArtifact(task_id, name))["url"]
+        async with context.session.get(url) as r:
+            r.raise_for_status()
+            yield r.content
+        return
+
+    cached = cache.open(task_id, run_id, name)
+    if cached is not None:
+        with cached:
+            yield _FileReader(cached)
+        return
+
+    url = (await queue.getArtifact(task_id, run_id, name))["url"]
+    tmpfile = cache.tempfile()
+    try:
+        async with context.session.get(url) as r:
+            r.raise_for_status()
+            reader = _TeeReader(r.content, tmpfile)
+            yield reader
+            # Read whatever the caller left so the entry can be cached.
+            while await reader.read(CHUNK_SIZE):
+                pass
+        tmpfile.close()
+        cache.store(task_id, run_id, name, tmpfile.name)
+    finally:
+        tmpfile.close()
+        if os.path.exists(tmpfile.name):
+            os.unlink(tmpfile.name)
+
+
+async def read_json_artifact(context, task_id, name):
+    async with open_artifact(context, task_id, name) as reader:
+        return json.loads((await reader.read()).decode())
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Client errors other than these mean the viewer doesn't know about the bulk
+# lookup, or doesn't like it, and won't until it's upgraded.
+TRANSIENT_CLIENT_ERRORS = frozenset((408, 429))
+# How long a viewer is known not to support bulk lookups.
+BULK_UNSUPPORTED_TTL = 60 * 60
+
+# viewer url -> time it was found not to support bulk lookups
+_bulk_unsupported = {}
+
+
+def _bulk_supported(viewer_url):
+    since = _bulk_unsupported.get(viewer_url)
+    if since is None:
+        return True
+    if time.monotonic() - since > BULK_UNSUPPORTED_TTL:
+        del _bulk_unsupported[viewer_url]
+        return True
+    return False
+
+
+class FuzzBaselines:
+    """Previous fuzz results of a world version, for each of its configs.
+
+    `configs` are the extra args of every config the comment is about, None
+    for the default one. The first lookup fetches the baselines of all of them
+    with a single POST to the `previous` endpoint, falling back to one GET per
+    config, in parallel, when the viewer answers it with a client error or a
+    501. Viewers that don't support it aren't asked again for an hour. Every
+    lookup is then served from memory.
+    """
+
+    def __init__(self, session, viewer_url, world_name, version, checksum, configs):
+        self.session = session
+        self.viewer_url = viewer_url
+        self.url = f"{viewer_url}/api/fuzz-results/{world_name}/previous"
+        self.version = version
+        self.checksum = checksum
+        self.configs = list(dict.fromkeys(configs))
+        self._results = None
+        self._lock = asyncio.Lock()
+
+    async def get(self, extra_args):
+        async with self._lock:
+            if self._results is None:
+                self._results = await self._fetch_all()
+        return self._results.get(extra_args, [])
+
+    async def _fetch_all(self):
+        if _bulk_supported(self.viewer_url):
+            results = await self._fetch_bulk()
+            if results is not None:
+                return results
+
+        logger.debug("Bulk baselines lookup unavailable, fetching them one by one")
+        results = await asyncio.gather(*(self._fetch_one(c) for c in self.configs))
+        return dict(zip(self.configs, results))
+
+    async def _fetch_bulk(self):
+        body = {
+            "version": self.version,
+            "checksum": self.checksum,
+            "extra_args": self.configs,
+        }
+        async with self.session.post(self.url, json=body) as r:
+            if 400 <= r.status < 500 or r.status == 501:
+                if r.status not in TRANSIENT_CLIENT_ERRORS:
+                    _bulk_unsupported[self.viewer_url] = time.monotonic()
+                return None
+            r.raise_for_status()
+            response = json.loads((await r.read()).decode())
+        return {
+            entry.get("extra_args"): entry.get("previous_results", [])
+            for entry in response["results"]
+        }
+
+    async def _fetch_one(self, extra_args):
+        params = {"version": self.version, "checksum": self.checksum}
+        if extra_args:
+            params["extra_args"] = extra_args
+
+        async with self.session.get(self.url, params=params) as r:
+            r.raise_for_status()
+            response = json.loads((await r.read()).decode())
+            return response.get("previous_results", [])
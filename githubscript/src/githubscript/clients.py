@@ -0,0 +1,85 @@
+import asyncio
+import functools
+import os
+
+
+def _taskcluster_options(context, with_credentials=False):
+    options = {"rootUrl": context.config["taskcluster_root_url"]}
+    if with_credentials:
+        options["credentials"] = {
+            "accessToken": os.environ.get("TASKCLUSTER_ACCESS_TOKEN"),
+            "clientId": os.environ.get("TASKCLUSTER_CLIENT_ID"),
+        }
+    return options
+
+
+class CachedQueue:
+    """Memoize read-only queue lookups for the lifetime of a run.
+
+    Results are keyed on (method, args). Concurrent callers asking for the
+    same key await the same in-flight request, failed lookups are dropped so
+    they can be retried. Returned dicts are shared between callers and must
+    not be mutated.
+    """
+
+    CACHED_METHODS = frozenset(
+        (
+            "task",
+            "status",
+            "listArtifacts",
+            "listLatestArtifacts",
+            "getArtifact",
+            "getLatestArtifact",
+        )
+    )
+
+    def __init__(self, queue):
+        self._queue = queue
+        self._results = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self._queue, name)
+        if name not in self.CACHED_METHODS:
+            return attr
+        return functools.partial(self._cached_call, name)
+
+    async def _cached_call(self, method, *args):
+        key = (method, args)
+        future = self._results.get(key)
+        if future is None:
+            future = asyncio.ensure_future(getattr(self._queue, method)(*args))
+            future.add_done_callback(functools.partial(self._forget_failure, key))
+            self._results[key] = future
+        # Shield so that one caller being cancelled doesn't cancel the request
+        # for everybody else waiting on it.
+        return await asyncio.shield(future)
+
+    def _forget_failure(self, key, future):
+        if future.cancelled() or future.exception() is not None:
+            self._results.pop(key, None)
+
+
+def get_queue(context):
+    """Return the async Taskcluster queue shared by every action of this run.
+
+    The client is bound to `context.session` so Taskcluster calls don't block
+    the event loop and reuse the same connection pool as the other HTTP calls.
+    Lookups are memoized for the whole run, see `CachedQueue`.
+    """
+    if context.queue is None:
+        # taskcluster is slow to import, only pay for it when it's used.
+        from taskcluster.aio import Queue
+
+        context.queue = CachedQueue(
+            Queue(_taskcluster_options(context), session=context.session)
+        )
+    return context.queue
+
+
+def get_taskcluster_github(context):
+    """Return an async client for the Taskcluster GitHub service."""
+    from taskcluster.aio import Github
+
+    return Github(
+        _taskcluster_options(context, with_credentials=True), session=context.session
+    )
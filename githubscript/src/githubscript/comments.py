@@ -0,0 +1,91 @@
+"""Keep one bot comment per kind on a PR, edited in place on every run."""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (app id, url) -> (etag, the app's comments on the page, next page url), least
+# recently used first
+_listings = {}
+_MAX_LISTINGS = 256
+
+
+def comment_marker(kind):
+    """Hidden marker identifying the bot's comment of a given `kind`."""
+    return f"<!-- githubscript:{kind} -->"
+
+
+async def _get_page(github, url, app_id):
+    headers = {}
+    key = (app_id, url)
+    cached = _listings.pop(key, None)
+    if cached is not None:
+        headers["If-None-Match"] = cached[0]
+
+    async with await github.get(url, headers=headers) as response:
+        if response.status == 304:
+            # Conditional requests answered with a 304 don't count against the
+            # rate limit.
+            logger.debug("Comments listing %s didn't change", url)
+            _listings[key] = cached
+            return cached[1], cached[2]
+
+        response.raise_for_status()
+        comments = [
+            {"id": comment["id"], "body": comment["body"]}
+            for comment in await response.json()
+            if _is_posted_by(comment, app_id)
+        ]
+        next_link = response.links.get("next")
+        next_url = str(next_link["url"]) if next_link else None
+        etag = response.headers.get("ETag")
+
+    if etag:
+        _listings[key] = (etag, comments, next_url)
+        while len(_listings) > _MAX_LISTINGS:
+            del _listings[next(iter(_listings))]
+    return comments, next_url
+
+
+def _is_posted_by(comment, app_id):
+    # Users and other apps can post the marker too, only ever edit our own.
+    app = comment.get("performed_via_github_app")
+    return app is not None and str(app["id"]) == str(app_id)
+
+
+async def _find_comment(github, owner, repo, pr_number, marker, app_id):
+    url = f"/repos/{owner}/{repo}/issues/{pr_number}/comments?per_page=100"
+    while url:
+        comments, url = await _get_page(github, url, app_id)
+        for comment in comments:
+            if marker in comment["body"]:
+                return comment
+    return None
+
+
+async def upsert_comment(github, owner, repo, pr_number, kind, comment, app_id):
+    """Edit the previous `kind` comment of the GitHub App `app_id` on the PR,
+    or create it.
+
+    Nothing is written when the previous comment already has the same body.
+    """
+    marker = comment_marker(kind)
+    body = f"{comment}\n\n{marker}"
+
+    previous = await _find_comment(github, owner, repo, pr_number, marker, app_id)
+    if previous is None:
+        logger.info("Creating %s comment on %s/%s#%s", kind, owner, repo, pr_number)
+        resp = await github.post(
+            f"/repos/{owner}/{repo}/issues/{pr_number}/comments", data={"body": body}
+        )
+        resp.raise_for_status()
+        return
+
+    if previous["body"] == body:
+        logger.info("%s comment %s is up to date", kind, previous["id"])
+        return
+
+    logger.info("Updating %s comment %s", kind, previous["id"])
+    resp = await github.patch(
+        f"/repos/{owner}/{repo}/issues/comments/{previous['id']}", data={"body": body}
+    )
+    resp.raise_for_status()
@@ -0,0 +1,142 @@
+"""Serve tasks from a long-lived, already warm process.
+
+`run.sh --serve` starts this daemon on a unix socket. When it's up, `run.sh`
+hands it the task's config path instead of starting a new interpreter, so a
+task doesn't pay for uv's environment resolution and the imports anymore.
+
+The response streams the task's logs and ends with an `EXIT_CODE_PREFIX`
+line carrying the exit code the cold path would have returned.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import sys
+
+from aiohttp import web
+from scriptworker.client import get_task, validate_task_schema
+from scriptworker.context import Context
+from scriptworker.exceptions import ScriptWorkerException
+from scriptworker.utils import load_json_or_yaml
+
+from . import async_main
+from .__main__ import get_default_config
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+EXIT_CODE_PREFIX = "::exit-code::"
+
+# Log lines queue of the task being served in the current asyncio context.
+_task_lines = contextvars.ContextVar("task_lines", default=None)
+
+
+class _TaskLogHandler(logging.Handler):
+    """Forward the records emitted while serving one task to its response."""
+
+    def __init__(self, lines, level):
+        super().__init__(level)
+        self._lines = lines
+        self.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    def filter(self, record):
+        return _task_lines.get() is self._lines
+
+    def emit(self, record):
+        try:
+            self._lines.put_nowait(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+
+
+def _outside_tasks(record):
+    return _task_lines.get() is None
+
+
+async def _run_task(config_path):
+    context = Context()
+    # Same as scriptworker.client, scripts must not overwrite json on disk.
+    context.write_json = lambda *args: None
+    context.config = get_default_config()
+    context.config.update(load_json_or_yaml(config_path, is_path=True))
+    context.task = get_task(context.config)
+    validate_task_schema(context)
+
+    # async_main picks the pooled session up, its connections are kept for
+    # the next tasks.
+    await async_main(context)
+
+
+async def _serve_task(lines, config_path):
+    _task_lines.set(lines)
+    handler = _TaskLogHandler(lines, logging.INFO)
+    logging.getLogger().addHandler(handler)
+    try:
+        config = load_json_or_yaml(config_path, is_path=True)
+        if config.get("verbose"):
+            handler.setLevel(logging.DEBUG)
+        await _run_task(config_path)
+        return 0
+    except ScriptWorkerException as exc:
+        logger.exception("Failed to run async_main")
+        return exc.exit_code
+    except Exception:
+        logger.exception("Unhandled exception while running the task")
+        return 1
+    finally:
+        logging.getLogger().removeHandler(handler)
+        lines.put_nowait(None)
+
+
+async def _handle_run(request):
+    config_path = (await request.json())["config"]
+
+    response = web.StreamResponse(headers={"Content-Type": "text/plain"})
+    await response.prepare(request)
+
+    lines = asyncio.Queue()
+    task = asyncio.create_task(_serve_task(lines, config_path))
+    try:
+        while (line := await lines.get()) is not None:
+            await response.write(line.encode())
+        exit_code = await task
+    finally:
+        # The client went away (e.g. scriptworker's max run time), don't leave
+        # the task running behind its back.
+        task.cancel()
+
+    await response.write(f"{EXIT_CODE_PREFIX}{exit_code}\n".encode())
+    await response.write_eof()
+    return response
+
+
+async def _handle_health(request):
+    return web.Response(text="ok")
+
+
+def make_app():
+    app = web.Application()
+    app.router.add_post("/run", _handle_run)
+    app.router.add_get("/health", _handle_health)
+    return app
+
+
+def main(socket_path):
+    logging.basicConfig(format=LOG_FORMAT, level=logging.DEBUG)
+    for handler in logging.getLogger().handlers:
+        handler.setLevel(logging.INFO)
+        handler.addFilter(_outside_tasks)
+    logging.getLogger("taskcluster").setLevel(logging.WARNING)
+    logging.getLogger("mohawk").setLevel(logging.INFO)
+
+    app = make_app()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    logger.info("Serving tasks on %s", socket_path)
+    web.run_app(app, path=socket_path, handler_cancellation=True, print=None)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
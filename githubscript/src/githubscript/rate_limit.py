@@ -0,0 +1,257 @@
+"""Schedule GitHub requests around the API's rate limits."""
+import asyncio
+import email.utils
+import heapq
+import itertools
+import logging
+import random
+import time
+import weakref
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_WRITE_RESERVE = 10
+DEFAULT_MAX_RETRIES = 5
+# Under this many remaining requests, spread them until the window resets.
+PACING_THRESHOLD = 100
+BACKOFF_BASE = 1
+BACKOFF_CAP = 60
+
+WRITE_PRIORITY = 0
+READ_PRIORITY = 1
+
+# event loop -> {installation: _Budget}
+_budgets = weakref.WeakKeyDictionary()
+
+
+class _PrioritySlots:
+    """Semaphore handing free slots to the highest priority waiter first."""
+
+    def __init__(self, size):
+        self._free = size
+        self._waiters = []
+        self._counter = itertools.count()
+
+    async def acquire(self, priority):
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # We were handed a slot while being cancelled, pass it on.
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._free += 1
+
+
+class _Budget:
+    """What's left of the rate limit of a GitHub installation, and the slots
+    of the requests sent against it."""
+
+    def __init__(self, max_concurrency):
+        self.slots = _PrioritySlots(max_concurrency)
+        self.remaining = None
+        self.reset_at = None
+        self.blocked_until = 0
+        self.last_sent = 0
+
+    def update(self, response):
+        headers = response.headers
+        if "X-RateLimit-Remaining" in headers:
+            self.remaining = int(headers["X-RateLimit-Remaining"])
+            metrics.set_gauge("github_rate_limit_remaining", self.remaining)
+        if "X-RateLimit-Reset" in headers:
+            self.reset_at = int(headers["X-RateLimit-Reset"])
+
+    def delay(self, priority, write_reserve):
+        now = time.time()
+        delay = max(self.blocked_until - now, 0)
+        if self.remaining is None or self.reset_at is None or self.reset_at <= now:
+            return delay
+
+        available = self.remaining
+        if priority == READ_PRIORITY:
+            available -= write_reserve
+        if available <= 0:
+            return max(delay, self.reset_at - now)
+        if available < PACING_THRESHOLD:
+            interval = (self.reset_at - now) / available
+            return max(delay, self.last_sent + interval - now)
+        return delay
+
+
+def _get_budget(installation, max_concurrency):
+    """Return the budget of `installation` shared by the clients of the
+    running event loop, creating it on first use."""
+    budgets = _budgets.setdefault(asyncio.get_running_loop(), {})
+    budget = budgets.get(installation)
+    if budget is None:
+        budget = budgets[installation] = _Budget(max_concurrency)
+    return budget
+
+
+def _parse_retry_after(value):
+    """Return the seconds to wait `Retry-After` asks for, in seconds or as an
+    HTTP date, None when it can't be parsed."""
+    try:
+        return max(int(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        logger.warning("Ignoring invalid Retry-After: %s", value)
+        return None
+    return max(retry_at.timestamp() - time.time(), 0)
+
+
+class RateLimitedGithub:
+    """Wrap a GitHub client so requests respect the API's rate limits.
+
+    The remaining budget is tracked from the `X-RateLimit-*` headers of every
+    response. Requests are paced when it runs low, reads stop `write_reserve`
+    requests short of exhausting it so merges and comments still go through,
+    and writes always get the next free slot before reads.
+
+    Responses signalling a rate limit, a 429 or a 403 from a primary or
+    secondary limit, are retried after `Retry-After`, the window reset or an
+    exponential backoff with full jitter. Every request waits while one of
+    them is backing off.
+
+    Clients given the same `budget` share it, along with its slots, see
+    `from_config`.
+    """
+
+    def __init__(
+        self,
+        github,
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+        write_reserve=DEFAULT_WRITE_RESERVE,
+        max_retries=DEFAULT_MAX_RETRIES,
+        budget=None,
+    ):
+        self._github = github
+        self._budget = budget or _Budget(max_concurrency)
+        self.write_reserve = write_reserve
+        self.max_retries = max_retries
+
+    @classmethod
+    def from_config(cls, github, config, installation):
+        """Wrap `github`, sharing the budget of `installation` with the other
+        clients of the running event loop: the tasks served concurrently by
+        the daemon all count against the same rate limit."""
+        max_concurrency = config.get("github_max_concurrency", DEFAULT_MAX_CONCURRENCY)
+        return cls(
+            github,
+            write_reserve=config.get("github_write_reserve", DEFAULT_WRITE_RESERVE),
+            max_retries=config.get("github_max_retries", DEFAULT_MAX_RETRIES),
+            budget=_get_budget(installation, max_concurrency),
+        )
+
+    @property
+    def remaining(self):
+        return self._budget.remaining
+
+    @property
+    def auth(self):
+        return self._github.auth
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *excinfo):
+        await self.close()
+
+    async def close(self):
+        await self._github.close()
+
+    async def get_token(self):
+        return await self._github.get_token()
+
+    async def _rate_limit_delay(self, response, attempt):
+        """Return how long to wait before retrying `response`, None when it
+        isn't rate limited."""
+        if response.status not in (403, 429):
+            return None
+
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None:
+            delay = _parse_retry_after(retry_after)
+            if delay is not None:
+                return delay
+
+        budget = self._budget
+        if budget.remaining == 0 and budget.reset_at is not None:
+            return max(budget.reset_at - time.time(), 0) + 1
+
+        if response.status == 403:
+            message = await response.text()
+            if "rate limit" not in message.lower():
+                # Actually forbidden.
+                return None
+
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+
+    async def request(self, method, query, **kwargs):
+        priority = READ_PRIORITY if method == "GET" else WRITE_PRIORITY
+        budget = self._budget
+
+        for attempt in range(self.max_retries + 1):
+            await budget.slots.acquire(priority)
+            # Don't hold the slot while waiting, writes can go first meanwhile.
+            while (delay := budget.delay(priority, self.write_reserve)) > 0:
+                budget.slots.release()
+                logger.info("Waiting %.1fs for the GitHub rate limit", delay)
+                await asyncio.sleep(delay)
+                await budget.slots.acquire(priority)
+
+            budget.last_sent = time.time()
+            if budget.remaining is not None:
+                # Account for requests in flight until their headers come back.
+                budget.remaining -= 1
+            try:
+                response = await self._github.request(method, query, **kwargs)
+                budget.update(response)
+                delay = await self._rate_limit_delay(response, attempt)
+            finally:
+                budget.slots.release()
+
+            if delay is None or attempt == self.max_retries:
+                return response
+
+            logger.warning(
+                "%s %s was rate limited, retrying in %.1fs", method, query, delay
+            )
+            response.release()
+            budget.blocked_until = max(budget.blocked_until, time.time() + delay)
+
+    async def get(self, query, **kwargs):
+        return await self.request("GET", query, **kwargs)
+
+    async def post(self, query, data=None, **kwargs):
+        return await self.request("POST", query, json=data, **kwargs)
+
+    async def put(self, query, data=None, **kwargs):
+        return await self.request("PUT", query, json=data, **kwargs)
+
+    async def patch(self, query, data=None, **kwargs):
+        return await self.request("PATCH", query, json=data, **kwargs)
+
+    async def delete(self, query, data=None, **kwargs):
+        response = await self.request("DELETE", query, json=data, **kwargs)
+        response.release()
@@ -0,0 +1,239 @@
+"""Trace a task's actions and the HTTP requests they make.
+
+`trace` opens the root span of a task and writes every span recorded under
+it as OTLP JSON (an `ExportTraceServiceRequest`) when it's done, so traces can
+be looked at offline or fed to any OTLP collector later. `span` opens child
+spans, and the `trace_config` of the shared session adds a leaf span for
+every request with its status, sizes and latency.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import secrets
+import time
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+TRACE_ARTIFACT = os.path.join("public", "logs", "trace.json")
+SERVICE_NAME = "githubscript"
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# Span the work of the current asyncio context belongs to.
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, trace, parent, name, kind, attributes):
+        self.trace = trace
+        self.trace_id = trace.trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes)
+        self.start = time.time_ns()
+        self.end = None
+        self.error = None
+
+    def child(self, name, kind=SPAN_KIND_INTERNAL, **attributes):
+        return self.trace.start_span(self, name, kind, attributes)
+
+    def finish(self, error=None):
+        self.end = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end or time.time_ns()),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+                if value is not None
+            ],
+            "status": (
+                {"code": STATUS_ERROR, "message": self.error}
+                if self.error
+                else {"code": STATUS_OK}
+            ),
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # int64 are strings in OTLP JSON.
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+class Trace:
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+
+    def start_span(self, parent, name, kind, attributes):
+        span = Span(self, parent, name, kind, attributes)
+        self.spans.append(span)
+        return span
+
+    def to_otlp(self):
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {"key": "service.name", "value": _otlp_value(SERVICE_NAME)}
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [span.to_otlp() for span in self.spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+
+@contextlib.contextmanager
+def _activate(span):
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as exc:
+        span.finish(exc)
+        raise
+    else:
+        span.finish()
+    finally:
+        _current_span.reset(token)
+
+
+def _write(path, trace):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as fd:
+        json.dump(trace.to_otlp(), fd)
+
+
+@contextlib.contextmanager
+def trace(name, path, **attributes):
+    """Record the block as the root span of a new trace, written to `path`
+    as OTLP JSON when it's done, whether it succeeds or not."""
+    root = Trace().start_span(None, name, SPAN_KIND_INTERNAL, attributes)
+    try:
+        with _activate(root):
+            yield root
+    finally:
+        if path:
+            try:
+                _write(path, root.trace)
+            except Exception:
+                # Neither fail the task nor hide why it failed.
+                logger.warning("Couldn't write the trace to %s", path, exc_info=True)
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Record the block as a child of the current span, if any."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    with _activate(parent.child(name, **attributes)):
+        yield
+
+
+def trace_path(config):
+    """Where the trace of a task goes, `trace_file` or an artifact."""
+    if config.get("trace_file"):
+        return config["trace_file"]
+    if config.get("artifact_dir"):
+        return os.path.join(config["artifact_dir"], TRACE_ARTIFACT)
+    return None
+
+
+async def _on_request_start(session, ctx, params):
+    parent = _current_span.get()
+    if parent is None:
+        ctx.span = None
+        return
+    url = params.url
+    ctx.span = parent.child(
+        f"{params.method} {url.host}",
+        kind=SPAN_KIND_CLIENT,
+        **{
+            "http.request.method": params.method,
+            # Query strings can carry credentials, like Taskcluster's bewits.
+            "url.full": str(url.with_query(None).with_fragment(None)),
+            "server.address": url.host,
+            "http.request.body.size": 0,
+            "http.response.body.size": 0,
+        },
+    )
+
+
+async def _on_request_chunk_sent(session, ctx, params):
+    if ctx.span is not None:
+        ctx.span.attributes["http.request.body.size"] += len(params.chunk)
+
+
+async def _on_request_end(session, ctx, params):
+    if ctx.span is None:
+        return
+    status = params.response.status
+    ctx.span.attributes["http.response.status_code"] = status
+    # Chunked responses are sized as the caller reads them.
+    ctx.sized = params.response.content_length is not None
+    if ctx.sized:
+        ctx.span.attributes["http.response.body.size"] = params.response.content_length
+    # Latency up to the response headers, the body is read by the caller.
+    ctx.span.finish()
+    if status >= 400:
+        ctx.span.error = f"HTTP {status}"
+
+
+async def _on_response_chunk_received(session, ctx, params):
+    if ctx.span is not None and not ctx.sized:
+        ctx.span.attributes["http.response.body.size"] += len(params.chunk)
+
+
+async def _on_request_exception(session, ctx, params):
+    if ctx.span is not None:
+        ctx.span.finish(params.exception)
+
+
+def trace_config():
+    """TraceConfig recording a span for every request made in a trace."""
+    import aiohttp
+
+    config = aiohttp.TraceConfig(trace_config_ctx_factory=SimpleNamespace)
+    config.on_request_start.append(_on_request_start)
+    config.on_request_chunk_sent.append(_on_request_chunk_sent)
+    config.on_request_end.append(_on_request_end)
+    config.on_response_chunk_received.append(_on_response_chunk_received)
+    config.on_request_exception.append(_on_request_exception)
+    return config
@@ -0,0 +1,61 @@
+"""The pooled HTTP transport every outgoing request goes through.
+
+GitHub, Taskcluster, artifact and apdiff calls all share one aiohttp session
+per event loop, so they reuse each other's keep-alive connections instead of
+paying for a TLS handshake on each one. When tasks are served by the resident
+daemon the session, and its connections, also outlive the task.
+"""
+import asyncio
+import ssl
+import weakref
+
+import aiohttp
+
+from . import metrics, tracing
+
+DEFAULT_LIMIT_PER_HOST = 16
+DEFAULT_KEEPALIVE_TIMEOUT = 60
+DEFAULT_DNS_CACHE_TTL = 300
+
+# event loop -> aiohttp.ClientSession
+_sessions = weakref.WeakKeyDictionary()
+_ssl_context = None
+
+
+def _get_ssl_context():
+    # Building a context loads the CA bundle, only do it once.
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+
+def get_session(config):
+    """Return the shared session of the running event loop, creating it on
+    first use.
+
+    `http_limit_per_host` caps the connections opened to a single host and
+    `http_keepalive_timeout` is how long idle connections are kept around.
+    """
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit_per_host=config.get("http_limit_per_host", DEFAULT_LIMIT_PER_HOST),
+            keepalive_timeout=config.get(
+                "http_keepalive_timeout", DEFAULT_KEEPALIVE_TIMEOUT
+            ),
+            ttl_dns_cache=DEFAULT_DNS_CACHE_TTL,
+            ssl=_get_ssl_context(),
+        )
+        session = _sessions[loop] = aiohttp.ClientSession(
+            connector=connector, trace_configs=[tracing.trace_config(), metrics.trace_config()]
+        )
+    return session
+
+
+async def close_session():
+    """Close the session of the running event loop, if any."""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
@@ -1,17 +1,51 @@
 import json
 import pytest
 
+from githubscript import baselines
 from scriptworker.client import Context
 from unittest.mock import Mock, AsyncMock
 
 
+class MockStream:
+    """Stand-in for aiohttp's StreamReader, `chunk_size` bounds every read."""
+
+    def __init__(self, data, chunk_size=None):
+        self._data = data
+        self._chunk_size = chunk_size
+
+    async def read(self, n=-1):
+        if n < 0:
+            n = len(self._data)
+        if self._chunk_size:
+            n = min(n, self._chunk_size)
+        chunk, self._data = self._data[:n], self._data[n:]
+        return chunk
+
+
 def _mock_response(data):
     mock = AsyncMock()
     mock.__aenter__.return_value.raise_for_status = Mock()
     mock.__aenter__.return_value.read.return_value = json.dumps(data).encode()
+    mock.__aenter__.return_value.content = MockStream(json.dumps(data).encode())
+    return mock
+
+
+def _mock_status_response(status):
+    mock = AsyncMock()
+    mock.__aenter__.return_value.status = status
     return mock
 
 
+@pytest.fixture(autouse=True)
+def clear_bulk_unsupported():
+    baselines._bulk_unsupported.clear()
+
+
+@pytest.fixture
+def mock_stream():
+    return MockStream
+
+
 @pytest.fixture
 def mock_response():
     return _mock_response
@@ -20,6 +54,7 @@ def mock_response():
 @pytest.fixture
 def mock_queue():
     mock = Mock()
+    mock.return_value = AsyncMock()
     mock.return_value.getLatestArtifact.side_effect = lambda task_id, artifact: {
         "url": f"https://nowhere/{task_id}/{artifact}"
     }
@@ -40,7 +75,7 @@ def mock_queue():
 
 @pytest.fixture
 def mock_is_task_coming_from_pr():
-    mock = Mock()
+    mock = AsyncMock()
     mock.return_value = True
     return mock
 
@@ -135,6 +170,8 @@ def fuzz_comment_context():
         },
     }
     context.session = Mock()
+    # The viewer doesn't support bulk baseline lookups unless a test says so.
+    context.session.post = Mock(return_value=_mock_status_response(404))
     context.github = AsyncMock()
     context.github.post.return_value = Mock()
     return context
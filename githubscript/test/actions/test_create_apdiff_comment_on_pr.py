@@ -29,9 +29,10 @@ def _get_task_context():
 
 
 MOCK_QUEUE = Mock()
+MOCK_QUEUE.return_value = AsyncMock()
 MOCK_QUEUE.return_value.listLatestArtifacts.return_value = {"artifacts": []}
 
-MOCK_UTILS_IS_TASK_COMING_FROM_PR = Mock()
+MOCK_UTILS_IS_TASK_COMING_FROM_PR = AsyncMock()
 MOCK_UTILS_IS_TASK_COMING_FROM_PR.return_value = True
 
 
@@ -45,7 +46,7 @@ MOCK_UTILS_IS_TASK_COMING_FROM_PR.return_value = True
         pytest.param(["-1"], raises(TaskVerificationError)),
     ),
 )
-@patch("githubscript.actions.Queue", MOCK_QUEUE)
+@patch("taskcluster.aio.Queue", MOCK_QUEUE)
 @patch("githubscript.actions.is_task_coming_from_pr", MOCK_UTILS_IS_TASK_COMING_FROM_PR)
 @pytest.mark.asyncio
 async def test_args(params, expectation):
@@ -54,7 +55,7 @@ async def test_args(params, expectation):
         await create_apdiff_comment_on_pr(context, params)
 
 
-@patch("githubscript.actions.Queue", MOCK_QUEUE)
+@patch("taskcluster.aio.Queue", MOCK_QUEUE)
 @patch("githubscript.actions.is_task_coming_from_pr", MOCK_UTILS_IS_TASK_COMING_FROM_PR)
 @pytest.mark.asyncio
 async def test_schema():
@@ -73,7 +74,7 @@ async def test_empty_diff():
         "artifacts": [{"name": "foo.log"}]
     }
 
-    with patch("githubscript.actions.Queue", MOCK_QUEUE):
+    with patch("taskcluster.aio.Queue", MOCK_QUEUE):
         await create_apdiff_comment_on_pr(context, ["97"])
 
     context.github.post.assert_called_with(
@@ -90,7 +91,7 @@ async def test_normal_diff():
         "artifacts": [{"name": "foo.log"}, {"name": "foo.apdiff"}]
     }
 
-    with patch("githubscript.actions.Queue", MOCK_QUEUE):
+    with patch("taskcluster.aio.Queue", MOCK_QUEUE):
         await create_apdiff_comment_on_pr(context, ["97"])
 
     context.github.post.assert_called_with(
@@ -104,10 +105,10 @@ async def test_refuse_for_wrong_pr():
     context = _get_task_context()
     MOCK_QUEUE.reset_mock()
 
-    task_not_coming_from_pr = Mock()
+    task_not_coming_from_pr = AsyncMock()
     task_not_coming_from_pr.return_value = False
 
-    with patch("githubscript.actions.Queue", MOCK_QUEUE), patch(
+    with patch("taskcluster.aio.Queue", MOCK_QUEUE), patch(
         "githubscript.actions.is_task_coming_from_pr", task_not_coming_from_pr
     ), pytest.raises(TaskVerificationError):
         await create_apdiff_comment_on_pr(context, ["97"])
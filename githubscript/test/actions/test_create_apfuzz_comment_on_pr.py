@@ -1,10 +1,12 @@
+import asyncio
+import json
 import pytest
 
 from contextlib import nullcontext as does_not_raise
 from githubscript.actions import create_apfuzz_comment_on_pr
 from pytest import raises
-from scriptworker.exceptions import TaskVerificationError
-from unittest.mock import Mock, patch
+from scriptworker.exceptions import ConfigError, TaskVerificationError
+from unittest.mock import AsyncMock, Mock, patch
 
 
 MOCK_FUZZ_REPORT_WITH_FAILURES = {
@@ -38,6 +40,43 @@ MOCK_PREVIOUS_RESULTS = {
 }
 
 
+def _routed_get(mock_apdiff, reports, previous=None, in_flight=None):
+    """Answer session.get by URL so concurrently built sections can't steal
+    each other's responses. `reports` maps a task id to (stats, delay) and
+    `previous` maps extra args to baseline responses. `in_flight` tracks how
+    many reports are being read at once."""
+    previous = previous or {}
+    in_flight = in_flight if in_flight is not None else {"current": 0, "peak": 0}
+
+    def response(data, delay=0, tracked=False):
+        mock = AsyncMock()
+        mock.__aenter__.return_value.raise_for_status = Mock()
+
+        async def read(n=-1):
+            if tracked:
+                in_flight["current"] += 1
+                in_flight["peak"] = max(in_flight["peak"], in_flight["current"])
+            await asyncio.sleep(delay)
+            if tracked:
+                in_flight["current"] -= 1
+            return json.dumps(data).encode()
+
+        mock.__aenter__.return_value.read.side_effect = read
+        mock.__aenter__.return_value.content.read.side_effect = read
+        return mock
+
+    def get(url, params=None):
+        if url.endswith(".apdiff"):
+            return response(mock_apdiff)
+        if url.endswith("/previous"):
+            extra_args = params.get("extra_args")
+            return response(previous.get(extra_args, {"previous_results": []}))
+        stats, delay = reports[url.split("/")[3]]
+        return response({"stats": stats}, delay, tracked=True)
+
+    return get
+
+
 @pytest.mark.parametrize(
     "params,expectation",
     (
@@ -66,7 +105,7 @@ async def test_args(
         ]
     )
 
-    with patch("githubscript.actions.Queue", mock_queue):
+    with patch("taskcluster.aio.Queue", mock_queue):
         with patch(
             "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
         ):
@@ -80,7 +119,7 @@ async def test_missing_payload_fields(
 ):
     fuzz_comment_context.task["payload"] = {}
 
-    with patch("githubscript.actions.Queue", mock_queue):
+    with patch("taskcluster.aio.Queue", mock_queue):
         with patch(
             "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
         ):
@@ -102,7 +141,7 @@ async def test_missing_checksum(
         ]
     )
 
-    with patch("githubscript.actions.Queue", mock_queue):
+    with patch("taskcluster.aio.Queue", mock_queue):
         with patch(
             "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
         ):
@@ -126,7 +165,7 @@ async def test_comment_with_baselines(
         ]
     )
 
-    with patch("githubscript.actions.Queue", mock_queue):
+    with patch("taskcluster.aio.Queue", mock_queue):
         with patch(
             "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
         ):
@@ -165,7 +204,7 @@ async def test_comment_without_baselines(
         ]
     )
 
-    with patch("githubscript.actions.Queue", mock_queue):
+    with patch("taskcluster.aio.Queue", mock_queue):
         with patch(
             "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
         ):
@@ -202,16 +241,17 @@ async def test_comment_with_multiple_configs(
     }
 
     fuzz_comment_context.session.get = Mock(
-        side_effect=[
-            mock_response(mock_apdiff),
-            mock_response(MOCK_FUZZ_REPORT_WITH_FAILURES),
-            mock_response(MOCK_PREVIOUS_RESULTS),
-            mock_response(mock_fuzz_report_extra),
-            mock_response({"previous_results": []}),
-        ]
+        side_effect=_routed_get(
+            mock_apdiff,
+            {
+                "fuzz-task-default": (MOCK_FUZZ_REPORT_WITH_FAILURES["stats"], 0),
+                "fuzz-task-extra": (mock_fuzz_report_extra["stats"], 0),
+            },
+            previous={None: MOCK_PREVIOUS_RESULTS},
+        )
     )
 
-    with patch("githubscript.actions.Queue", mock_queue):
+    with patch("taskcluster.aio.Queue", mock_queue):
         with patch(
             "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
         ):
@@ -258,7 +298,7 @@ async def test_check_task_has_spoiler_with_description(
         ]
     )
 
-    with patch("githubscript.actions.Queue", mock_queue):
+    with patch("taskcluster.aio.Queue", mock_queue):
         with patch(
             "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
         ):
@@ -270,3 +310,156 @@ async def test_check_task_has_spoiler_with_description(
     assert "❌" in body
     assert "<details>" in body
     assert "Fuzz task fuzz-task-check" in body
+
+
+@pytest.mark.parametrize("concurrency", (0, -1))
+@pytest.mark.asyncio
+async def test_invalid_concurrency(
+    fuzz_comment_context, mock_is_task_coming_from_pr, concurrency
+):
+    fuzz_comment_context.config["fuzz_comment_concurrency"] = concurrency
+
+    with patch(
+        "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
+    ):
+        with pytest.raises(ConfigError):
+            await create_apfuzz_comment_on_pr(fuzz_comment_context, ["97"])
+
+    fuzz_comment_context.github.post.assert_not_called()
+
+
+@pytest.mark.parametrize("concurrency", (1, 2, 8))
+@pytest.mark.asyncio
+async def test_sections_keep_sorted_order_when_built_concurrently(
+    fuzz_comment_context,
+    mock_queue,
+    mock_is_task_coming_from_pr,
+    mock_apdiff,
+    concurrency,
+):
+    fuzz_comment_context.config["fuzz_comment_concurrency"] = concurrency
+    fuzz_comment_context.task["payload"]["fuzz-tasks"] = [
+        {"task-id": "fuzz-task-check", "extra-args": "check-something"},
+        {"task-id": "fuzz-task-slow"},
+        {"task-id": "fuzz-task-fast", "extra-args": "no-restrictive-starts"},
+    ]
+
+    def stats(success):
+        return {"total": 100, "success": success, "failure": 0, "timeout": 0, "ignored": 0}
+
+    in_flight = {"current": 0, "peak": 0}
+    fuzz_comment_context.session.get = Mock(
+        side_effect=_routed_get(
+            mock_apdiff,
+            {
+                "fuzz-task-check": (stats(1), 0),
+                "fuzz-task-slow": (stats(2), 0.05),
+                "fuzz-task-fast": (stats(3), 0),
+            },
+            in_flight=in_flight,
+        )
+    )
+
+    with patch("taskcluster.aio.Queue", mock_queue):
+        with patch(
+            "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
+        ):
+            await create_apfuzz_comment_on_pr(fuzz_comment_context, ["97"])
+
+    body = fuzz_comment_context.github.post.call_args[1]["data"]["body"]
+    assert body.index("### default") < body.index("### no-restrictive-starts")
+    assert body.index("### no-restrictive-starts") < body.index("check-something")
+    assert body.index("Success: 2") < body.index("Success: 3") < body.index("Success: 1")
+    assert in_flight["peak"] <= concurrency
+
+
+@pytest.mark.asyncio
+async def test_baselines_are_fetched_in_bulk(
+    fuzz_comment_context,
+    mock_queue,
+    mock_is_task_coming_from_pr,
+    mock_response,
+    mock_apdiff,
+):
+    fuzz_comment_context.task["payload"]["fuzz-tasks"] = [
+        {"task-id": "fuzz-task-default"},
+        {"task-id": "fuzz-task-extra", "extra-args": "no-restrictive-starts"},
+    ]
+    stats = MOCK_FUZZ_REPORT_WITH_FAILURES["stats"]
+    fuzz_comment_context.session.get = Mock(
+        side_effect=_routed_get(
+            mock_apdiff,
+            {"fuzz-task-default": (stats, 0), "fuzz-task-extra": (stats, 0)},
+        )
+    )
+    fuzz_comment_context.session.post = Mock(
+        return_value=mock_response(
+            {
+                "results": [
+                    {"extra_args": None, **MOCK_PREVIOUS_RESULTS},
+                    {"extra_args": "no-restrictive-starts", "previous_results": []},
+                ]
+            }
+        )
+    )
+    fuzz_comment_context.session.post.return_value.__aenter__.return_value.status = 200
+
+    with patch("taskcluster.aio.Queue", mock_queue):
+        with patch(
+            "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
+        ):
+            await create_apfuzz_comment_on_pr(fuzz_comment_context, ["97"])
+
+    fuzz_comment_context.session.post.assert_called_once_with(
+        "https://apdiff.bananium.fr/api/fuzz-results/test_apworld/previous",
+        json={
+            "version": "1.0.0",
+            "checksum": "abc123checksum",
+            "extra_args": [None, "no-restrictive-starts"],
+        },
+    )
+    previous_gets = [
+        call
+        for call in fuzz_comment_context.session.get.call_args_list
+        if call.args[0].endswith("/previous")
+    ]
+    assert previous_gets == []
+
+    body = fuzz_comment_context.github.post.call_args[1]["data"]["body"]
+    default, extra = body.split("### no-restrictive-starts")
+    assert "Comparison with baselines" in default
+    assert "No previous results found" in extra
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status,cached", [(400, True), (501, True), (429, False)])
+async def test_bulk_baselines_fallback_is_remembered(
+    fuzz_comment_context,
+    mock_queue,
+    mock_is_task_coming_from_pr,
+    mock_apdiff,
+    status,
+    cached,
+):
+    stats = MOCK_FUZZ_REPORT_WITH_FAILURES["stats"]
+    fuzz_comment_context.session.get = Mock(
+        side_effect=_routed_get(mock_apdiff, {"fuzz-task-id": (stats, 0)})
+    )
+    fuzz_comment_context.session.post.return_value.__aenter__.return_value.status = (
+        status
+    )
+
+    with patch("taskcluster.aio.Queue", mock_queue):
+        with patch(
+            "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
+        ):
+            await create_apfuzz_comment_on_pr(fuzz_comment_context, ["97"])
+            await create_apfuzz_comment_on_pr(fuzz_comment_context, ["97"])
+
+    assert fuzz_comment_context.session.post.call_count == (1 if cached else 2)
+    previous_gets = [
+        call
+        for call in fuzz_comment_context.session.get.call_args_list
+        if call.args[0].endswith("/previous")
+    ]
+    assert len(previous_gets) == 2
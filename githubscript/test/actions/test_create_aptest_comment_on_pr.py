@@ -30,9 +30,10 @@ def _get_task_context():
 
 
 MOCK_QUEUE = Mock()
+MOCK_QUEUE.return_value = AsyncMock()
 MOCK_QUEUE.return_value.listLatestArtifacts.return_value = {"artifacts": []}
 
-MOCK_UTILS_IS_TASK_COMING_FROM_PR = Mock()
+MOCK_UTILS_IS_TASK_COMING_FROM_PR = AsyncMock()
 MOCK_UTILS_IS_TASK_COMING_FROM_PR.return_value = True
 
 
@@ -46,7 +47,7 @@ MOCK_UTILS_IS_TASK_COMING_FROM_PR.return_value = True
         pytest.param(["-1"], raises(TaskVerificationError)),
     ),
 )
-@patch("githubscript.actions.Queue", MOCK_QUEUE)
+@patch("taskcluster.aio.Queue", MOCK_QUEUE)
 @patch("githubscript.actions.is_task_coming_from_pr", MOCK_UTILS_IS_TASK_COMING_FROM_PR)
 @pytest.mark.asyncio
 async def test_args(params, expectation):
@@ -55,7 +56,7 @@ async def test_args(params, expectation):
         await create_aptest_comment_on_pr(context, params)
 
 
-@patch("githubscript.actions.Queue", MOCK_QUEUE)
+@patch("taskcluster.aio.Queue", MOCK_QUEUE)
 @patch("githubscript.actions.is_task_coming_from_pr", MOCK_UTILS_IS_TASK_COMING_FROM_PR)
 @pytest.mark.asyncio
 async def test_schema():
@@ -74,7 +75,7 @@ async def test_no_aptest():
         "artifacts": [{"name": "foo.log"}]
     }
 
-    with patch("githubscript.actions.Queue", MOCK_QUEUE):
+    with patch("taskcluster.aio.Queue", MOCK_QUEUE):
         await create_aptest_comment_on_pr(context, ["97"])
 
     context.github.post.assert_not_called()
@@ -82,7 +83,7 @@ async def test_no_aptest():
 
 @pytest.mark.asyncio
 @patch("githubscript.actions.is_task_coming_from_pr", MOCK_UTILS_IS_TASK_COMING_FROM_PR)
-async def test_aptest():
+async def test_aptest(mock_stream):
     context = _get_task_context()
     MOCK_QUEUE.reset_mock()
     MOCK_QUEUE.return_value.listLatestArtifacts.return_value = {
@@ -95,7 +96,7 @@ async def test_aptest():
     context.session = Mock()
     context.session.get.return_value = AsyncMock()
     context.session.get.return_value.__aenter__.return_value.raise_for_status = Mock()
-    context.session.get.return_value.__aenter__.return_value.read.return_value = (
+    context.session.get.return_value.__aenter__.return_value.content = mock_stream(
         json.dumps(
             {
                 "apworld": "foo",
@@ -104,7 +105,7 @@ async def test_aptest():
         ).encode()
     )
 
-    with patch("githubscript.actions.Queue", MOCK_QUEUE):
+    with patch("taskcluster.aio.Queue", MOCK_QUEUE):
         await create_aptest_comment_on_pr(context, ["97"])
 
     MOCK_QUEUE.return_value.getLatestArtifact.assert_called_with("abc", "foo.aptest")
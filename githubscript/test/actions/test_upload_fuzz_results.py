@@ -1,7 +1,8 @@
+import json
 import pytest
 
 from contextlib import nullcontext as does_not_raise
-from githubscript.actions import upload_fuzz_results
+from githubscript.actions import _extract_checksum_from_apdiff, upload_fuzz_results
 from pytest import raises
 from scriptworker.exceptions import TaskVerificationError
 from unittest.mock import Mock, patch
@@ -38,7 +39,7 @@ async def test_args(
     )
     fuzz_context.session.post = Mock(return_value=mock_response({}))
 
-    with patch("githubscript.actions.Queue", mock_queue):
+    with patch("taskcluster.aio.Queue", mock_queue):
         with patch(
             "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
         ):
@@ -52,7 +53,7 @@ async def test_missing_payload_fields(
 ):
     fuzz_context.task["payload"] = {}
 
-    with patch("githubscript.actions.Queue", mock_queue):
+    with patch("taskcluster.aio.Queue", mock_queue):
         with patch(
             "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
         ):
@@ -76,7 +77,7 @@ async def test_missing_checksum(
         ]
     )
 
-    with patch("githubscript.actions.Queue", mock_queue):
+    with patch("taskcluster.aio.Queue", mock_queue):
         with patch(
             "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
         ):
@@ -98,7 +99,7 @@ async def test_missing_api_key(
         side_effect=[mock_response(mock_fuzz_report), mock_response(mock_apdiff)]
     )
 
-    with patch("githubscript.actions.Queue", mock_queue):
+    with patch("taskcluster.aio.Queue", mock_queue):
         with patch(
             "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
         ):
@@ -121,7 +122,7 @@ async def test_upload_for_pr_custom_viewer_url(
     )
     fuzz_context.session.post = Mock(return_value=mock_response({}))
 
-    with patch("githubscript.actions.Queue", mock_queue):
+    with patch("taskcluster.aio.Queue", mock_queue):
         with patch(
             "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
         ):
@@ -163,7 +164,7 @@ async def test_upload_for_main_branch(
     )
     fuzz_context.session.post = Mock(return_value=mock_response({}))
 
-    with patch("githubscript.actions.Queue", mock_queue):
+    with patch("taskcluster.aio.Queue", mock_queue):
         with patch(
             "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
         ):
@@ -182,7 +183,7 @@ async def test_skip_upload_for_non_main_branch(
     )
     fuzz_context.session.post = Mock(return_value=mock_response({}))
 
-    with patch("githubscript.actions.Queue", mock_queue):
+    with patch("taskcluster.aio.Queue", mock_queue):
         await upload_fuzz_results(fuzz_context, ["branch", "feature-branch"])
 
     fuzz_context.session.post.assert_not_called()
@@ -203,7 +204,7 @@ async def test_upload_with_extra_args(
     )
     fuzz_context.session.post = Mock(return_value=mock_response({}))
 
-    with patch("githubscript.actions.Queue", mock_queue):
+    with patch("taskcluster.aio.Queue", mock_queue):
         with patch(
             "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
         ):
@@ -213,3 +214,160 @@ async def test_upload_with_extra_args(
         fuzz_context.session.post.call_args[1]["json"]["extra_args"]
         == "no-restrictive-starts"
     )
+
+
+def _routed_get(mock_response, reports, mock_apdiff):
+    """Answer session.get by URL, results are resolved concurrently."""
+
+    def get(url):
+        if url.endswith(".apdiff"):
+            return mock_response(mock_apdiff)
+        task_id = url.split("/")[3]
+        return mock_response({"stats": reports[task_id]})
+
+    return get
+
+
+def _batch_entry(task_id, **extra):
+    return {
+        "fuzz-task": task_id,
+        "diff-task": "diff-task-id",
+        "world-name": "test_apworld",
+        "world-version": "1.0.0",
+        **extra,
+    }
+
+
+def _stats(total):
+    return {"total": total, "success": total, "failure": 0, "timeout": 0, "ignored": 0}
+
+
+@pytest.mark.asyncio
+async def test_upload_batch(
+    fuzz_context,
+    mock_queue,
+    mock_is_task_coming_from_pr,
+    mock_response,
+    mock_apdiff,
+):
+    fuzz_context.config["fuzz_upload_batch_size"] = 2
+    fuzz_context.task["payload"] = {
+        "results": [
+            _batch_entry("fuzz-a"),
+            _batch_entry("fuzz-a"),
+            _batch_entry("fuzz-a"),
+            _batch_entry("fuzz-b", **{"extra-args": "check-foo"}),
+        ]
+    }
+    fuzz_context.session.get = Mock(
+        side_effect=_routed_get(
+            mock_response, {"fuzz-a": _stats(10), "fuzz-b": _stats(20)}, mock_apdiff
+        )
+    )
+    fuzz_context.session.post = Mock(return_value=mock_response({}))
+
+    with patch("taskcluster.aio.Queue", mock_queue):
+        with patch(
+            "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
+        ):
+            await upload_fuzz_results(fuzz_context, ["pr", "97"])
+
+    bodies = [call[1]["json"] for call in fuzz_context.session.post.call_args_list]
+    assert [
+        (b["task_id"], b.get("extra_args"), [r["total"] for r in b["results"]])
+        for b in bodies
+    ] == [
+        ("fuzz-a", None, [10, 10]),
+        ("fuzz-a", None, [10]),
+        ("fuzz-b", "check-foo", [20]),
+    ]
+    assert all(b["pr_number"] == 97 for b in bodies)
+
+
+@pytest.mark.asyncio
+async def test_upload_batch_is_all_or_nothing(
+    fuzz_context,
+    mock_queue,
+    mock_is_task_coming_from_pr,
+    mock_response,
+    mock_apdiff,
+):
+    fuzz_context.task["payload"] = {
+        "results": [
+            _batch_entry("fuzz-a"),
+            _batch_entry("fuzz-b", **{"world-version": "9.9.9"}),
+        ]
+    }
+    fuzz_context.session.get = Mock(
+        side_effect=_routed_get(
+            mock_response, {"fuzz-a": _stats(10), "fuzz-b": _stats(20)}, mock_apdiff
+        )
+    )
+    fuzz_context.session.post = Mock(return_value=mock_response({}))
+
+    with patch("taskcluster.aio.Queue", mock_queue):
+        with patch(
+            "githubscript.actions.is_task_coming_from_pr", mock_is_task_coming_from_pr
+        ):
+            with pytest.raises(TaskVerificationError, match="9.9.9"):
+                await upload_fuzz_results(fuzz_context, ["pr", "97"])
+
+    fuzz_context.session.post.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_upload_batch_missing_fields(fuzz_context, mock_queue):
+    fuzz_context.task["payload"] = {"results": [{"fuzz-task": "fuzz-a"}]}
+
+    with pytest.raises(TaskVerificationError, match="diff-task is missing"):
+        await upload_fuzz_results(fuzz_context, ["branch", "main"])
+
+
+@pytest.mark.parametrize(
+    "version,expected",
+    (
+        pytest.param("1.0.0", "checksum-1.0.0"),
+        pytest.param("1.1.0", "checksum-1.1.0"),
+        pytest.param("0.9.0", None),
+        pytest.param("2.0.0", None),
+    ),
+)
+@pytest.mark.asyncio
+async def test_extract_checksum_from_apdiff(mock_stream, version, expected):
+    apdiff = {
+        "world_name": "Test Apworld",
+        "apworld_name": "test_apworld",
+        "diffs": {
+            "0.9.0...1.0.0": {
+                "VersionAdded": {"content": "x", "checksum": "checksum-1.0.0"}
+            },
+            "1.0.0...1.1.0": {
+                "VersionAdded": {"content": ["a", {"b": "c"}], "checksum": "checksum-1.1.0"}
+            },
+            "1.1.0...2.0.0": {"VersionRemoved": {"checksum": "nope"}},
+            "2.0.0": {"VersionAdded": {"checksum": "nope"}},
+        },
+    }
+
+    reader = mock_stream(json.dumps(apdiff).encode(), chunk_size=7)
+    assert await _extract_checksum_from_apdiff(reader, version) == expected
+
+
+@pytest.mark.asyncio
+async def test_extract_checksum_from_apdiff_stops_early(mock_stream):
+    apdiff = {
+        "diffs": {
+            "0.9.0...1.0.0": {"VersionAdded": {"checksum": "abc123checksum"}},
+            "1.0.0...1.1.0": {
+                "VersionAdded": {"content": "x" * 1024 * 1024, "checksum": "other"}
+            },
+        },
+    }
+
+    reader = mock_stream(json.dumps(apdiff).encode(), chunk_size=4096)
+    assert await _extract_checksum_from_apdiff(reader, "1.0.0") == "abc123checksum"
+
+    remaining = 0
+    while chunk := await reader.read():
+        remaining += len(chunk)
+    assert remaining > 1024 * 1024 - 4096 * 32
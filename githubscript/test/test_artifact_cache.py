@@ -0,0 +1,77 @@
+import os
+
+from githubscript.artifact_cache import ArtifactCache
+
+
+def _store(cache, task_id, run_id, name, data):
+    tmpfile = cache.tempfile()
+    tmpfile.write(data)
+    tmpfile.close()
+    cache.store(task_id, run_id, name, tmpfile.name)
+
+
+def test_from_config_disabled_by_default():
+    assert ArtifactCache.from_config({}) is None
+
+
+def test_from_config(tmp_path):
+    cache = ArtifactCache.from_config(
+        {"artifact_cache_dir": str(tmp_path), "artifact_cache_max_size": 42}
+    )
+
+    assert cache.root == str(tmp_path)
+    assert cache.max_size == 42
+
+
+def test_miss(tmp_path):
+    cache = ArtifactCache(str(tmp_path))
+
+    assert cache.open("task", 0, "public/report.json") is None
+
+
+def test_hit(tmp_path):
+    cache = ArtifactCache(str(tmp_path))
+    _store(cache, "task", 0, "public/report.json", b"report")
+
+    with cache.open("task", 0, "public/report.json") as fd:
+        assert fd.read() == b"report"
+
+    assert cache.open("task", 1, "public/report.json") is None
+    assert cache.open("other-task", 0, "public/report.json") is None
+
+
+def test_identical_contents_share_a_blob(tmp_path):
+    cache = ArtifactCache(str(tmp_path))
+    _store(cache, "task-a", 0, "public/report.json", b"report")
+    _store(cache, "task-b", 0, "public/report.json", b"report")
+
+    assert len(os.listdir(tmp_path / "blobs")) == 1
+    with cache.open("task-b", 0, "public/report.json") as fd:
+        assert fd.read() == b"report"
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_size=10)
+    _store(cache, "task", 0, "a", b"aaaa")
+    _store(cache, "task", 0, "b", b"bbbb")
+
+    # Make "b" the oldest blob, then touch "a" through a hit.
+    for entry in os.scandir(tmp_path / "blobs"):
+        os.utime(entry.path, (0, 0))
+    cache.open("task", 0, "a").close()
+
+    _store(cache, "task", 0, "c", b"cccc")
+
+    # The key of the evicted blob went with it.
+    assert len(os.listdir(tmp_path / "keys")) == 2
+    assert cache.open("task", 0, "b") is None
+    cache.open("task", 0, "a").close()
+    cache.open("task", 0, "c").close()
+
+
+def test_skips_artifacts_larger_than_the_cache(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_size=2)
+    _store(cache, "task", 0, "a", b"aaaa")
+
+    assert cache.open("task", 0, "a") is None
+    assert os.listdir(tmp_path / "tmp") == []
@@ -0,0 +1,90 @@
+import json
+import pytest
+
+from githubscript.artifacts import read_json_artifact
+from scriptworker.client import Context
+from unittest.mock import AsyncMock, Mock, patch
+
+
+class _Stream:
+    def __init__(self, data):
+        self._data = data
+
+    async def read(self, n=-1):
+        if n < 0:
+            n = len(self._data)
+        chunk, self._data = self._data[:n], self._data[n:]
+        return chunk
+
+
+def _get_context(cache_dir=None):
+    context = Context()
+    context.config = {"taskcluster_root_url": "https://nowhere"}
+    if cache_dir:
+        context.config["artifact_cache_dir"] = cache_dir
+
+    def get(url):
+        response = AsyncMock()
+        response.__aenter__.return_value.raise_for_status = Mock()
+        response.__aenter__.return_value.content = _Stream(
+            json.dumps({"url": url}).encode()
+        )
+        return response
+
+    context.session = Mock()
+    context.session.get = Mock(side_effect=get)
+    return context
+
+
+def _get_queue(state):
+    queue = Mock()
+    queue.return_value = AsyncMock()
+    queue.return_value.status.return_value = {
+        "status": {"runs": [{"runId": 0}, {"runId": 1, "state": state}]}
+    }
+    queue.return_value.getArtifact.side_effect = lambda task_id, run_id, name: {
+        "url": f"https://nowhere/{task_id}/runs/{run_id}/{name}"
+    }
+    queue.return_value.getLatestArtifact.side_effect = lambda task_id, name: {
+        "url": f"https://nowhere/{task_id}/latest/{name}"
+    }
+    return queue
+
+
+@pytest.mark.asyncio
+async def test_without_cache():
+    context = _get_context()
+
+    with patch("taskcluster.aio.Queue", _get_queue("completed")) as queue:
+        result = await read_json_artifact(context, "task", "public/report.json")
+
+    assert result == {"url": "https://nowhere/task/latest/public/report.json"}
+    queue.return_value.status.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_cache_hit_across_runs(tmp_path):
+    with patch("taskcluster.aio.Queue", _get_queue("completed")):
+        first = _get_context(str(tmp_path))
+        assert await read_json_artifact(first, "task", "public/report.json") == {
+            "url": "https://nowhere/task/runs/1/public/report.json"
+        }
+
+        second = _get_context(str(tmp_path))
+        assert await read_json_artifact(second, "task", "public/report.json") == {
+            "url": "https://nowhere/task/runs/1/public/report.json"
+        }
+
+    first.session.get.assert_called_once()
+    second.session.get.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_unresolved_runs_bypass_the_cache(tmp_path):
+    with patch("taskcluster.aio.Queue", _get_queue("running")):
+        for _ in range(2):
+            context = _get_context(str(tmp_path))
+            assert await read_json_artifact(context, "task", "public/report.json") == {
+                "url": "https://nowhere/task/latest/public/report.json"
+            }
+            context.session.get.assert_called_once()
@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+
+from githubscript import clients
+from scriptworker.client import Context
+from unittest.mock import AsyncMock, Mock
+
+
+def _get_context():
+    context = Context()
+    context.config = {"taskcluster_root_url": "https://nowhere"}
+    context.session = Mock()
+    return context
+
+
+def test_get_queue_is_shared_across_calls():
+    context = _get_context()
+
+    queue = clients.get_queue(context)
+
+    assert clients.get_queue(context) is queue
+    assert queue.session is context.session
+    assert queue.options["rootUrl"] == "https://nowhere"
+
+
+def test_get_queue_is_per_context():
+    assert clients.get_queue(_get_context()) is not clients.get_queue(_get_context())
+
+
+@pytest.mark.asyncio
+async def test_cached_queue_memoizes_lookups():
+    queue = AsyncMock()
+    queue.task.side_effect = lambda task_id: {"taskGroupId": f"group-{task_id}"}
+    cached = clients.CachedQueue(queue)
+
+    assert await cached.task("a") == {"taskGroupId": "group-a"}
+    assert await cached.task("a") == {"taskGroupId": "group-a"}
+    assert await cached.task("b") == {"taskGroupId": "group-b"}
+
+    assert queue.task.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_cached_queue_shares_in_flight_requests():
+    release = asyncio.Event()
+
+    async def status(task_id):
+        await release.wait()
+        return {"status": {"taskId": task_id}}
+
+    queue = AsyncMock()
+    queue.status.side_effect = status
+    cached = clients.CachedQueue(queue)
+
+    pending = [asyncio.ensure_future(cached.status("a")) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+
+    results = await asyncio.gather(*pending)
+    assert all(result is results[0] for result in results)
+    queue.status.assert_called_once_with("a")
+
+
+@pytest.mark.asyncio
+async def test_cached_queue_retries_after_failure():
+    queue = AsyncMock()
+    queue.task.side_effect = [RuntimeError("boom"), {"taskGroupId": "group"}]
+    cached = clients.CachedQueue(queue)
+
+    with pytest.raises(RuntimeError):
+        await cached.task("a")
+
+    assert await cached.task("a") == {"taskGroupId": "group"}
+    assert queue.task.call_count == 2
+
+
+def test_cached_queue_passes_through_other_attributes():
+    queue = Mock()
+    cached = clients.CachedQueue(queue)
+
+    assert cached.createArtifact is queue.createArtifact
@@ -0,0 +1,140 @@
+import pytest
+
+from githubscript import comments
+from unittest.mock import AsyncMock, MagicMock, Mock
+
+
+@pytest.fixture(autouse=True)
+def clear_listings():
+    comments._listings.clear()
+
+
+APP_ID = 1234
+
+
+def _comment(id, body, type="Bot", app_id=APP_ID):
+    app = {"id": app_id} if type == "Bot" else None
+    return {
+        "id": id,
+        "body": body,
+        "user": {"type": type},
+        "performed_via_github_app": app,
+    }
+
+
+def _page(status, body=None, etag=None, next_url=None):
+    response = MagicMock()
+    response.__aenter__ = AsyncMock(return_value=response)
+    response.__aexit__ = AsyncMock(return_value=None)
+    response.status = status
+    response.raise_for_status = Mock()
+    response.json = AsyncMock(return_value=body)
+    response.headers = {"ETag": etag} if etag else {}
+    response.links = {"next": {"url": next_url}} if next_url else {}
+    return response
+
+
+def _github(*pages):
+    github = Mock()
+    github.get = AsyncMock(side_effect=pages)
+    github.post = AsyncMock(return_value=Mock())
+    github.patch = AsyncMock(return_value=Mock())
+    return github
+
+
+BODY = "Hello\n\n<!-- githubscript:apdiff -->"
+LISTING = "/repos/foo/bar/issues/1/comments?per_page=100"
+
+
+@pytest.mark.asyncio
+async def test_creates_comment():
+    github = _github(_page(200, [_comment(1, "Unrelated")]))
+
+    await comments.upsert_comment(github, "foo", "bar", 1, "apdiff", "Hello", APP_ID)
+
+    github.post.assert_called_once_with(
+        "/repos/foo/bar/issues/1/comments", data={"body": BODY}
+    )
+    github.patch.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_updates_previous_comment_on_later_page():
+    github = _github(
+        _page(200, [_comment(1, "Unrelated")], next_url="https://gh/page2"),
+        _page(200, [_comment(2, "Old\n\n<!-- githubscript:apdiff -->")]),
+    )
+
+    await comments.upsert_comment(github, "foo", "bar", 1, "apdiff", "Hello", APP_ID)
+
+    assert github.get.call_args_list[1].args == ("https://gh/page2",)
+    github.patch.assert_called_once_with(
+        "/repos/foo/bar/issues/comments/2", data={"body": BODY}
+    )
+    github.post.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_ignores_markers_in_human_comments():
+    github = _github(_page(200, [_comment(1, BODY, type="User")]))
+
+    await comments.upsert_comment(github, "foo", "bar", 1, "apdiff", "Hello", APP_ID)
+
+    github.post.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_ignores_markers_in_other_apps_comments():
+    github = _github(_page(200, [_comment(1, BODY, app_id=999)]))
+
+    await comments.upsert_comment(github, "foo", "bar", 1, "apdiff", "Hello", APP_ID)
+
+    github.post.assert_called_once()
+    github.patch.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_unchanged_comment_is_not_written():
+    github = _github(_page(200, [_comment(1, BODY)]))
+
+    await comments.upsert_comment(github, "foo", "bar", 1, "apdiff", "Hello", APP_ID)
+
+    github.post.assert_not_called()
+    github.patch.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_listing_uses_etags():
+    github = _github(
+        _page(200, [_comment(1, BODY)], etag='"v1"'),
+        _page(304),
+    )
+
+    await comments.upsert_comment(github, "foo", "bar", 1, "apdiff", "Hello", APP_ID)
+    await comments.upsert_comment(github, "foo", "bar", 1, "apdiff", "Hello", APP_ID)
+
+    assert github.get.call_args_list[0].kwargs == {"headers": {}}
+    assert github.get.call_args_list[1].kwargs == {"headers": {"If-None-Match": '"v1"'}}
+    assert github.get.call_args_list[1].args == (LISTING,)
+    github.post.assert_not_called()
+    github.patch.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_listings_are_bounded(monkeypatch):
+    monkeypatch.setattr(comments, "_MAX_LISTINGS", 2)
+    listing = [_comment(1, BODY), _comment(2, "Hi", "User")]
+    github = _github(
+        _page(200, listing, etag='"v1"'),
+        _page(200, listing, etag='"v1"'),
+        _page(304),
+        _page(200, listing, etag='"v1"'),
+    )
+
+    for pr in (1, 2, 1, 3):
+        await comments.upsert_comment(github, "foo", "bar", pr, "apdiff", "Hello", APP_ID)
+
+    # The listing of PR 1 was used again, PR 2's is the one dropped.
+    assert [url for _, url in comments._listings] == [LISTING, LISTING.replace("/1/", "/3/")]
+    # Only the app's comments are kept, and only what's needed of them.
+    assert comments._listings[APP_ID, LISTING][1] == [{"id": 1, "body": BODY}]
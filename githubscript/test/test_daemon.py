@@ -0,0 +1,96 @@
+import aiohttp
+import json
+import logging
+import pytest
+import pytest_asyncio
+
+from aiohttp import web
+from githubscript import daemon
+from scriptworker.exceptions import TaskVerificationError
+from unittest.mock import patch
+
+
+@pytest.fixture
+def task_config(tmp_path, monkeypatch):
+    monkeypatch.setenv("TASKCLUSTER_ROOT_URL", "https://nowhere")
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+    (work_dir / "task.json").write_text(
+        json.dumps({"scopes": ["ap:github:repo:archipelago-index"], "payload": {}})
+    )
+    config_path = tmp_path / "config.json"
+    config_path.write_text(
+        json.dumps({"work_dir": str(work_dir), "artifact_dir": str(tmp_path)})
+    )
+    return str(config_path)
+
+
+@pytest_asyncio.fixture
+async def client(tmp_path):
+    socket_path = str(tmp_path / "daemon.sock")
+    runner = web.AppRunner(daemon.make_app(), handler_cancellation=True)
+    await runner.setup()
+    await web.UnixSite(runner, socket_path).start()
+
+    async with aiohttp.ClientSession(
+        connector=aiohttp.UnixConnector(path=socket_path)
+    ) as session:
+        yield session
+
+    await runner.cleanup()
+
+
+async def _run(client, config_path):
+    async with client.post("http://localhost/run", json={"config": config_path}) as r:
+        r.raise_for_status()
+        lines = (await r.text()).splitlines()
+    assert lines[-1].startswith(daemon.EXIT_CODE_PREFIX)
+    return lines[:-1], int(lines[-1][len(daemon.EXIT_CODE_PREFIX):])
+
+
+@pytest.mark.asyncio
+async def test_health(client):
+    async with client.get("http://localhost/health") as r:
+        assert r.status == 200
+
+
+@pytest.mark.asyncio
+async def test_runs_task(client, task_config, caplog):
+    caplog.set_level(logging.INFO)
+    seen = []
+
+    async def async_main(context):
+        seen.append(context)
+        logging.getLogger("githubscript.actions").info("Doing the thing")
+
+    with patch("githubscript.daemon.async_main", async_main):
+        logs, exit_code = await _run(client, task_config)
+
+    assert exit_code == 0
+    assert any("Doing the thing" in line for line in logs)
+    assert seen[0].task["scopes"] == ["ap:github:repo:archipelago-index"]
+    assert seen[0].config["taskcluster_root_url"] == "https://nowhere"
+
+
+@pytest.mark.asyncio
+async def test_reports_scriptworker_exit_code(client, task_config):
+    async def async_main(context):
+        raise TaskVerificationError("Nope")
+
+    with patch("githubscript.daemon.async_main", async_main):
+        logs, exit_code = await _run(client, task_config)
+
+    assert exit_code == TaskVerificationError("Nope").exit_code
+    assert any("Nope" in line for line in logs)
+
+
+@pytest.mark.asyncio
+async def test_reports_crashes(client, task_config):
+    async def async_main(context):
+        raise ValueError("Boom")
+
+    with patch("githubscript.daemon.async_main", async_main):
+        logs, exit_code = await _run(client, task_config)
+
+    assert exit_code == 1
+    assert any("ValueError: Boom" in line for line in logs)
@@ -0,0 +1,167 @@
+import asyncio
+import fcntl
+import json
+import os
+import pytest
+import stat
+
+from datetime import datetime, timezone
+from githubscript import github_auth
+from scriptworker.exceptions import TaskVerificationError
+from unittest.mock import AsyncMock, MagicMock, patch
+
+
+def _expiry(seconds):
+    return datetime.fromtimestamp(
+        datetime.now(timezone.utc).timestamp() + seconds, timezone.utc
+    ).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class FakeGithub:
+    """Stand-in for the app-authenticated client used to mint tokens."""
+
+    def __init__(self, installations=None, expires_in=3600):
+        self.installations = installations or [{"id": 42, "account": {"login": "owner"}}]
+        self.expires_in = expires_in
+        self.minted = []
+        self.installation_lookups = 0
+
+    def __call__(self, session, auth, base_url):
+        client = MagicMock()
+        client.__aenter__ = AsyncMock(return_value=client)
+        client.__aexit__ = AsyncMock(return_value=None)
+        client.get = AsyncMock(side_effect=self._get)
+        client.post = AsyncMock(side_effect=self._post)
+        return client
+
+    async def _get(self, query):
+        assert query == "/app/installations"
+        self.installation_lookups += 1
+        response = MagicMock()
+        response.__aenter__ = AsyncMock(return_value=response)
+        response.__aexit__ = AsyncMock(return_value=None)
+        response.json = AsyncMock(return_value=self.installations)
+        return response
+
+    async def _post(self, query, data):
+        response = MagicMock()
+        installation_ids = {str(i["id"]) for i in self.installations}
+        if query.split("/")[3] not in installation_ids:
+            response.status = 404
+            return response
+        self.minted.append((query, data))
+        response.status = 201
+        response.json = AsyncMock(
+            return_value={
+                "token": f"token-{len(self.minted)}",
+                "expires_at": _expiry(self.expires_in),
+            }
+        )
+        return response
+
+
+def _auth(cache_path, repositories=("repo",), **kwargs):
+    return github_auth.CachedInstallationAuth(
+        1234, "privkey", "owner", list(repositories), str(cache_path), **kwargs
+    )
+
+
+@pytest.mark.asyncio
+async def test_token_is_shared_across_tasks(tmp_path):
+    cache_path = tmp_path / "tokens.json"
+    github = FakeGithub()
+
+    with patch("githubscript.github_auth.GithubClient", github):
+        first = await _auth(cache_path).get_token()
+        second = await _auth(cache_path).get_token()
+
+    assert first == second == "token-1"
+    assert github.minted == [
+        ("/app/installations/42/access_tokens", {"repositories": ["repo"]})
+    ]
+    assert stat.S_IMODE(os.stat(cache_path).st_mode) == 0o600
+
+
+@pytest.mark.asyncio
+async def test_token_is_refreshed_ahead_of_expiry(tmp_path):
+    cache_path = tmp_path / "tokens.json"
+    github = FakeGithub(expires_in=300)
+
+    with patch("githubscript.github_auth.GithubClient", github):
+        first = await _auth(cache_path, refresh_margin=600).get_token()
+        second = await _auth(cache_path, refresh_margin=600).get_token()
+
+    assert (first, second) == ("token-1", "token-2")
+    # The installation ID doesn't change, only look it up once.
+    assert github.installation_lookups == 1
+
+
+@pytest.mark.asyncio
+async def test_tokens_are_keyed_on_repositories(tmp_path):
+    cache_path = tmp_path / "tokens.json"
+    github = FakeGithub()
+
+    with patch("githubscript.github_auth.GithubClient", github):
+        first = await _auth(cache_path, repositories=["a", "b"]).get_token()
+        second = await _auth(cache_path, repositories=["b", "a"]).get_token()
+        other = await _auth(cache_path, repositories=["c"]).get_token()
+
+    assert first == second == "token-1"
+    assert other == "token-2"
+    assert len(json.loads(cache_path.read_text())["tokens"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_corrupted_cache_is_ignored(tmp_path):
+    cache_path = tmp_path / "tokens.json"
+    cache_path.write_text("{not json")
+
+    with patch("githubscript.github_auth.GithubClient", FakeGithub()):
+        assert await _auth(cache_path).get_token() == "token-1"
+
+
+@pytest.mark.asyncio
+async def test_app_not_installed(tmp_path):
+    github = FakeGithub(installations=[{"id": 1, "account": {"login": "someone"}}])
+
+    with patch("githubscript.github_auth.GithubClient", github):
+        with pytest.raises(TaskVerificationError):
+            await _auth(tmp_path / "tokens.json").get_token()
+
+
+@pytest.mark.asyncio
+async def test_cache_is_not_locked_while_minting(tmp_path):
+    cache_path = tmp_path / "tokens.json"
+    github = FakeGithub()
+    post = github._post
+
+    async def _post(query, data):
+        # Another process can still read the cache meanwhile.
+        with open(cache_path) as fileobj:
+            fcntl.flock(fileobj, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        await asyncio.sleep(0.01)
+        return await post(query, data)
+
+    github._post = _post
+    with patch("githubscript.github_auth.GithubClient", github):
+        tokens = await asyncio.gather(
+            *(_auth(cache_path).get_token() for _ in range(3))
+        )
+
+    assert tokens == ["token-1"] * 3
+    assert len(github.minted) == 1
+
+
+@pytest.mark.asyncio
+async def test_reinstalled_app_is_looked_up_again(tmp_path):
+    cache_path = tmp_path / "tokens.json"
+    github = FakeGithub(expires_in=60)
+
+    with patch("githubscript.github_auth.GithubClient", github):
+        assert await _auth(cache_path).get_token() == "token-1"
+        github.installations = [{"id": 43, "account": {"login": "owner"}}]
+        assert await _auth(cache_path).get_token() == "token-2"
+
+    assert github.installation_lookups == 2
+    assert github.minted[-1][0] == "/app/installations/43/access_tokens"
+    assert json.loads(cache_path.read_text())["installations"] == {"1234:owner": 43}
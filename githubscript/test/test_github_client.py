@@ -0,0 +1,85 @@
+import aiohttp
+import pytest
+
+from githubscript.github_client import GithubClient
+from unittest.mock import AsyncMock, Mock, patch
+
+
+def _response(status):
+    response = Mock()
+    response.status = status
+    return response
+
+
+def _client(*responses):
+    session = Mock()
+    session.request = AsyncMock(side_effect=responses)
+    auth = Mock()
+    auth.get_token = AsyncMock(return_value="token")
+    auth.close = AsyncMock()
+    return GithubClient(session, auth, "https://github.test/api/"), session
+
+
+@pytest.mark.asyncio
+async def test_request():
+    ok = _response(201)
+    client, session = _client(ok)
+
+    assert await client.post("/repos/o/r/issues/1/comments", data={"body": "hi"}) is ok
+
+    session.request.assert_called_once_with(
+        "POST",
+        "https://github.test/api/repos/o/r/issues/1/comments",
+        headers={
+            "Accept": "application/vnd.github+json",
+            "Authorization": "Bearer token",
+        },
+        json={"body": "hi"},
+    )
+
+
+@pytest.mark.asyncio
+@patch("asyncio.sleep", AsyncMock())
+async def test_retries_server_errors():
+    failed = _response(502)
+    ok = _response(200)
+    client, session = _client(aiohttp.ClientConnectionError(), failed, ok)
+
+    assert await client.get("/user") is ok
+    assert session.request.call_count == 3
+    failed.release.assert_called_once()
+
+
+@pytest.mark.asyncio
+@patch("asyncio.sleep", AsyncMock())
+async def test_gives_up_after_last_attempt():
+    responses = [_response(503) for _ in range(5)]
+    client, session = _client(*responses)
+
+    assert await client.get("/user") is responses[-1]
+    assert session.request.call_count == 5
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried():
+    not_found = _response(404)
+    client, session = _client(not_found)
+
+    assert await client.get("/user") is not_found
+    assert session.request.call_count == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("method", ["post", "put", "patch"])
+@patch("asyncio.sleep", AsyncMock())
+async def test_non_idempotent_requests_are_not_retried(method):
+    failed = _response(502)
+    client, session = _client(failed, _response(200))
+
+    assert await getattr(client, method)("/repos/o/r/pulls/1/merge") is failed
+    assert session.request.call_count == 1
+
+    client, session = _client(aiohttp.ClientConnectionError(), _response(200))
+    with pytest.raises(aiohttp.ClientConnectionError):
+        await getattr(client, method)("/repos/o/r/pulls/1/merge")
+    assert session.request.call_count == 1
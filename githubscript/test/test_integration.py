@@ -1,6 +1,6 @@
 import pytest
 from contextlib import nullcontext as does_not_raise
-from githubscript import async_main
+from githubscript import async_main, transport
 from pytest import raises
 from scriptworker.client import Context
 from scriptworker.exceptions import TaskVerificationError
@@ -27,7 +27,10 @@ async def call_main(repo, actions):
         },
     }
 
-    await async_main(context)
+    try:
+        await async_main(context)
+    finally:
+        await transport.close_session()
 
     assert context.config["target"]["owner"] == "Eijebong"
     assert context.config["target"]["repo"] == "Archipelago-index"
@@ -0,0 +1,156 @@
+import aiohttp
+import pytest
+import pytest_asyncio
+
+from aiohttp import web
+from githubscript import metrics
+from githubscript.artifact_cache import ArtifactCache
+from githubscript.rate_limit import RateLimitedGithub
+from unittest.mock import AsyncMock, Mock
+
+
+def _samples(path):
+    samples = {}
+    for line in path.read_text().splitlines():
+        if not line.startswith("#"):
+            series, value = line.rsplit(" ", 1)
+            samples[series] = float(value)
+    return samples
+
+
+@pytest_asyncio.fixture
+async def server():
+    async def missing(request):
+        return web.Response(status=404)
+
+    app = web.Application()
+    app.router.add_get("/missing", missing)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    yield f"http://127.0.0.1:{runner.addresses[0][1]}"
+    await runner.cleanup()
+
+
+def test_collect_merges_tasks(tmp_path):
+    path = tmp_path / "metrics" / "githubscript.prom"
+
+    with metrics.collect(str(path)):
+        metrics.set_gauge("github_rate_limit_remaining", 42)
+        with metrics.action("apdiff"):
+            pass
+
+    with pytest.raises(RuntimeError):
+        with metrics.collect(str(path)):
+            metrics.set_gauge("github_rate_limit_remaining", 41)
+            with metrics.action("apdiff"):
+                raise RuntimeError("apdiff is down")
+
+    text = path.read_text()
+    assert "# TYPE githubscript_tasks_total counter\n" in text
+    assert "# TYPE githubscript_action_duration_seconds histogram\n" in text
+    samples = _samples(path)
+    assert samples['githubscript_tasks_total{action="apdiff",result="success"}'] == 1
+    assert samples['githubscript_tasks_total{action="apdiff",result="failure"}'] == 1
+    assert samples["githubscript_github_rate_limit_remaining"] == 41
+    assert samples['githubscript_action_duration_seconds_count{action="apdiff"}'] == 2
+    assert samples['githubscript_action_duration_seconds_bucket{action="apdiff",le="+Inf"}'] == 2
+    assert samples['githubscript_action_duration_seconds_bucket{action="apdiff",le="0.01"}'] == 2
+
+
+def test_collect_mixed_label_values(tmp_path):
+    path = tmp_path / "githubscript.prom"
+
+    with metrics.collect(str(path)):
+        metrics.inc("http_requests_total", host="example.com", code=200)
+    with metrics.collect(str(path)):
+        metrics.inc("http_requests_total", host="example.com", code="error")
+
+    samples = _samples(path)
+    assert samples['githubscript_http_requests_total{code="200",host="example.com"}'] == 1
+    assert samples['githubscript_http_requests_total{code="error",host="example.com"}'] == 1
+
+
+def test_collect_write_failure(tmp_path, monkeypatch):
+    path = tmp_path / "githubscript.prom"
+    monkeypatch.setattr(metrics, "render", Mock(side_effect=TypeError))
+
+    with metrics.collect(str(path)):
+        metrics.inc("tasks_total", action="apdiff", result="success")
+
+    assert not path.exists()
+    assert not (tmp_path / "githubscript.prom.json").exists()
+
+
+def test_render_histogram_is_cumulative():
+    registry = metrics.Metrics()
+    for value in (0.02, 0.2, 1000):
+        registry.observe("http_request_duration_seconds", value, host='a"b')
+
+    text = metrics.render(registry.merge({}))
+    series = 'githubscript_http_request_duration_seconds_bucket{host="a\\"b",le="%s"} %d'
+    assert series % ("0.01", 0) in text
+    assert series % ("0.025", 1) in text
+    assert series % ("0.25", 2) in text
+    assert series % ("600", 2) in text
+    assert series % ("+Inf", 3) in text
+
+
+def test_without_collect(tmp_path):
+    metrics.inc("tasks_total", action="apdiff")
+    with metrics.collect(None) as registry:
+        metrics.inc("tasks_total", action="apdiff")
+    assert list(registry.counters.values()) == [1]
+
+
+def test_artifact_cache_hits(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    with metrics.collect(None) as registry:
+        assert cache.open("task", 0, "public/a") is None
+        with cache.tempfile() as fd:
+            fd.write(b"a")
+        cache.store("task", 0, "public/a", fd.name)
+        cache.open("task", 0, "public/a").close()
+
+    assert {
+        series: value
+        for series, value in registry.counters.items()
+        if "artifact_cache" in series
+    } == {
+        metrics._series("artifact_cache_requests_total", {"result": "miss"}): 1,
+        metrics._series("artifact_cache_requests_total", {"result": "hit"}): 1,
+    }
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_remaining():
+    response = Mock(status=200, headers={"X-RateLimit-Remaining": "4321"})
+    github = RateLimitedGithub(Mock(request=AsyncMock(return_value=response)))
+
+    with metrics.collect(None) as registry:
+        await github.get("/repos/foo/bar")
+
+    assert registry.gauges == {
+        metrics._series("github_rate_limit_remaining", {}): 4321
+    }
+
+
+@pytest.mark.asyncio
+async def test_http_requests(server):
+    async with aiohttp.ClientSession(trace_configs=[metrics.trace_config()]) as session:
+        with metrics.collect(None) as registry:
+            async with session.get(f"{server}/missing") as r:
+                assert r.status == 404
+            with pytest.raises(aiohttp.ClientError):
+                async with session.get("http://127.0.0.1:1/"):
+                    pass
+
+    assert registry.counters == {
+        metrics._series("http_requests_total", {"host": "127.0.0.1", "code": "404"}): 1,
+        metrics._series(
+            "http_requests_total", {"host": "127.0.0.1", "code": "error"}
+        ): 1,
+    }
+    histogram, = registry.histograms.values()
+    assert histogram["count"] == 2
@@ -0,0 +1,183 @@
+import asyncio
+import pytest
+
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from githubscript.rate_limit import RateLimitedGithub
+from unittest.mock import AsyncMock, Mock, patch
+
+
+def _response(status=200, remaining=None, reset=1_700_003_600, retry_after=None, text=""):
+    response = Mock()
+    response.status = status
+    response.headers = {}
+    if remaining is not None:
+        response.headers["X-RateLimit-Remaining"] = str(remaining)
+        response.headers["X-RateLimit-Reset"] = str(reset)
+    if retry_after is not None:
+        response.headers["Retry-After"] = str(retry_after)
+    response.text = AsyncMock(return_value=text)
+    return response
+
+
+def _github(*responses):
+    github = Mock()
+    github.request = AsyncMock(side_effect=responses)
+    return github
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.now += delay
+
+
+@pytest.fixture
+def clock():
+    clock = Clock()
+    with patch("githubscript.rate_limit.time", clock):
+        yield clock
+
+
+@pytest.fixture
+def sleep(clock):
+    with patch("asyncio.sleep", AsyncMock(side_effect=clock.sleep)) as sleep:
+        yield sleep
+
+
+@pytest.mark.asyncio
+async def test_passes_requests_through(sleep):
+    ok = _response(remaining=4000)
+    github = _github(ok)
+    client = RateLimitedGithub(github)
+
+    assert await client.post("/foo", data={"a": 1}) is ok
+
+    github.request.assert_called_once_with("POST", "/foo", json={"a": 1})
+    assert client.remaining == 4000
+    sleep.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_retries_after_retry_after(sleep):
+    limited = _response(429, retry_after=7)
+    ok = _response()
+    client = RateLimitedGithub(_github(limited, ok))
+
+    assert await client.get("/foo") is ok
+
+    limited.release.assert_called_once()
+    sleep.assert_called_once_with(7)
+
+
+@pytest.mark.asyncio
+async def test_retries_after_retry_after_date(clock, sleep):
+    retry_at = datetime.fromtimestamp(clock.now + 30, timezone.utc)
+    limited = _response(429, retry_after=format_datetime(retry_at, usegmt=True))
+    ok = _response()
+    client = RateLimitedGithub(_github(limited, ok))
+
+    assert await client.get("/foo") is ok
+
+    sleep.assert_called_once_with(30)
+
+
+@pytest.mark.asyncio
+async def test_clients_of_an_installation_share_its_budget(clock, sleep):
+    reset = int(clock.now) + 60
+    config = {"github_write_reserve": 10}
+    first = RateLimitedGithub.from_config(
+        _github(_response(remaining=5, reset=reset)), config, "1:owner"
+    )
+    second = RateLimitedGithub.from_config(_github(_response()), config, "1:owner")
+    other = RateLimitedGithub.from_config(_github(_response()), config, "1:other")
+
+    await first.get("/foo")
+
+    # Another owner's installation has a budget of its own.
+    await other.get("/foo")
+    sleep.assert_not_called()
+
+    # The second task's reads wait for the window the first one exhausted.
+    await second.get("/foo")
+    assert clock.now >= reset
+
+
+@pytest.mark.asyncio
+async def test_backs_off_on_secondary_rate_limit(sleep):
+    limited = _response(403, remaining=1000, text="You have exceeded a secondary rate limit")
+    ok = _response()
+    client = RateLimitedGithub(_github(limited, ok))
+
+    with patch("random.uniform", return_value=0.5) as uniform:
+        assert await client.put("/merge") is ok
+
+    uniform.assert_called_once_with(0, 1)
+    sleep.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_forbidden_is_not_retried(sleep):
+    forbidden = _response(403, remaining=1000, text="Resource not accessible")
+    client = RateLimitedGithub(_github(forbidden))
+
+    assert await client.get("/foo") is forbidden
+    sleep.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries(sleep):
+    responses = [_response(429, retry_after=1) for _ in range(3)]
+    client = RateLimitedGithub(_github(*responses), max_retries=2)
+
+    assert await client.get("/foo") is responses[-1]
+    assert sleep.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_reads_leave_a_reserve_for_writes(clock, sleep):
+    reset = int(clock.now) + 60
+    client = RateLimitedGithub(
+        _github(_response(remaining=5, reset=reset), _response(), _response()),
+        write_reserve=10,
+    )
+    await client.get("/foo")
+
+    # Writes can still use what's left, paced over the rest of the window.
+    await client.post("/comment")
+    assert clock.now == pytest.approx(reset - 60 + 12)
+
+    # Reads wait for the window to reset.
+    client._budget.remaining = 5
+    await client.get("/foo")
+    assert clock.now >= reset
+
+
+@pytest.mark.asyncio
+async def test_writes_go_before_reads():
+    order = []
+    release = asyncio.Event()
+
+    async def request(method, query, **kwargs):
+        order.append(query)
+        await release.wait()
+        return _response()
+
+    github = Mock()
+    github.request = request
+    client = RateLimitedGithub(github, max_concurrency=1)
+
+    first = asyncio.create_task(client.get("/first"))
+    await asyncio.sleep(0)
+    read = asyncio.create_task(client.get("/read"))
+    write = asyncio.create_task(client.post("/write"))
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(first, read, write)
+
+    assert order == ["/first", "/write", "/read"]
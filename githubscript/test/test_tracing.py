@@ -0,0 +1,141 @@
+import aiohttp
+import json
+import pytest
+import pytest_asyncio
+
+from aiohttp import web
+from githubscript import tracing
+
+
+def _spans(path):
+    with open(path) as fd:
+        data = json.load(fd)
+    resource, = data["resourceSpans"]
+    assert resource["resource"]["attributes"] == [
+        {"key": "service.name", "value": {"stringValue": "githubscript"}}
+    ]
+    scope, = resource["scopeSpans"]
+    return {span["name"]: span for span in scope["spans"]}
+
+
+def _attributes(span):
+    return {attr["key"]: attr["value"] for attr in span["attributes"]}
+
+
+@pytest_asyncio.fixture
+async def server(tmp_path):
+    async def ok(request):
+        await request.read()
+        return web.Response(text="hello")
+
+    async def missing(request):
+        return web.Response(status=404)
+
+    app = web.Application()
+    app.router.add_post("/ok", ok)
+    app.router.add_get("/missing", missing)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    yield f"http://127.0.0.1:{port}"
+    await runner.cleanup()
+
+
+def test_trace_links_spans(tmp_path):
+    path = str(tmp_path / "public" / "logs" / "trace.json")
+
+    with pytest.raises(ValueError):
+        with tracing.trace("async_main", path, **{"githubscript.repo": "foo/bar"}):
+            with tracing.span("action comment", **{"githubscript.action": "comment"}):
+                pass
+            with tracing.span("action fail"):
+                raise ValueError("nope")
+
+    spans = _spans(path)
+    root = spans["async_main"]
+    assert "parentSpanId" not in root
+    assert _attributes(root) == {"githubscript.repo": {"stringValue": "foo/bar"}}
+    assert root["status"] == {"code": tracing.STATUS_ERROR, "message": "ValueError: nope"}
+
+    comment = spans["action comment"]
+    assert comment["traceId"] == root["traceId"]
+    assert comment["parentSpanId"] == root["spanId"]
+    assert comment["status"] == {"code": tracing.STATUS_OK}
+    assert int(comment["endTimeUnixNano"]) >= int(comment["startTimeUnixNano"])
+
+    assert spans["action fail"]["status"]["code"] == tracing.STATUS_ERROR
+
+
+def test_trace_in_current_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    with tracing.trace("async_main", "trace.json"):
+        pass
+
+    assert "async_main" in _spans(str(tmp_path / "trace.json"))
+
+
+def test_trace_write_failure(tmp_path):
+    # The trace can't be written in place of a directory.
+    path = tmp_path / "trace.json"
+    path.mkdir()
+
+    with tracing.trace("async_main", str(path)):
+        pass
+
+    with pytest.raises(ValueError, match="nope"):
+        with tracing.trace("async_main", str(path)):
+            raise ValueError("nope")
+
+
+def test_span_without_trace():
+    with tracing.span("orphan") as span:
+        assert span is None
+
+
+def test_trace_path():
+    assert tracing.trace_path({"trace_file": "/tmp/t.json", "artifact_dir": "a"}) == (
+        "/tmp/t.json"
+    )
+    assert tracing.trace_path({"artifact_dir": "a"}) == "a/public/logs/trace.json"
+    assert tracing.trace_path({}) is None
+
+
+@pytest.mark.asyncio
+async def test_http_spans(tmp_path, server):
+    path = str(tmp_path / "trace.json")
+
+    async with aiohttp.ClientSession(trace_configs=[tracing.trace_config()]) as session:
+        # Requests outside of a trace aren't recorded.
+        async with session.get(f"{server}/missing"):
+            pass
+
+        with tracing.trace("async_main", path):
+            with tracing.span("action upload"):
+                async with session.post(f"{server}/ok?bewit=secret", data=b"x" * 10) as r:
+                    assert await r.text() == "hello"
+            async with session.get(f"{server}/missing") as r:
+                assert r.status == 404
+
+    spans = list(_spans(path).values())
+    assert len(spans) == 4
+    root, action = spans[0], spans[1]
+    post, = [span for span in spans if span["name"] == "POST 127.0.0.1"]
+    get, = [span for span in spans if span["name"] == "GET 127.0.0.1"]
+
+    assert post["parentSpanId"] == action["spanId"]
+    assert post["kind"] == tracing.SPAN_KIND_CLIENT
+    assert _attributes(post) == {
+        "http.request.method": {"stringValue": "POST"},
+        "url.full": {"stringValue": f"{server}/ok"},
+        "server.address": {"stringValue": "127.0.0.1"},
+        "http.request.body.size": {"intValue": "10"},
+        "http.response.body.size": {"intValue": "5"},
+        "http.response.status_code": {"intValue": "200"},
+    }
+    assert post["status"] == {"code": tracing.STATUS_OK}
+
+    assert get["parentSpanId"] == root["spanId"]
+    assert get["status"] == {"code": tracing.STATUS_ERROR, "message": "HTTP 404"}
@@ -0,0 +1,27 @@
+import pytest
+
+from githubscript import transport
+
+
+@pytest.mark.asyncio
+async def test_session_is_shared():
+    session = transport.get_session({"http_limit_per_host": 4})
+    try:
+        assert transport.get_session({}) is session
+        assert session.connector.limit_per_host == 4
+    finally:
+        await transport.close_session()
+
+    assert session.closed
+
+
+@pytest.mark.asyncio
+async def test_closed_session_is_replaced():
+    session = transport.get_session({})
+    await session.close()
+
+    new_session = transport.get_session({})
+    try:
+        assert new_session is not session
+    finally:
+        await transport.close_session()
@@ -1,11 +1,12 @@
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 import uuid
 from githubscript import utils
 from scriptworker.client import Context
 
 
 GITHUB_MOCK = Mock()
+GITHUB_MOCK.return_value = AsyncMock()
 GITHUB_MOCK.return_value.builds.return_value = {
     "builds": [
         {"taskGroupId": "GRKcd87oQ4qFB9SnyH02wg"},
@@ -21,7 +22,8 @@ GITHUB_MOCK.return_value.builds.return_value = {
         pytest.param("GRKcd87oQ4qFB9SnyH03wg", False),
     ),
 )
-def test_is_task_coming_from_pr(task_group_id, expectation):
+@pytest.mark.asyncio
+async def test_is_task_coming_from_pr(task_group_id, expectation):
     owner = str(uuid.uuid4())
     repo = str(uuid.uuid4())
     task_id = str(uuid.uuid4())
@@ -40,15 +42,16 @@ def test_is_task_coming_from_pr(task_group_id, expectation):
     }
 
     queue_mock = Mock()
+    queue_mock.return_value = AsyncMock()
     queue_mock.return_value.task.return_value = {"taskGroupId": task_group_id}
 
     GITHUB_MOCK.reset_mock()
 
-    with patch("githubscript.utils.Queue", queue_mock), patch(
-        "githubscript.utils.Github", GITHUB_MOCK
+    with patch("taskcluster.aio.Queue", queue_mock), patch(
+        "taskcluster.aio.Github", GITHUB_MOCK
     ):
         assert (
-            utils.is_task_coming_from_pr(context, task_id, owner, repo, 5)
+            await utils.is_task_coming_from_pr(context, task_id, owner, repo, 5)
             == expectation
         )
 
@@ -56,3 +59,133 @@ def test_is_task_coming_from_pr(task_group_id, expectation):
     GITHUB_MOCK.return_value.builds.assert_called_with(
         query={"pullRequest": 5, "organization": owner, "repository": repo}
     )
+
+
+def _get_context():
+    context = Context()
+    context.config = {"taskcluster_root_url": "https://nowhere"}
+    return context
+
+
+def _paged_builds(pages):
+    """Fake `builds` answering with `pages`, a list of task group ID lists."""
+
+    async def builds(query):
+        index = int(query.get("continuationToken", 0))
+        response = {"builds": [{"taskGroupId": group} for group in pages[index]]}
+        if index + 1 < len(pages):
+            response["continuationToken"] = str(index + 1)
+        return response
+
+    github = Mock()
+    github.return_value = AsyncMock()
+    github.return_value.builds.side_effect = builds
+    return github
+
+
+def _task_queue():
+    queue = Mock()
+    queue.return_value = AsyncMock()
+    queue.return_value.task.side_effect = lambda task_id: {
+        "taskGroupId": f"group-of-{task_id}"
+    }
+    return queue
+
+
+@pytest.mark.asyncio
+async def test_is_task_coming_from_pr_pages_until_found():
+    owner = str(uuid.uuid4())
+    github = _paged_builds([["a"], ["group-of-task"], ["b"]])
+
+    with patch("taskcluster.aio.Queue", _task_queue()), patch(
+        "taskcluster.aio.Github", github
+    ):
+        assert await utils.is_task_coming_from_pr(
+            _get_context(), "task", owner, "repo", 5
+        )
+
+    assert github.return_value.builds.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_is_task_coming_from_pr_is_cached():
+    owner = str(uuid.uuid4())
+    github = _paged_builds([["a", "group-of-task-1"], ["group-of-task-2"], ["b"]])
+
+    with patch("taskcluster.aio.Queue", _task_queue()) as queue, patch(
+        "taskcluster.aio.Github", github
+    ):
+        for _ in range(2):
+            assert await utils.is_task_coming_from_pr(
+                _get_context(), "task-1", owner, "repo", 5
+            )
+        assert github.return_value.builds.call_count == 1
+        queue.return_value.task.assert_called_once_with("task-1")
+
+        # Looking for another group resumes from the next page.
+        assert await utils.is_task_coming_from_pr(
+            _get_context(), "task-2", owner, "repo", 5
+        )
+        assert github.return_value.builds.call_count == 2
+
+        # Other PRs don't share the cache.
+        assert await utils.is_task_coming_from_pr(
+            _get_context(), "task-1", owner, "repo", 6
+        )
+        assert github.return_value.builds.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_is_task_coming_from_pr_relists_before_rejecting():
+    owner = str(uuid.uuid4())
+    github = _paged_builds([["a"], ["b"]])
+
+    with patch("taskcluster.aio.Queue", _task_queue()), patch(
+        "taskcluster.aio.Github", github
+    ):
+        for _ in range(2):
+            assert not await utils.is_task_coming_from_pr(
+                _get_context(), "task", owner, "repo", 5
+            )
+
+    assert github.return_value.builds.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_is_task_coming_from_pr_cache_expires():
+    owner = str(uuid.uuid4())
+    github = _paged_builds([["group-of-task"]])
+    context = _get_context()
+    context.config["provenance_cache_ttl"] = 0
+
+    with patch("taskcluster.aio.Queue", _task_queue()), patch(
+        "taskcluster.aio.Github", github
+    ):
+        for _ in range(2):
+            assert await utils.is_task_coming_from_pr(
+                context, "task", owner, "repo", 5
+            )
+
+    assert github.return_value.builds.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_is_task_coming_from_pr_caches_are_bounded(monkeypatch):
+    monkeypatch.setattr(utils, "_task_group_ids", {})
+    monkeypatch.setattr(utils, "_pr_builds", {})
+    monkeypatch.setattr(utils, "_MAX_TASK_GROUP_IDS", 2)
+    github = _paged_builds([["group-of-task-1", "group-of-task-2", "group-of-task-3"]])
+    context = _get_context()
+    context.config["provenance_cache_ttl"] = 0
+
+    with patch("taskcluster.aio.Queue", _task_queue()), patch(
+        "taskcluster.aio.Github", github
+    ):
+        for pr_number, task_id in enumerate(("task-1", "task-2", "task-3")):
+            assert await utils.is_task_coming_from_pr(
+                context, task_id, "owner", "repo", pr_number
+            )
+
+    assert list(utils._task_group_ids) == ["task-2", "task-3"]
+    # The builds of the earlier PRs expired and were dropped.
+    assert list(utils._pr_builds) == [("owner", "repo", 2)]
@@ -1,2 +1,22 @@
 unset VIRTUAL_ENV
+SOCKET=${SCRIPT_SOCKET:-/tmp/publishscript.sock}
+
+if [ "$1" = "--serve" ]; then
+    exec uv run -p 3.13 python -m publishscript.daemon "$SOCKET"
+fi
+
+# Hand the task to the resident daemon when it's up, it streams the task's
+# logs back and ends with the exit code.
+if [ -S "$SOCKET" ] && curl -sf --unix-socket "$SOCKET" http://localhost/health > /dev/null; then
+    exit_code=1
+    while IFS= read -r line; do
+        case "$line" in
+            ::exit-code::*) exit_code=${line#::exit-code::} ;;
+            *) echo "$line" ;;
+        esac
+    done < <(curl -sN --unix-socket "$SOCKET" -H "Content-Type: application/json" \
+        -d "{\"config\": \"$(realpath "$1")\"}" http://localhost/run)
+    exit "$exit_code"
+fi
+
 uv run -p 3.13 python -m publishscript $@
@@ -1,12 +1,15 @@
-import base64
 from .scopes import extract_target_repo_from_scopes
 from .publish import publish
-from simple_github import AppClient
 
 
 async def async_main(context):
+    from . import metrics
+    from .transport import get_session
+
+    # Route every HTTP call of the task, including the Taskcluster clients
+    # bound to `context.session`, through the pooled transport.
+    context.session = get_session(context.config)
     task_scopes = context.task["scopes"]
-    config = context.config
 
     target_repo = extract_target_repo_from_scopes(task_scopes, context)
     owner, repo = target_repo.split("/", 1)
@@ -16,11 +19,10 @@ async def async_main(context):
         "repo": repo,
     }
 
-    async with AppClient(
-        config["github"]["app_id"],
-        base64.b64decode(config["github"]["private_key"]),
-        owner,
-        repositories=[repo],
-    ) as github:
-        context.github = github
-        await publish(context)
+    with metrics.collect(context.config.get("metrics_textfile")):
+        from .github_auth import get_github_client
+
+        async with get_github_client(context, owner, repo) as github:
+            context.github = github
+            with metrics.action("publish"):
+                await publish(context)
@@ -1,4 +1,3 @@
-import scriptworker.client
 import os
 
 from . import async_main
@@ -14,14 +13,33 @@ def get_default_config(base_dir=None):
             os.path.dirname(__file__), "data", "task_schema.json"
         ),
         "taskcluster_root_url": os.environ["TASKCLUSTER_ROOT_URL"],
+        "artifact_cache_dir": "/home/worker/artifact-cache",
+        "artifact_cache_max_size": 1024 * 1024 * 1024,
+        "github_token_cache": "/home/worker/github-tokens.json",
+        "metrics_textfile": "/home/worker/metrics/publishscript.prom",
+        "repo_clone_filter": "blob:none",
+        "repo_sparse_paths": ["meta"],
+        "publish_engine": "git",
     }
 
     return default_config
 
 
+async def _run_once(context):
+    from .transport import close_session
+
+    # Nothing will reuse the pooled connections once this process exits.
+    try:
+        await async_main(context)
+    finally:
+        await close_session()
+
+
 def main(config_path=None):
+    import scriptworker.client
+
     return scriptworker.client.sync_main(
-        async_main, config_path=config_path, default_config=get_default_config()
+        _run_once, config_path=config_path, default_config=get_default_config()
     )
 
 
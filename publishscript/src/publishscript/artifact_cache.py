@@ -0,0 +1,139 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Artifacts of a run can't change anymore once it reached one of these states.
+RESOLVED_STATES = frozenset(("completed", "failed", "exception"))
+
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+
+class ArtifactCache:
+    """Content-addressed on-disk cache for artifacts of resolved task runs.
+
+    Entries are keyed by (task_id, run_id, name) and point to a blob named
+    after the sha256 of its contents, so identical artifacts are only stored
+    once. Blobs are evicted least recently used first once the total size
+    goes over `max_size`, a hit refreshes the blob's mtime. The keys left
+    pointing to evicted blobs go with them.
+
+    Every write goes through a rename so several workers can share the same
+    directory.
+    """
+
+    def __init__(self, root, max_size=DEFAULT_MAX_SIZE):
+        self.root = root
+        self.max_size = max_size
+        self._blobs_dir = os.path.join(root, "blobs")
+        self._keys_dir = os.path.join(root, "keys")
+        self._tmp_dir = os.path.join(root, "tmp")
+        for path in (self._blobs_dir, self._keys_dir, self._tmp_dir):
+            os.makedirs(path, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config):
+        """Build the cache from `artifact_cache_dir`, None when not configured."""
+        root = config.get("artifact_cache_dir")
+        if not root:
+            return None
+        return cls(root, config.get("artifact_cache_max_size", DEFAULT_MAX_SIZE))
+
+    def _key_path(self, task_id, run_id, name):
+        key = hashlib.sha256(f"{task_id}/{run_id}/{name}".encode()).hexdigest()
+        return os.path.join(self._keys_dir, key)
+
+    def open(self, task_id, run_id, name):
+        """Return a binary file object for a cached artifact, or None on a miss."""
+        key_path = self._key_path(task_id, run_id, name)
+        try:
+            with open(key_path) as fd:
+                digest = fd.read().strip()
+            blob_path = os.path.join(self._blobs_dir, digest)
+            fileobj = open(blob_path, "rb")
+        except FileNotFoundError:
+            logger.debug("Artifact cache miss for %s/%s/%s", task_id, run_id, name)
+            metrics.inc("artifact_cache_requests_total", result="miss")
+            # The blob may have been evicted, drop the dangling key with it.
+            try:
+                os.unlink(key_path)
+            except FileNotFoundError:
+                pass
+            return None
+
+        # Through the file, the blob may have been evicted since it was opened.
+        os.utime(fileobj.fileno())
+        logger.debug("Artifact cache hit for %s/%s/%s", task_id, run_id, name)
+        metrics.inc("artifact_cache_requests_total", result="hit")
+        return fileobj
+
+    def tempfile(self):
+        """Return a named temporary file on the cache's filesystem, to be
+        handed to `store`."""
+        return tempfile.NamedTemporaryFile(dir=self._tmp_dir, delete=False)
+
+    def store(self, task_id, run_id, name, src_path):
+        """Move `src_path` into the cache under the given key."""
+        size = os.path.getsize(src_path)
+        if size > self.max_size:
+            os.unlink(src_path)
+            return
+
+        digest = hashlib.sha256()
+        with open(src_path, "rb") as fd:
+            for chunk in iter(lambda: fd.read(1024 * 1024), b""):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+
+        os.replace(src_path, os.path.join(self._blobs_dir, digest))
+
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self._tmp_dir, delete=False
+        ) as key_file:
+            key_file.write(digest)
+        os.replace(key_file.name, self._key_path(task_id, run_id, name))
+
+        self._evict(keep=digest)
+
+    def _evict(self, keep):
+        blobs = []
+        total = 0
+        for entry in os.scandir(self._blobs_dir):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            blobs.append((stat.st_mtime, stat.st_size, entry.name))
+            total += stat.st_size
+
+        evicted = False
+        for _, size, name in sorted(blobs):
+            if total <= self.max_size:
+                break
+            if name == keep:
+                continue
+            try:
+                os.unlink(os.path.join(self._blobs_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted = True
+            logger.debug("Evicted artifact blob %s from cache", name)
+
+        if evicted:
+            self._prune_keys()
+
+    def _prune_keys(self):
+        for entry in os.scandir(self._keys_dir):
+            try:
+                with open(entry.path) as fd:
+                    digest = fd.read().strip()
+                if os.path.exists(os.path.join(self._blobs_dir, digest)):
+                    continue
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                continue
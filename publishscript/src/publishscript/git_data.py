@@ -0,0 +1,150 @@
+"""Read files and create commits through GitHub's Git Data API, no clone needed."""
+import asyncio
+import base64
+import logging
+from urllib.parse import quote
+
+from .timings import timed
+from .unidiff import PatchError
+
+logger = logging.getLogger(__name__)
+
+COMMITTER = {"name": "Taskcluster", "email": "eijebong+taskcluster@bananium.fr"}
+
+# Commits GitHub just created, like merges, can take a moment to be readable.
+COMMIT_RETRY_ATTEMPTS = 5
+COMMIT_RETRY_BASE_DELAY = 0.5
+
+
+async def _read_file(github, owner, repo, ref, path):
+    with timed("http", "contents", path=path):
+        async with await github.get(
+            f"/repos/{owner}/{repo}/contents/{quote(path)}", params={"ref": ref}
+        ) as response:
+            if response.status == 404:
+                return None
+            response.raise_for_status()
+            entry = await response.json()
+
+    if isinstance(entry, list) or entry.get("type") != "file":
+        raise PatchError(f"{path} isn't a file")
+
+    if entry.get("encoding") == "base64":
+        raw = base64.b64decode(entry["content"])
+    else:
+        # Files over 1MB don't have their content inlined.
+        with timed("http", "get_blob", path=path):
+            async with await github.get(
+                f"/repos/{owner}/{repo}/git/blobs/{entry['sha']}"
+            ) as response:
+                response.raise_for_status()
+                raw = base64.b64decode((await response.json())["content"])
+
+    try:
+        return raw.decode()
+    except UnicodeDecodeError:
+        raise PatchError(f"{path} isn't a text file")
+
+
+async def read_files(github, owner, repo, ref, paths):
+    """Return the content of `paths` at `ref`, None for missing ones.
+
+    The contents API answers 404 for missing refs too, `ref` has to be a
+    commit `get_tree` found first.
+    """
+    contents = await asyncio.gather(
+        *(_read_file(github, owner, repo, ref, path) for path in paths)
+    )
+    return dict(zip(paths, contents))
+
+
+async def _post(github, query, data):
+    # Named after the object created, blobs, trees or commits.
+    with timed("http", f"create_{query.rsplit('/', 1)[-1]}"):
+        response = await github.post(query, data=data)
+        response.raise_for_status()
+        return await response.json()
+
+
+async def _create_blob(github, owner, repo, content):
+    blob = await _post(
+        github,
+        f"/repos/{owner}/{repo}/git/blobs",
+        {"content": base64.b64encode(content.encode()).decode(), "encoding": "base64"},
+    )
+    return blob["sha"]
+
+
+async def get_tree(github, owner, repo, commit_sha):
+    """Return the tree of `commit_sha`, waiting for the commit to show up
+    when GitHub doesn't know about it yet."""
+    for attempt in range(COMMIT_RETRY_ATTEMPTS):
+        with timed("http", "get_commit"):
+            async with await github.get(
+                f"/repos/{owner}/{repo}/git/commits/{commit_sha}"
+            ) as response:
+                if response.status != 404 or attempt == COMMIT_RETRY_ATTEMPTS - 1:
+                    response.raise_for_status()
+                    return (await response.json())["tree"]["sha"]
+        logger.info("Commit %s isn't there yet, retrying", commit_sha)
+        await asyncio.sleep(COMMIT_RETRY_BASE_DELAY * 2**attempt)
+
+
+async def commit_changes(github, owner, repo, parent, parent_tree, changes, message):
+    """Commit `changes`, a path to content mapping where None deletes the
+    file, on top of `parent`.
+
+    Return the new commit and its tree, `parent` and its tree when the changes
+    don't change anything.
+    """
+    paths = list(changes)
+    blobs = await asyncio.gather(
+        *(
+            _create_blob(github, owner, repo, changes[path])
+            for path in paths
+            if changes[path] is not None
+        )
+    )
+    blobs = iter(blobs)
+    tree = await _post(
+        github,
+        f"/repos/{owner}/{repo}/git/trees",
+        {
+            "base_tree": parent_tree,
+            "tree": [
+                {
+                    "path": path,
+                    "mode": "100644",
+                    "type": "blob",
+                    "sha": None if changes[path] is None else next(blobs),
+                }
+                for path in paths
+            ],
+        },
+    )
+    if tree["sha"] == parent_tree:
+        logger.info("%s doesn't change anything, skipping it", message)
+        return parent, parent_tree
+
+    commit = await _post(
+        github,
+        f"/repos/{owner}/{repo}/git/commits",
+        {
+            "message": message,
+            "tree": tree["sha"],
+            "parents": [parent],
+            "author": COMMITTER,
+            "committer": COMMITTER,
+        },
+    )
+    return commit["sha"], tree["sha"]
+
+
+async def fast_forward(github, owner, repo, branch, sha):
+    """Move `branch` to `sha`, failing when it isn't a fast-forward."""
+    with timed("http", "update_ref"):
+        response = await github.patch(
+            f"/repos/{owner}/{repo}/git/refs/heads/{branch}",
+            data={"sha": sha, "force": False},
+        )
+        response.raise_for_status()
@@ -0,0 +1,234 @@
+"""GitHub App installation tokens shared by every task running on a worker.
+
+Minting an installation token takes a JWT signature plus one or two round
+trips to GitHub. Tokens are valid for an hour, so they're kept in a file that
+outlives the task and reused by the next tasks asking for the same app, owner
+and repositories.
+"""
+import asyncio
+import base64
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import time
+import weakref
+from datetime import datetime
+
+from scriptworker.exceptions import TaskVerificationError
+from simple_github.auth import AppAuth, Auth
+
+from .github_client import GITHUB_API_URL, GithubClient
+from .rate_limit import RateLimitedGithub
+from .transport import get_session
+
+logger = logging.getLogger(__name__)
+
+# Tokens are refreshed when they have less than this many seconds left. It has
+# to cover a whole task since tokens also end up in git remotes.
+DEFAULT_REFRESH_MARGIN = 20 * 60
+
+# event loop -> {cache path: asyncio.Lock}
+_mint_locks = weakref.WeakKeyDictionary()
+
+
+@contextlib.contextmanager
+def _locked_cache(path):
+    """Yield the entries of the cache file at `path` while holding its lock.
+
+    Whatever the caller leaves in the yielded dict is written back.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    with os.fdopen(fd, "r+") as fileobj:
+        # Tokens are credentials, make sure nobody else can read them even if
+        # the file was created by something else.
+        os.fchmod(fd, 0o600)
+        fcntl.flock(fileobj, fcntl.LOCK_EX)
+        try:
+            content = fileobj.read()
+            try:
+                entries = json.loads(content) if content else {}
+            except json.JSONDecodeError:
+                logger.warning("Ignoring corrupted token cache %s", path)
+                entries = {}
+
+            yield entries
+
+            fileobj.seek(0)
+            fileobj.truncate()
+            json.dump(entries, fileobj)
+        finally:
+            fcntl.flock(fileobj, fcntl.LOCK_UN)
+
+
+def _mint_lock(path):
+    """Return the lock the tasks of the running event loop take before
+    minting a token for the cache file at `path`."""
+    locks = _mint_locks.setdefault(asyncio.get_running_loop(), {})
+    return locks.setdefault(path, asyncio.Lock())
+
+
+class CachedInstallationAuth(Auth):
+    """Installation token authentication backed by an on-disk token cache.
+
+    Tokens are keyed on (app_id, owner, repositories) and reused across tasks
+    until they get within `refresh_margin` seconds of their expiry. Tasks of
+    the same process wait for each other's minting so they don't all go and
+    mint their own. The cache file itself is only locked while it's read or
+    written, never while waiting on GitHub: other processes may mint the same
+    token meanwhile, the last one written wins. Without a `cache_path`,
+    tokens are only kept in memory.
+
+    Tokens are minted through `session` against `base_url`.
+    """
+
+    def __init__(
+        self,
+        app_id,
+        privkey,
+        owner,
+        repositories,
+        cache_path,
+        refresh_margin=DEFAULT_REFRESH_MARGIN,
+        session=None,
+        base_url=GITHUB_API_URL,
+    ):
+        self.app = AppAuth(app_id, privkey)
+        self.owner = owner
+        self.repositories = sorted(repositories)
+        self.cache_path = cache_path
+        self.refresh_margin = refresh_margin
+        self.session = session
+        self.base_url = base_url
+        self._installation_key = f"{app_id}:{owner}"
+        self._token_key = f"{app_id}:{owner}:{','.join(self.repositories)}"
+        self._token = None
+        self._expires_at = 0
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self, expires_at):
+        return expires_at - time.time() > self.refresh_margin
+
+    async def get_token(self):
+        async with self._lock:
+            if self._token is not None and self._is_fresh(self._expires_at):
+                return self._token
+
+            if self.cache_path is None:
+                _, entry = await self._mint(None)
+                self._token = entry["token"]
+                self._expires_at = entry["expires_at"]
+                return self._token
+
+            async with _mint_lock(self.cache_path):
+                with _locked_cache(self.cache_path) as entries:
+                    entry = entries.get("tokens", {}).get(self._token_key)
+                    installation_id = entries.get("installations", {}).get(
+                        self._installation_key
+                    )
+
+                if entry is None or not self._is_fresh(entry["expires_at"]):
+                    installation_id, entry = await self._mint(installation_id)
+                    with _locked_cache(self.cache_path) as entries:
+                        entries.setdefault("installations", {})[
+                            self._installation_key
+                        ] = installation_id
+                        tokens = entries.setdefault("tokens", {})
+                        tokens[self._token_key] = entry
+
+                        # Don't let the file grow with tokens nobody can use
+                        # anymore.
+                        now = time.time()
+                        for key in [
+                            k for k, v in tokens.items() if v["expires_at"] <= now
+                        ]:
+                            del tokens[key]
+                else:
+                    logger.debug("Reusing cached installation token")
+
+            self._token = entry["token"]
+            self._expires_at = entry["expires_at"]
+            return self._token
+
+    async def _mint(self, installation_id):
+        async with GithubClient(self.session, self.app, self.base_url) as client:
+            cached = installation_id is not None
+            if not cached:
+                installation_id = await self._get_installation_id(client)
+
+            response = await self._create_token(client, installation_id)
+            if response.status == 404 and cached:
+                # Reinstalling the app gives it a new installation ID.
+                logger.info(
+                    "Installation %s of %s is gone, looking it up again",
+                    installation_id,
+                    self.owner,
+                )
+                response.release()
+                installation_id = await self._get_installation_id(client)
+                response = await self._create_token(client, installation_id)
+            response.raise_for_status()
+            result = await response.json()
+
+        logger.info(
+            "Minted installation token for %s, expires at %s",
+            self._token_key,
+            result["expires_at"],
+        )
+        expires_at = datetime.fromisoformat(result["expires_at"]).timestamp()
+        return installation_id, {"token": result["token"], "expires_at": expires_at}
+
+    async def _create_token(self, client, installation_id):
+        data = {}
+        if self.repositories:
+            data["repositories"] = self.repositories
+        return await client.post(
+            f"/app/installations/{installation_id}/access_tokens", data=data
+        )
+
+    async def _get_installation_id(self, client):
+        async with await client.get("/app/installations") as response:
+            response.raise_for_status()
+            installations = await response.json()
+
+        for installation in installations:
+            if installation["account"].get("login") == self.owner:
+                return installation["id"]
+
+        raise TaskVerificationError(
+            f"GitHub App {self.app.id} is not installed for {self.owner}"
+        )
+
+
+def get_github_client(context, owner, repo):
+    """Return a GitHub client authenticated as the app's installation on
+    `owner`, restricted to `repo`.
+
+    Installation tokens are shared across tasks when `github_token_cache` is
+    configured, see `CachedInstallationAuth`. Requests are scheduled around
+    the API's rate limits, along with the other tasks' requests to the same
+    installation, see `RateLimitedGithub`. `github.api_url` overrides
+    the API's base URL.
+    """
+    config = context.config
+    session = get_session(config)
+    base_url = config["github"].get("api_url", GITHUB_API_URL)
+    app_id = config["github"]["app_id"]
+
+    auth = CachedInstallationAuth(
+        app_id,
+        base64.b64decode(config["github"]["private_key"]),
+        owner,
+        [repo],
+        config.get("github_token_cache"),
+        refresh_margin=config.get(
+            "github_token_refresh_margin", DEFAULT_REFRESH_MARGIN
+        ),
+        session=session,
+        base_url=base_url,
+    )
+    # The rate limit is the installation's, whatever the token's repositories.
+    return RateLimitedGithub.from_config(
+        GithubClient(session, auth, base_url), config, f"{app_id}:{owner}"
+    )
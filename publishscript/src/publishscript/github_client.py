@@ -0,0 +1,89 @@
+"""Client for GitHub's REST API that goes through the shared transport."""
+import asyncio
+import logging
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+GITHUB_API_URL = "https://api.github.com"
+
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.5
+# Retrying anything else could create a comment or merge a PR twice.
+RETRY_METHODS = frozenset(("GET", "HEAD"))
+
+
+class GithubClient:
+    """Stand-in for the parts of simple_github's AsyncClient we use.
+
+    simple_github builds a session of its own for every client, this one
+    sends its requests through `session` so they share the pooled connections
+    with everything else. Server errors and connection failures of GET and
+    HEAD requests are retried with an exponential backoff, other requests
+    aren't retried at all.
+    """
+
+    def __init__(self, session, auth, base_url=GITHUB_API_URL):
+        self.session = session
+        self.auth = auth
+        self.base_url = base_url.rstrip("/")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *excinfo):
+        await self.close()
+
+    async def close(self):
+        # The session is shared, only the auth belongs to this client.
+        await self.auth.close()
+
+    async def get_token(self):
+        return await self.auth.get_token()
+
+    async def request(self, method, query, **kwargs):
+        # Pagination links are absolute already.
+        if query.startswith(("http://", "https://")):
+            url = query
+        else:
+            url = f"{self.base_url}/{query.lstrip('/')}"
+        headers = {"Accept": "application/vnd.github+json"}
+        headers.update(kwargs.pop("headers", {}))
+        token = await self.auth.get_token()
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+
+        attempts = RETRY_ATTEMPTS if method.upper() in RETRY_METHODS else 1
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            try:
+                response = await self.session.request(
+                    method, url, headers=headers, **kwargs
+                )
+            except aiohttp.ClientConnectionError:
+                if last_attempt:
+                    raise
+                logger.debug("%s %s failed, retrying", method, url, exc_info=True)
+            else:
+                if response.status < 500 or last_attempt:
+                    return response
+                logger.debug("%s %s returned %s, retrying", method, url, response.status)
+                response.release()
+            await asyncio.sleep(RETRY_BASE_DELAY * 2**attempt)
+
+    async def get(self, query, **kwargs):
+        return await self.request("GET", query, **kwargs)
+
+    async def post(self, query, data=None, **kwargs):
+        return await self.request("POST", query, json=data, **kwargs)
+
+    async def put(self, query, data=None, **kwargs):
+        return await self.request("PUT", query, json=data, **kwargs)
+
+    async def patch(self, query, data=None, **kwargs):
+        return await self.request("PATCH", query, json=data, **kwargs)
+
+    async def delete(self, query, data=None, **kwargs):
+        response = await self.request("DELETE", query, json=data, **kwargs)
+        response.release()
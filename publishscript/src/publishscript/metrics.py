@@ -0,0 +1,232 @@
+"""Count and time the work of the tasks run on a worker, for Prometheus.
+
+`collect` gathers the samples recorded with `inc`, `observe` and `set_gauge`
+while it's active, in the current task and in the ones it starts. When it's
+done, it adds them to the samples of the previous tasks and writes them all in
+Prometheus' text format to `metrics_textfile`, for node-exporter's textfile
+collector to export. Every instance of a worker, and its daemon, share that
+file: tasks merge their samples in under a lock, next to it.
+"""
+import contextlib
+import contextvars
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+# Metric names are prefixed with the script's name, githubscript_ or
+# publishscript_.
+PREFIX = __name__.split(".")[0]
+
+# Seconds, from quick API calls to the slowest publishes.
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_metrics = contextvars.ContextVar("metrics", default=None)
+
+
+def _series(name, labels):
+    # Label values are strings in Prometheus, and have to sort together.
+    labels = sorted((key, str(value)) for key, value in labels.items())
+    return json.dumps([f"{PREFIX}_{name}", labels])
+
+
+class Metrics:
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        series = _series(name, labels)
+        self.counters[series] = self.counters.get(series, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        self.gauges[_series(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        series = _series(name, labels)
+        histogram = self.histograms.setdefault(
+            series, {"buckets": [0] * len(BUCKETS), "sum": 0, "count": 0}
+        )
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+                break
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+    def merge(self, state):
+        """Add these samples to `state`, the ones of the previous tasks."""
+        counters = state.setdefault("counters", {})
+        for series, value in self.counters.items():
+            counters[series] = counters.get(series, 0) + value
+
+        state.setdefault("gauges", {}).update(self.gauges)
+
+        histograms = state.setdefault("histograms", {})
+        for series, histogram in self.histograms.items():
+            previous = histograms.get(series)
+            # Buckets that changed since restart from scratch.
+            if previous is None or len(previous["buckets"]) != len(BUCKETS):
+                histograms[series] = histogram
+                continue
+            previous["buckets"] = [
+                a + b for a, b in zip(previous["buckets"], histogram["buckets"])
+            ]
+            previous["sum"] += histogram["sum"]
+            previous["count"] += histogram["count"]
+        return state
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(name, labels, value):
+    if labels:
+        labels = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+        name = f"{name}{{{labels}}}"
+    return f"{name} {value}"
+
+
+def render(state):
+    """Render `state` in Prometheus' text exposition format."""
+    families = {}
+    for kind in ("counters", "gauges", "histograms"):
+        for series, value in state.get(kind, {}).items():
+            name, labels = json.loads(series)
+            families.setdefault(name, (kind, []))[1].append((labels, value))
+
+    lines = []
+    for name, (kind, samples) in sorted(families.items()):
+        lines.append(f"# TYPE {name} {kind[:-1]}")
+        for labels, value in sorted(samples, key=lambda s: json.dumps(s[0])):
+            if kind != "histograms":
+                lines.append(_format(name, labels, value))
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, value["buckets"]):
+                cumulative += count
+                lines.append(
+                    _format(f"{name}_bucket", labels + [["le", bound]], cumulative)
+                )
+            lines.append(
+                _format(f"{name}_bucket", labels + [["le", "+Inf"]], value["count"])
+            )
+            lines.append(_format(f"{name}_sum", labels, value["sum"]))
+            lines.append(_format(f"{name}_count", labels, value["count"]))
+    return "".join(f"{line}\n" for line in lines)
+
+
+def _replace(path, content):
+    # node-exporter must never see a partially written file.
+    with tempfile.NamedTemporaryFile(
+        "w", dir=os.path.dirname(path), suffix=".tmp", delete=False
+    ) as fd:
+        fd.write(content)
+    os.replace(fd.name, path)
+
+
+def write(path, metrics):
+    """Merge `metrics` into the state kept next to the textfile at `path`
+    and render it there."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    state_path = f"{path}.json"
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(state_path) as fd:
+                state = json.load(fd)
+        except (FileNotFoundError, ValueError):
+            state = {}
+        metrics.merge(state)
+        # A state that can't be rendered must not be kept.
+        content = render(state)
+        _replace(state_path, json.dumps(state))
+        _replace(path, content)
+
+
+def inc(name, value=1, **labels):
+    """Add `value` to a counter, when metrics are being collected."""
+    metrics = _metrics.get()
+    if metrics is not None:
+        metrics.inc(name, value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    """Set a gauge, when metrics are being collected."""
+    metrics = _metrics.get()
+    if metrics is not None:
+        metrics.set_gauge(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    """Add `value` to a histogram, when metrics are being collected."""
+    metrics = _metrics.get()
+    if metrics is not None:
+        metrics.observe(name, value, **labels)
+
+
+@contextlib.contextmanager
+def action(name):
+    """Count the block in `tasks_total` and time it in
+    `action_duration_seconds`, labelled with the action `name`."""
+    start = time.monotonic()
+    result = "failure"
+    try:
+        yield
+        result = "success"
+    finally:
+        observe("action_duration_seconds", time.monotonic() - start, action=name)
+        inc("tasks_total", action=name, result=result)
+
+
+@contextlib.contextmanager
+def collect(path):
+    """Collect the metrics of the block, written to the textfile at `path`
+    when it's set, whether the block succeeds or not."""
+    metrics = Metrics()
+    token = _metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _metrics.reset(token)
+        if path:
+            try:
+                write(path, metrics)
+            except Exception:
+                # Metrics aren't worth failing a task for.
+                logger.warning("Couldn't write metrics to %s", path, exc_info=True)
+
+
+async def _on_request_start(session, ctx, params):
+    ctx.start = time.monotonic()
+
+
+async def _on_request_end(session, ctx, params):
+    host = params.url.host
+    observe("http_request_duration_seconds", time.monotonic() - ctx.start, host=host)
+    inc("http_requests_total", host=host, code=str(params.response.status))
+
+
+async def _on_request_exception(session, ctx, params):
+    host = params.url.host
+    observe("http_request_duration_seconds", time.monotonic() - ctx.start, host=host)
+    inc("http_requests_total", host=host, code="error")
+
+
+def trace_config():
+    """TraceConfig timing every request in `http_request_duration_seconds`
+    and counting them per status in `http_requests_total`, by host."""
+    import aiohttp
+
+    config = aiohttp.TraceConfig(trace_config_ctx_factory=SimpleNamespace)
+    config.on_request_start.append(_on_request_start)
+    config.on_request_end.append(_on_request_end)
+    config.on_request_exception.append(_on_request_exception)
+    return config
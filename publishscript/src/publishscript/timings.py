@@ -0,0 +1,91 @@
+"""Time the phases of a task and the calls it makes, for the timings artifact.
+
+`collect` gathers the spans recorded with `timed` while it's active, in the
+current task and in the ones it starts, and writes them to
+`public/logs/timings.json` under the artifact dir.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import time
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+TIMINGS_ARTIFACT = os.path.join("public", "logs", "timings.json")
+
+_timings = contextvars.ContextVar("timings", default=None)
+
+
+class Timings:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.spans = []
+
+    @contextlib.contextmanager
+    def span(self, kind, name, **attrs):
+        start = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            duration = time.monotonic() - start
+            logger.debug("%s %s took %.3fs", kind, name, duration)
+            if kind == "phase":
+                metrics.observe("publish_phase_duration_seconds", duration, phase=name)
+            self.spans.append(
+                {
+                    "kind": kind,
+                    "name": name,
+                    "start": round(start - self.started, 6),
+                    "duration": round(duration, 6),
+                    "ok": ok,
+                    **attrs,
+                }
+            )
+
+    def as_dict(self):
+        return {
+            "duration": round(time.monotonic() - self.started, 6),
+            "spans": self.spans,
+        }
+
+
+@contextlib.contextmanager
+def timed(kind, name, **attrs):
+    """Record how long the block takes, when timings are being collected.
+
+    `kind` groups spans, "phase" for the steps of the task and "git",
+    "patch" or "http" for the calls made during them.
+    """
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    with timings.span(kind, name, **attrs):
+        yield
+
+
+@contextlib.contextmanager
+def collect(artifact_dir):
+    """Collect the timings of the block, written as an artifact when
+    `artifact_dir` is set, whether the block succeeds or not."""
+    timings = Timings()
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+        if artifact_dir:
+            path = os.path.join(artifact_dir, TIMINGS_ARTIFACT)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w") as fd:
+                    json.dump(timings.as_dict(), fd, indent=2)
+            except Exception:
+                # Timings aren't worth failing a task for, or hiding its error.
+                logger.warning("Couldn't write timings to %s", path, exc_info=True)
@@ -0,0 +1,174 @@
+"""Apply unified diffs to file contents in memory, like `patch -p1` would."""
+import re
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class PatchError(Exception):
+    """The patch can't be parsed or doesn't apply."""
+
+
+class FilePatch:
+    """Hunks of a patch touching one file.
+
+    `old_path` is None for files created by the patch, `new_path` is None for
+    files it deletes. Each hunk is a (old start line, old lines, new lines,
+    leading context, trailing context) tuple, lines keep their line endings.
+    """
+
+    def __init__(self, old_path, new_path):
+        self.old_path = old_path
+        self.new_path = new_path
+        self.hunks = []
+
+    @property
+    def path(self):
+        return self.new_path or self.old_path
+
+
+def _strip_path(header):
+    # Drop the timestamp diff -u puts after the path.
+    path = header.split("\t", 1)[0].strip()
+    if path == "/dev/null":
+        return None
+    if "/" not in path:
+        raise PatchError(f"Can't strip a component from {path}")
+    return path.split("/", 1)[1]
+
+
+def _parse_hunk(lines, i, header):
+    old_start = int(header.group(1))
+    old_count = int(header.group(2) or 1)
+    new_count = int(header.group(4) or 1)
+
+    old, new = [], []
+    tags = []
+    last = None
+    while i < len(lines) and (len(old) < old_count or len(new) < new_count):
+        line = lines[i]
+        i += 1
+        if line.startswith("\\"):
+            # "\ No newline at end of file" applies to the previous line.
+            for side in last:
+                side[-1] = side[-1].rstrip("\r\n")
+            continue
+        # diff(1) writes empty context lines without their leading space.
+        tag, text = (line[0], line[1:]) if line.strip("\r\n") else (" ", line)
+        if tag == " ":
+            last = (old, new)
+        elif tag == "-":
+            last = (old,)
+        elif tag == "+":
+            last = (new,)
+        else:
+            raise PatchError(f"Unexpected line in hunk: {line!r}")
+        for side in last:
+            side.append(text)
+        tags.append(tag)
+
+    if len(old) != old_count or len(new) != new_count:
+        raise PatchError("Truncated hunk")
+    if i < len(lines) and lines[i].startswith("\\"):
+        for side in last:
+            side[-1] = side[-1].rstrip("\r\n")
+        i += 1
+
+    leading = len(tags) - len("".join(tags).lstrip(" "))
+    trailing = len(tags) - len("".join(tags).rstrip(" "))
+    return (old_start, old, new, leading, trailing), i
+
+
+def parse_patch(text):
+    """Return the `FilePatch`es of a unified diff."""
+    lines = text.splitlines(keepends=True)
+    patches = []
+    current = None
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith(("Binary files ", "GIT binary patch", "rename from ")):
+            raise PatchError(f"Unsupported patch content: {line.strip()}")
+        if line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            current = FilePatch(_strip_path(line[4:]), _strip_path(lines[i + 1][4:]))
+            patches.append(current)
+            i += 2
+            continue
+        header = HUNK_HEADER.match(line)
+        if header:
+            if current is None:
+                raise PatchError("Hunk without a file header")
+            hunk, i = _parse_hunk(lines, i + 1, header)
+            current.hunks.append(hunk)
+            continue
+        # Anything else is noise, `diff --git`, `index`, mode lines...
+        i += 1
+    return patches
+
+
+def _find(lines, needle, expected, start, at_start, at_end):
+    """Index closest to `expected`, not before `start`, where `needle` is.
+
+    `at_start` and `at_end` anchor it to the beginning or the end of `lines`.
+    """
+    size = len(needle)
+    last = len(lines) - size
+    if at_start or at_end:
+        pos = 0 if at_start else last
+        if start <= pos and lines[pos : pos + size] == needle:
+            return pos
+        return None
+    for distance in range(max(expected - start, last - expected) + 1):
+        for pos in (expected - distance, expected + distance):
+            if start <= pos <= last and lines[pos : pos + size] == needle:
+                return pos
+    return None
+
+
+def apply_file_patch(content, file_patch):
+    """Return `content` with `file_patch` applied, None if it deletes the file.
+
+    Hunks are looked for around where they say they are, but their context
+    has to match exactly. Like patch, hunks with less context on one side
+    than on the other must be at the corresponding end of the file.
+    """
+    if file_patch.old_path is None and content is not None:
+        raise PatchError(f"{file_patch.path} already exists")
+    if file_patch.old_path is not None and content is None:
+        raise PatchError(f"{file_patch.path} doesn't exist")
+
+    lines = content.splitlines(keepends=True) if content else []
+    result = []
+    position = 0
+    offset = 0
+    for old_start, old, new, leading, trailing in file_patch.hunks:
+        if old_start == 0 and lines:
+            raise PatchError(f"{file_patch.path} was expected to be empty")
+        # Hunks adding to an empty file start at line 0.
+        expected = max(old_start - 1, 0) + offset
+        found = _find(
+            lines,
+            old,
+            expected,
+            position,
+            at_start=leading < trailing,
+            at_end=trailing < leading,
+        )
+        if found is None:
+            raise PatchError(
+                f"Hunk at line {old_start} of {file_patch.path} doesn't apply"
+            )
+        offset = found - (old_start - 1) if old_start else found
+        result.extend(lines[position:found])
+        position = found + len(old)
+        if new and not new[-1].endswith("\n") and position < len(lines):
+            # Only the end of the file can lack a newline, patch keeps it
+            # when the hunk lands anywhere else.
+            new = [*new[:-1], new[-1] + "\n"]
+        result.extend(new)
+    result.extend(lines[position:])
+
+    if file_patch.new_path is None:
+        if result:
+            raise PatchError(f"{file_patch.path} isn't empty after its deletion")
+        return None
+    return "".join(result)
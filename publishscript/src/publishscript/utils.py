@@ -1,9 +1,63 @@
-from taskcluster import Github, Queue
+import asyncio
 import os
+import time
 
+DEFAULT_PROVENANCE_CACHE_TTL = 300
 
-def is_task_coming_from_pr(context, task_id, owner, repo, pr_number):
-    tc_config = {
+# A task's group never changes, so this one doesn't need to expire, only to
+# forget the oldest tasks once it's full.
+_task_group_ids = {}
+_MAX_TASK_GROUP_IDS = 1024
+# (owner, repo, pr_number) -> _PullRequestBuilds
+_pr_builds = {}
+
+
+class _PullRequestBuilds:
+    """Task group IDs of the Taskcluster GitHub builds seen so far for a PR.
+
+    Pages of builds are only fetched until the task group we're looking for
+    shows up, the continuation token is kept so a later lookup for another
+    group resumes where the previous one stopped.
+    """
+
+    def __init__(self, ttl):
+        self.lock = asyncio.Lock()
+        self.reset(ttl)
+
+    def reset(self, ttl):
+        self.task_group_ids = set()
+        self.continuation_token = None
+        self.exhausted = False
+        self.expires_at = time.monotonic() + ttl
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    async def find(self, gh, owner, repo, pr_number, task_group_id):
+        while not self.exhausted:
+            query = {
+                "pullRequest": pr_number,
+                "organization": owner,
+                "repository": repo,
+            }
+            if self.continuation_token:
+                query["continuationToken"] = self.continuation_token
+
+            response = await gh.builds(query=query)
+            self.task_group_ids.update(
+                build["taskGroupId"] for build in response["builds"]
+            )
+            self.continuation_token = response.get("continuationToken")
+            self.exhausted = not self.continuation_token
+
+            if task_group_id in self.task_group_ids:
+                return True
+
+        return False
+
+
+def _taskcluster_options(context):
+    return {
         "rootUrl": context.config["taskcluster_root_url"],
         "credentials": {
             "accessToken": os.environ.get("TASKCLUSTER_ACCESS_TOKEN"),
@@ -11,12 +65,49 @@ def is_task_coming_from_pr(context, task_id, owner, repo, pr_number):
         },
     }
 
-    gh = Github(tc_config)
-    queue = Queue(tc_config)
 
-    task_group_id = queue.task(task_id)["taskGroupId"]
-    builds_for_pr = gh.builds(
-        query={"pullRequest": pr_number, "organization": owner, "repository": repo}
-    )["builds"]
+async def _get_task_group_id(context, task_id):
+    if task_id not in _task_group_ids:
+        # taskcluster is slow to import, only pay for it when it's used.
+        from taskcluster.aio import Queue
+
+        queue = Queue(_taskcluster_options(context), session=context.session)
+        task = await queue.task(task_id)
+        _task_group_ids[task_id] = task["taskGroupId"]
+        while len(_task_group_ids) > _MAX_TASK_GROUP_IDS:
+            del _task_group_ids[next(iter(_task_group_ids))]
+    return _task_group_ids[task_id]
+
+
+async def is_task_coming_from_pr(context, task_id, owner, repo, pr_number):
+    """Check that `task_id` belongs to a task group created for the PR.
+
+    The PR's builds are cached for `provenance_cache_ttl` seconds, so several
+    actions for the same PR only list them once.
+    """
+    task_group_id = await _get_task_group_id(context, task_id)
+    ttl = context.config.get("provenance_cache_ttl", DEFAULT_PROVENANCE_CACHE_TTL)
+
+    # Drop the expired builds of every PR, not to keep those of every PR a
+    # worker ever checked.
+    for expired in [key for key, builds in _pr_builds.items() if builds.expired()]:
+        del _pr_builds[expired]
+
+    key = (owner, repo, pr_number)
+    builds = _pr_builds.get(key)
+    if builds is None:
+        builds = _pr_builds[key] = _PullRequestBuilds(ttl)
+
+    async with builds.lock:
+        if task_group_id in builds.task_group_ids:
+            return True
+
+        if builds.exhausted:
+            # Everything was listed already but a push may have happened
+            # since, start over before rejecting the task.
+            builds.reset(ttl)
+
+        from taskcluster.aio import Github
 
-    return any(build["taskGroupId"] == task_group_id for build in builds_for_pr)
+        gh = Github(_taskcluster_options(context), session=context.session)
+        return await builds.find(gh, owner, repo, pr_number, task_group_id)
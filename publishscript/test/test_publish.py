@@ -1,13 +1,35 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import subprocess
 import pytest
 from contextlib import contextmanager, ExitStack
 from unittest.mock import AsyncMock, MagicMock, patch, call, ANY
-from publishscript.publish import publish
+from publishscript.artifact_cache import ArtifactCache
+from publishscript.publish import (
+    GIT_ENV,
+    _checkout_merged_main,
+    _download_artifact,
+    _ensure_repo,
+    _repo_lock,
+    _squash_merged_worktree,
+    publish,
+)
 from scriptworker.exceptions import TaskVerificationError
 
 
 MOCK_PR_CHECK = "publishscript.publish.is_task_coming_from_pr"
 
 
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path):
+    cache_dir = tmp_path / "repo-cache"
+    with patch("publishscript.publish.CACHE_DIR", str(cache_dir)):
+        yield cache_dir
+
+
 @pytest.fixture
 def context():
     ctx = MagicMock()
@@ -27,6 +49,7 @@ def context():
     github = AsyncMock()
     merge_resp = AsyncMock()
     merge_resp.raise_for_status = MagicMock()
+    merge_resp.json = AsyncMock(return_value={"sha": "merged-sha"})
     github.put = AsyncMock(return_value=merge_resp)
 
     token_resp = AsyncMock()
@@ -49,7 +72,7 @@ def _common_patches():
     return [
         patch(MOCK_PR_CHECK, return_value=True),
         patch("publishscript.publish._ensure_repo", new_callable=AsyncMock, return_value="/tmp/fake-repo"),
-        patch("publishscript.publish._run_git", new_callable=AsyncMock),
+        patch("publishscript.publish._run_git", new_callable=AsyncMock, return_value=""),
         patch("publishscript.publish._download_artifact", new_callable=AsyncMock, return_value="/tmp/fake.diff"),
         patch("publishscript.publish._run_patch", new_callable=AsyncMock),
         patch("os.path.getsize", return_value=100),
@@ -59,10 +82,49 @@ def _common_patches():
 
 @pytest.mark.asyncio
 async def test_publish_rejects_unrelated_task(context):
-    with patch(MOCK_PR_CHECK, return_value=False):
+    async def not_from_pr(*args):
+        # Let the downloads finish first
+        await asyncio.sleep(0.01)
+        return False
+
+    with (
+        patch(MOCK_PR_CHECK, side_effect=not_from_pr),
+        patch("publishscript.publish._download_artifact", new_callable=AsyncMock, return_value="/tmp/fake.diff"),
+        patch("publishscript.publish._ensure_repo", new_callable=AsyncMock) as mock_ensure_repo,
+        patch("os.unlink") as mock_unlink,
+    ):
         with pytest.raises(TaskVerificationError):
             await publish(context)
 
+        # Downloads started early are thrown away, the repo is never touched
+        mock_unlink.assert_called_once_with("/tmp/fake.diff")
+        mock_ensure_repo.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_publish_downloads_while_fetching_repo(context):
+    context.task["payload"]["expectations-task"] = "expectations-task-id"
+    in_flight = 0
+    max_in_flight = 0
+
+    async def slow(*args, **kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return "/tmp/fake.diff"
+
+    patches = _common_patches()
+    with _enter_patches(patches) as mocks:
+        mocks[1].side_effect = slow
+        mocks[3].side_effect = slow
+
+        await publish(context)
+
+    # Both artifacts and the repo fetch at once
+    assert max_in_flight == 3
+
 
 @pytest.mark.asyncio
 async def test_publish_merges_pr(context):
@@ -84,12 +146,24 @@ async def test_publish_does_dry_run_before_merge(context):
 
         await publish(context)
 
-        # Dry run patch should happen before the merge API call
-        mock_run_patch.assert_any_call("/tmp/fake.diff", "/tmp/fake-repo", dry_run=True)
+        # Dry run patch should happen in a throwaway worktree
+        worktree = mock_run_patch.call_args_list[0].args[1]
+        assert worktree != "/tmp/fake-repo"
+        mock_run_patch.assert_any_call("/tmp/fake.diff", worktree)
+        assert not os.path.exists(worktree)
 
         # Verify squash merge simulation happened
-        mock_git.assert_any_call(["fetch", "origin", "pull/42/head:pr-head"], cwd="/tmp/fake-repo")
-        mock_git.assert_any_call(["merge", "--squash", "pr-head"], cwd="/tmp/fake-repo", env=ANY)
+        mock_git.assert_any_call(
+            ["worktree", "add", "--detach", worktree, "origin/main"], cwd="/tmp/fake-repo"
+        )
+        mock_git.assert_any_call(["merge", "--squash", "pr-head-42"], cwd=worktree, env=ANY)
+        mock_git.assert_any_call(
+            ["worktree", "remove", "--force", worktree], cwd="/tmp/fake-repo", allow_failure=True
+        )
+
+        # The cached checkout is only reset once, to the merged main
+        resets = [c for c in mock_git.call_args_list if c.args[0][0] == "reset"]
+        assert resets == [call(["reset", "--hard", "origin/main"], cwd="/tmp/fake-repo")]
 
 
 @pytest.mark.asyncio
@@ -101,7 +175,7 @@ async def test_publish_applies_lock_diff(context):
 
         await publish(context)
 
-        # Real apply (without dry_run)
+        # Real apply in the cached checkout
         mock_run_patch.assert_any_call("/tmp/fake.diff", "/tmp/fake-repo")
         mock_git.assert_any_call(["add", "index.lock"], cwd="/tmp/fake-repo")
 
@@ -161,3 +235,642 @@ async def test_dry_run_failure_prevents_merge(context):
 
         # Merge should never have been called
         context.github.put.assert_not_called()
+
+
+
+
+def _fake_git(rev_list):
+    async def run_git(args, cwd, env=None, allow_failure=False):
+        if args[0] == "rev-parse":
+            return "base-sha"
+        if args[0] == "rev-list":
+            return rev_list
+        return ""
+
+    return run_git
+
+
+@pytest.mark.asyncio
+async def test_publish_fetches_only_the_merge_commit(context):
+    patches = _common_patches()
+    with _enter_patches(patches) as mocks:
+        mock_git = mocks[2]
+        mock_git.side_effect = _fake_git("merged-sha\nbase-sha")
+
+        await publish(context)
+
+        mock_git.assert_any_call(["fetch", "origin", "merged-sha"], cwd="/tmp/fake-repo")
+        mock_git.assert_any_call(["reset", "--hard", "merged-sha"], cwd="/tmp/fake-repo")
+        fetches = [c.args[0] for c in mock_git.call_args_list if c.args[0][0] == "fetch"]
+        assert fetches == [["fetch", "origin", "merged-sha"]]
+
+
+@pytest.mark.asyncio
+async def test_publish_fetches_main_when_it_moved_during_merge(context):
+    patches = _common_patches()
+    with _enter_patches(patches) as mocks:
+        mock_git = mocks[2]
+        mock_git.side_effect = _fake_git("merged-sha\nsomeone-else-sha")
+
+        await publish(context)
+
+        mock_git.assert_any_call(
+            ["fetch", "origin", "+refs/heads/main:refs/remotes/origin/main"], cwd="/tmp/fake-repo"
+        )
+        mock_git.assert_any_call(["reset", "--hard", "origin/main"], cwd="/tmp/fake-repo")
+
+
+def _batch_payload():
+    return {
+        "prs": [
+            {"pr-number": 42, "head-rev": "abc123", "diff-task": "diff-42"},
+            {
+                "pr-number": 43,
+                "head-rev": "def456",
+                "diff-task": "diff-43",
+                "expectations-task": "expectations-43",
+            },
+        ]
+    }
+
+
+@pytest.fixture
+def batch_context(context):
+    context.config["batch_publish_scheduler_ids"] = ["ap-publish"]
+    context.task["schedulerId"] = "ap-publish"
+    context.task["payload"] = _batch_payload()
+    return context
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("scheduler_id", ["taskcluster-github", None])
+async def test_publish_batch_from_untrusted_scheduler(batch_context, scheduler_id):
+    batch_context.task["schedulerId"] = scheduler_id
+
+    patches = _common_patches()
+    with _enter_patches(patches) as mocks:
+        with pytest.raises(TaskVerificationError):
+            await publish(batch_context)
+
+        mocks[0].assert_not_called()
+        batch_context.github.put.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_publish_batch_merges_in_order_and_pushes_once(batch_context):
+    context = batch_context
+
+    patches = _common_patches()
+    with _enter_patches(patches) as mocks:
+        mock_pr_check = mocks[0]
+        mock_git = mocks[2]
+
+        await publish(context)
+
+        # Each PR's artifacts are checked against it
+        checked = sorted((c.args[1], c.args[4]) for c in mock_pr_check.call_args_list)
+        assert checked == [("diff-42", 42), ("diff-43", 43), ("expectations-43", 43)]
+
+        assert context.github.put.call_args_list == [
+            call(
+                "/repos/Eijebong/Archipelago-index/pulls/42/merge",
+                data={"merge_method": "squash", "sha": "abc123"},
+            ),
+            call(
+                "/repos/Eijebong/Archipelago-index/pulls/43/merge",
+                data={"merge_method": "squash", "sha": "def456"},
+            ),
+        ]
+
+        mocks[1].assert_called_once_with(
+            "Eijebong", "Archipelago-index", ANY, [42, 43],
+            clone_filter=None, sparse_paths=None,
+        )
+        pushes = [c for c in mock_git.call_args_list if c.args[0][0] == "push"]
+        assert len(pushes) == 1
+        mock_git.assert_any_call(
+            ["commit", "-m", "Update index lock (#43)"],
+            cwd="/tmp/fake-repo", env=ANY, allow_failure=True,
+        )
+
+
+@pytest.mark.asyncio
+async def test_publish_batch_pushes_merged_prs_when_a_merge_fails(batch_context):
+    context = batch_context
+
+    merge_resp = MagicMock()
+    merge_resp.json = AsyncMock(return_value={"sha": "merged-sha"})
+    failed_resp = MagicMock()
+    failed_resp.raise_for_status.side_effect = RuntimeError("not mergeable")
+    context.github.put = AsyncMock(side_effect=[merge_resp, failed_resp])
+
+    patches = _common_patches()
+    with _enter_patches(patches) as mocks:
+        mock_git = mocks[2]
+
+        with pytest.raises(RuntimeError, match="not mergeable"):
+            await publish(context)
+
+        mock_git.assert_any_call(
+            ["commit", "-m", "Update index lock (#42)"],
+            cwd="/tmp/fake-repo", env=ANY, allow_failure=True,
+        )
+        commits = [
+            c.args[0][-1]
+            for c in mock_git.call_args_list
+            if c.args[0][0] == "commit" and c.kwargs["cwd"] == "/tmp/fake-repo"
+        ]
+        assert "Update index lock (#43)" not in commits
+        mock_git.assert_any_call(["push", "origin", "main"], cwd="/tmp/fake-repo")
+
+
+def _artifact_session(data):
+    async def iter_chunked(size):
+        for i in range(0, len(data), 4):
+            yield data[i : i + 4]
+
+    response = AsyncMock()
+    response.__aenter__.return_value.raise_for_status = MagicMock()
+    response.__aenter__.return_value.content.iter_chunked = iter_chunked
+    session = MagicMock()
+    session.get = MagicMock(return_value=response)
+    return session
+
+
+def _artifact_queue(state):
+    queue = AsyncMock()
+    queue.status.return_value = {"status": {"runs": [{"runId": 3, "state": state}]}}
+    queue.getArtifact.return_value = {"url": "https://nowhere/run-artifact"}
+    queue.getLatestArtifact.return_value = {"url": "https://nowhere/latest-artifact"}
+    return queue
+
+
+@pytest.mark.asyncio
+async def test_download_artifact_without_cache():
+    session = _artifact_session(b"lock diff")
+    queue = _artifact_queue("completed")
+
+    path = await _download_artifact(session, queue, "diff-task-id", "public/build/lock.diff")
+    try:
+        with open(path, "rb") as fd:
+            assert fd.read() == b"lock diff"
+    finally:
+        os.unlink(path)
+
+    session.get.assert_called_once_with("https://nowhere/latest-artifact")
+    queue.status.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_download_artifact_reads_through_cache(tmp_path):
+    cache = ArtifactCache(str(tmp_path))
+    queue = _artifact_queue("completed")
+
+    paths = []
+    try:
+        for _ in range(2):
+            session = _artifact_session(b"lock diff")
+            paths.append(
+                await _download_artifact(
+                    session, queue, "diff-task-id", "public/build/lock.diff", cache
+                )
+            )
+
+        for path in paths:
+            with open(path, "rb") as fd:
+                assert fd.read() == b"lock diff"
+    finally:
+        for path in paths:
+            os.unlink(path)
+
+    queue.getArtifact.assert_called_once_with("diff-task-id", 3, "public/build/lock.diff")
+    session.get.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_download_artifact_removes_partial_file(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    queue = _artifact_queue("completed")
+
+    session = _artifact_session(b"lock diff")
+    response = session.get.return_value.__aenter__.return_value
+    response.raise_for_status.side_effect = RuntimeError("boom")
+
+    with (
+        patch("tempfile.tempdir", str(tmp_path)),
+        pytest.raises(RuntimeError, match="boom"),
+    ):
+        await _download_artifact(session, queue, "diff-task-id", "public/build/lock.diff", cache)
+
+    assert [p for p in tmp_path.iterdir() if p.is_file()] == []
+
+
+def _git(*args, cwd):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, env={**os.environ, **GIT_ENV})
+
+
+@pytest.fixture
+def origin(tmp_path):
+    origin = tmp_path / "origin"
+    (origin / "meta").mkdir(parents=True)
+    (origin / "apworlds").mkdir()
+    _git("init", "-q", "-b", "main", cwd=origin)
+    _git("config", "uploadpack.allowFilter", "true", cwd=origin)
+    (origin / "index.lock").write_text("base\n")
+    (origin / "meta" / "expectations.toml").write_text("base\n")
+    (origin / "apworlds" / "world.toml").write_text("base\n")
+    _git("add", ".", cwd=origin)
+    _git("commit", "-qm", "base", cwd=origin)
+    _git("checkout", "-qb", "pr", cwd=origin)
+    (origin / "index.lock").write_text("pr\n")
+    _git("commit", "-qam", "pr", cwd=origin)
+    _git("update-ref", "refs/pull/42/head", "pr", cwd=origin)
+    _git("checkout", "-q", "main", cwd=origin)
+    return origin
+
+
+@contextmanager
+def _local_repo_cache(cache_dir, origin):
+    cache_dir.mkdir()
+    with patch("publishscript.publish._clone_url", return_value=f"file://{origin}"):
+        yield
+
+
+def _git_output(*args, cwd):
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout
+
+
+@pytest.mark.asyncio
+async def test_ensure_repo_partial_sparse_clone(cache_dir, origin):
+    with _local_repo_cache(cache_dir, origin):
+        repo_dir = await _ensure_repo(
+            "Eijebong", "Archipelago-index", "token", [42],
+            clone_filter="blob:none", sparse_paths=["meta"],
+        )
+
+        assert _git_output("config", "remote.origin.partialclonefilter", cwd=repo_dir).strip() == "blob:none"
+        assert os.path.exists(os.path.join(repo_dir, "index.lock"))
+        assert os.path.exists(os.path.join(repo_dir, "meta", "expectations.toml"))
+        assert not os.path.exists(os.path.join(repo_dir, "apworlds"))
+        # Only main and the PR head
+        refs = _git_output("for-each-ref", "--format=%(refname)", cwd=repo_dir).split()
+        refs.remove("refs/remotes/origin/HEAD")
+        assert sorted(refs) == ["refs/heads/main", "refs/heads/pr-head-42", "refs/remotes/origin/main"]
+
+        # A warm cache picks new commits of the PR up
+        _git("checkout", "-q", "pr", cwd=origin)
+        (origin / "index.lock").write_text("pr v2\n")
+        _git("commit", "-qam", "pr v2", cwd=origin)
+        _git("update-ref", "refs/pull/42/head", "pr", cwd=origin)
+        _git("checkout", "-q", "main", cwd=origin)
+
+        await _ensure_repo(
+            "Eijebong", "Archipelago-index", "token", [42],
+            clone_filter="blob:none", sparse_paths=["meta"],
+        )
+        assert _git_output("show", "pr-head-42:index.lock", cwd=repo_dir) == "pr v2\n"
+
+
+@pytest.mark.asyncio
+async def test_squash_merged_worktree_leaves_checkout_alone(cache_dir, origin):
+    with _local_repo_cache(cache_dir, origin):
+        repo_dir = await _ensure_repo(
+            "Eijebong", "Archipelago-index", "token", [42],
+            clone_filter="blob:none", sparse_paths=["meta"],
+        )
+
+    async with _squash_merged_worktree(repo_dir, [42]) as worktree:
+        with open(os.path.join(worktree, "index.lock")) as fd:
+            assert fd.read() == "pr\n"
+        assert os.path.exists(os.path.join(worktree, "meta", "expectations.toml"))
+
+    assert not os.path.exists(worktree)
+    with open(os.path.join(repo_dir, "index.lock")) as fd:
+        assert fd.read() == "base\n"
+    assert _git_output("status", "--porcelain", cwd=repo_dir) == ""
+    assert len(_git_output("worktree", "list", cwd=repo_dir).splitlines()) == 1
+
+
+async def _hold_repo_lock(owner, repo, events, name):
+    async with _repo_lock(owner, repo):
+        events.append(f"{name} start")
+        await asyncio.sleep(0.05)
+        events.append(f"{name} end")
+
+
+@pytest.mark.asyncio
+async def test_repo_lock_serializes_same_repo():
+    events = []
+    with patch("publishscript.publish.REPO_LOCK_POLL_INTERVAL", 0.01):
+        await asyncio.gather(
+            _hold_repo_lock("Eijebong", "Archipelago-index", events, "a"),
+            _hold_repo_lock("Eijebong", "Archipelago-index", events, "b"),
+        )
+
+    assert events in (
+        ["a start", "a end", "b start", "b end"],
+        ["b start", "b end", "a start", "a end"],
+    )
+
+
+@pytest.mark.asyncio
+async def test_repo_lock_lets_other_repos_through():
+    events = []
+    await asyncio.gather(
+        _hold_repo_lock("Eijebong", "Archipelago-index", events, "a"),
+        _hold_repo_lock("Eijebong", "staging-archipelago-index", events, "b"),
+    )
+
+    assert events[:2] == ["a start", "b start"]
+
+
+@pytest.mark.asyncio
+async def test_publish_releases_repo_lock_on_failure(context):
+    patches = _common_patches()
+    with _enter_patches(patches) as mocks:
+        mocks[4].side_effect = RuntimeError("patch dry-run failed")
+
+        with pytest.raises(RuntimeError):
+            await publish(context)
+
+    # Not held anymore
+    async with asyncio.timeout(1):
+        async with _repo_lock("Eijebong", "Archipelago-index"):
+            pass
+
+
+@pytest.mark.asyncio
+async def test_squash_merged_worktree_stacks_prs(cache_dir, origin):
+    # A second PR, based on main before the first one
+    _git("checkout", "-qb", "other", "main", cwd=origin)
+    (origin / "meta" / "expectations.toml").write_text("other\n")
+    _git("commit", "-qam", "other", cwd=origin)
+    _git("update-ref", "refs/pull/43/head", "other", cwd=origin)
+    _git("checkout", "-q", "main", cwd=origin)
+
+    with _local_repo_cache(cache_dir, origin):
+        repo_dir = await _ensure_repo(
+            "Eijebong", "Archipelago-index", "token", [42, 43],
+            clone_filter="blob:none", sparse_paths=["meta"],
+        )
+
+    async with _squash_merged_worktree(repo_dir, [42, 43]) as worktree:
+        with open(os.path.join(worktree, "index.lock")) as fd:
+            assert fd.read() == "pr\n"
+        with open(os.path.join(worktree, "meta", "expectations.toml")) as fd:
+            assert fd.read() == "other\n"
+
+    branches = _git_output("branch", "--format=%(refname:short)", cwd=repo_dir).split()
+    assert branches == ["main"]
+
+
+@pytest.mark.asyncio
+async def test_checkout_merged_main_fetches_the_merge_commit(cache_dir, origin):
+    with _local_repo_cache(cache_dir, origin):
+        repo_dir = await _ensure_repo(
+            "Eijebong", "Archipelago-index", "token", [42],
+            clone_filter="blob:none", sparse_paths=["meta"],
+        )
+    base = _git_output("rev-parse", "origin/main", cwd=repo_dir).strip()
+
+    # GitHub squash merging the PR
+    _git("merge", "-q", "--squash", "pr", cwd=origin)
+    _git("commit", "-qm", "Squash merge #42", cwd=origin)
+    merge_sha = _git_output("rev-parse", "HEAD", cwd=origin).strip()
+
+    await _checkout_merged_main(repo_dir, base, [merge_sha])
+
+    assert _git_output("rev-parse", "HEAD", cwd=repo_dir).strip() == merge_sha
+    with open(os.path.join(repo_dir, "index.lock")) as fd:
+        assert fd.read() == "pr\n"
+    # main wasn't fetched as a whole
+    assert _git_output("rev-parse", "origin/main", cwd=repo_dir).strip() == base
+
+
+class _FakeResponse:
+    def __init__(self, status, data=None):
+        self.status = status
+        self._data = data
+
+    async def json(self):
+        return self._data
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise RuntimeError(f"HTTP {self.status}")
+
+    def release(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *excinfo):
+        pass
+
+
+class _FakeGitData:
+    """Just enough of GitHub's REST API for the API publish engine."""
+
+    PREFIX = "/repos/Eijebong/Archipelago-index"
+
+    def __init__(self, files, mergeable=True):
+        self.trees = {}
+        self.blobs = {}
+        self.commits = {}
+        self.mergeable = mergeable
+        base = self._add_commit(self._add_tree(files), [])
+        # GitHub's test merge and the squash merge have the same tree.
+        self.test_merge = self._add_commit(self.commits[base]["tree"], [base])
+        self.main = base
+        self.merges = []
+        self.auth = AsyncMock()
+        # How many times reading a commit 404s after a merge.
+        self.merge_lag = 0
+        self.lagging = 0
+        self.ref_updates = []
+
+    def _add_tree(self, files):
+        sha = "tree-" + hashlib.sha1(json.dumps(sorted(files.items())).encode()).hexdigest()
+        self.trees[sha] = dict(files)
+        return sha
+
+    def _add_commit(self, tree, parents, message=""):
+        sha = f"commit-{len(self.commits)}"
+        self.commits[sha] = {"tree": tree, "parents": parents, "message": message}
+        return sha
+
+    def files_at(self, commit):
+        return self.trees[self.commits[commit]["tree"]]
+
+    async def get(self, query, params=None, **kwargs):
+        path = query.removeprefix(self.PREFIX)
+        if path == "/pulls/42":
+            return _FakeResponse(200, {
+                "head": {"sha": "abc123"},
+                "mergeable": self.mergeable,
+                "merge_commit_sha": self.test_merge,
+            })
+        if path.startswith("/contents/"):
+            content = self.files_at(params["ref"]).get(path.removeprefix("/contents/"))
+            if content is None:
+                return _FakeResponse(404)
+            return _FakeResponse(200, {
+                "type": "file",
+                "encoding": "base64",
+                "content": base64.b64encode(content.encode()).decode(),
+            })
+        if path.startswith("/git/commits/"):
+            commit = self.commits.get(path.removeprefix("/git/commits/"))
+            if commit is None or self.lagging:
+                self.lagging = max(self.lagging - 1, 0)
+                return _FakeResponse(404)
+            return _FakeResponse(200, {"tree": {"sha": commit["tree"]}})
+        return _FakeResponse(404)
+
+    async def post(self, query, data=None, **kwargs):
+        path = query.removeprefix(self.PREFIX)
+        if path == "/git/blobs":
+            sha = f"blob-{len(self.blobs)}"
+            self.blobs[sha] = base64.b64decode(data["content"]).decode()
+            return _FakeResponse(201, {"sha": sha})
+        if path == "/git/trees":
+            files = dict(self.trees[data["base_tree"]])
+            for entry in data["tree"]:
+                if entry["sha"] is None:
+                    files.pop(entry["path"], None)
+                else:
+                    files[entry["path"]] = self.blobs[entry["sha"]]
+            return _FakeResponse(201, {"sha": self._add_tree(files)})
+        if path == "/git/commits":
+            sha = self._add_commit(data["tree"], data["parents"], data["message"])
+            return _FakeResponse(201, {"sha": sha})
+        return _FakeResponse(404)
+
+    async def put(self, query, data=None, **kwargs):
+        self.merges.append(query)
+        self.main = self._add_commit(self.commits[self.test_merge]["tree"], [self.main])
+        self.lagging = self.merge_lag
+        return _FakeResponse(200, {"sha": self.main})
+
+    async def patch(self, query, data=None, **kwargs):
+        assert query == f"{self.PREFIX}/git/refs/heads/main"
+        assert not data["force"]
+        self.ref_updates.append(data["sha"])
+        self.main = data["sha"]
+        return _FakeResponse(200, {})
+
+
+LOCK_DIFF = """\
+diff --git a/index.lock b/index.lock
+--- a/index.lock
++++ b/index.lock
+@@ -1,2 +1,3 @@
+ alttp = "1.0.0"
++pokemon = "3.0.0"
+ sm64 = "0.1.0"
+"""
+
+
+def _api_publish(context, tmp_path, lock_diff=LOCK_DIFF):
+    context.config["publish_engine"] = "api"
+    lock_patch = tmp_path / "lock.diff"
+    lock_patch.write_text(lock_diff)
+
+    async def download(session, queue, task_id, artifact_name, cache=None):
+        path = tmp_path / f"{task_id}.diff"
+        path.write_text(lock_patch.read_text())
+        return str(path)
+
+    return [
+        patch(MOCK_PR_CHECK, return_value=True),
+        patch("publishscript.publish._download_artifact", side_effect=download),
+        patch("publishscript.publish._ensure_repo", new_callable=AsyncMock, return_value="/tmp/fake-repo"),
+        patch("publishscript.publish._run_git", new_callable=AsyncMock, return_value=""),
+        patch("publishscript.publish._run_patch", new_callable=AsyncMock),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_publish_with_api_engine(context, tmp_path):
+    github = _FakeGitData({"index.lock": 'alttp = "1.0.0"\nsm64 = "0.1.0"\n'})
+    context.github = github
+
+    with _enter_patches(_api_publish(context, tmp_path)) as mocks:
+        await publish(context)
+
+        mocks[2].assert_not_called()
+
+    head = github.commits[github.main]
+    assert head["message"] == "Update index lock"
+    assert github.commits[head["parents"][0]]["tree"] == github.commits[github.test_merge]["tree"]
+    assert github.files_at(github.main)["index.lock"] == (
+        'alttp = "1.0.0"\npokemon = "3.0.0"\nsm64 = "0.1.0"\n'
+    )
+    assert github.merges == ["/repos/Eijebong/Archipelago-index/pulls/42/merge"]
+
+
+@pytest.mark.asyncio
+@patch("asyncio.sleep", AsyncMock())
+async def test_publish_with_api_engine_waits_for_merge_commit(context, tmp_path):
+    github = _FakeGitData({"index.lock": 'alttp = "1.0.0"\nsm64 = "0.1.0"\n'})
+    github.merge_lag = 2
+    context.github = github
+
+    with _enter_patches(_api_publish(context, tmp_path)):
+        await publish(context)
+
+    assert github.files_at(github.main)["index.lock"] == (
+        'alttp = "1.0.0"\npokemon = "3.0.0"\nsm64 = "0.1.0"\n'
+    )
+
+
+@pytest.mark.asyncio
+@patch("asyncio.sleep", AsyncMock())
+async def test_publish_with_api_engine_merge_commit_never_shows_up(context, tmp_path):
+    github = _FakeGitData({"index.lock": 'alttp = "1.0.0"\nsm64 = "0.1.0"\n'})
+    github.merge_lag = 10
+    context.github = github
+
+    with _enter_patches(_api_publish(context, tmp_path)) as mocks:
+        with pytest.raises(RuntimeError, match="merged as .* but its patches weren't applied"):
+            await publish(context)
+
+        # Too late to fall back to the git engine.
+        mocks[2].assert_not_called()
+    assert github.merges == ["/repos/Eijebong/Archipelago-index/pulls/42/merge"]
+    assert github.ref_updates == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mergeable", [True, None])
+async def test_publish_with_api_engine_falls_back_to_git(context, tmp_path, mergeable):
+    # The lock moved under the PR, or GitHub didn't compute the test merge yet
+    lock = 'factorio = "1.0.0"\n' if mergeable else 'alttp = "1.0.0"\nsm64 = "0.1.0"\n'
+    github = _FakeGitData({"index.lock": lock}, mergeable=mergeable)
+    context.github = github
+
+    with _enter_patches(_api_publish(context, tmp_path)) as mocks:
+        await publish(context)
+
+        # Nothing was merged before falling back, the git engine did it
+        mocks[2].assert_called_once()
+        mocks[3].assert_any_call(["push", "origin", "main"], cwd="/tmp/fake-repo")
+    assert github.merges == ["/repos/Eijebong/Archipelago-index/pulls/42/merge"]
+
+
+@pytest.mark.asyncio
+async def test_publish_writes_timings(context, tmp_path):
+    context.config["artifact_dir"] = str(tmp_path)
+
+    with _enter_patches(_common_patches()):
+        await publish(context)
+
+    with open(tmp_path / "public" / "logs" / "timings.json") as fd:
+        timings = json.load(fd)
+    phases = [span["name"] for span in timings["spans"] if span["kind"] == "phase"]
+    for phase in ("provenance", "repo_lock", "ensure_repo", "downloads", "dry_run", "merge", "patch", "push"):
+        assert phase in phases
+    assert any(span["kind"] == "http" and span["name"] == "merge" for span in timings["spans"])
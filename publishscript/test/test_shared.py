@@ -0,0 +1,27 @@
+import pathlib
+import re
+
+import pytest
+
+ROOT = pathlib.Path(__file__).parents[2]
+
+# Modules copied from githubscript, which tests them. Fixes have to land in
+# both copies.
+SHARED_MODULES = (
+    "artifact_cache",
+    "daemon",
+    "github_auth",
+    "github_client",
+    "metrics",
+    "rate_limit",
+)
+
+
+def _source(package, module):
+    source = (ROOT / package / "src" / package / f"{module}.py").read_text()
+    return re.sub(r"(github|publish)script", "<script>", source)
+
+
+@pytest.mark.parametrize("module", SHARED_MODULES)
+def test_shared_module_matches_githubscript(module):
+    assert _source("publishscript", module) == _source("githubscript", module)
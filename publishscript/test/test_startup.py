@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Import time of a cold task, in microseconds: the entry point and what
+# main() imports before running the task. Most of it is scriptworker.client,
+# whose jsonschema format checkers are slow to import, only the daemon avoids
+# it. Can be raised with STARTUP_BUDGET_US on slow machines.
+STARTUP_BUDGET_US = int(os.environ.get("STARTUP_BUDGET_US", 4_000_000))
+COLD_START_IMPORTS = ("publishscript.__main__", "scriptworker.client")
+
+# Left to main() and to the actions, importing the entry point stays cheap.
+DEFERRED_MODULES = ("scriptworker.client", "simple_github", "taskcluster")
+
+
+def _import_times(*modules):
+    """Return the cumulative import time of every module imported by
+    importing `modules`, and their total."""
+    env = dict(os.environ, TASKCLUSTER_ROOT_URL="https://nowhere")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        times[name.strip()] = int(cumulative)
+        # Nested imports are indented, they're part of their parent's time.
+        if not name.startswith("  "):
+            total += int(cumulative)
+    return times, total
+
+
+def test_startup_budget():
+    times, total = _import_times(*COLD_START_IMPORTS)
+    assert "scriptworker.client" in times
+    assert total <= STARTUP_BUDGET_US
+
+
+@pytest.mark.parametrize("module", DEFERRED_MODULES)
+def test_heavy_modules_are_deferred(module):
+    times, _ = _import_times("publishscript.__main__")
+    assert module not in times
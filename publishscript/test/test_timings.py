@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+import pytest
+
+from publishscript import metrics
+from publishscript.timings import TIMINGS_ARTIFACT, collect, timed
+
+
+def _load(tmp_path):
+    with open(tmp_path / TIMINGS_ARTIFACT) as fd:
+        return json.load(fd)
+
+
+@pytest.mark.asyncio
+async def test_collect_writes_spans(tmp_path):
+    async def call(name):
+        with timed("git", name):
+            await asyncio.sleep(0)
+
+    with collect(str(tmp_path)):
+        with timed("phase", "fetch", pr=42):
+            # Tasks started while collecting record to the same timings
+            await asyncio.gather(asyncio.create_task(call("fetch")), call("rev-parse"))
+
+    timings = _load(tmp_path)
+    spans = {(span["kind"], span["name"]): span for span in timings["spans"]}
+    assert set(spans) == {("phase", "fetch"), ("git", "fetch"), ("git", "rev-parse")}
+    assert spans["phase", "fetch"]["pr"] == 42
+    assert all(span["ok"] for span in spans.values())
+    assert timings["duration"] >= spans["phase", "fetch"]["duration"]
+
+
+def test_collect_records_failures(tmp_path):
+    with pytest.raises(RuntimeError):
+        with collect(str(tmp_path)):
+            with timed("phase", "push"):
+                raise RuntimeError("rejected")
+
+    span, = _load(tmp_path)["spans"]
+    assert (span["name"], span["ok"]) == ("push", False)
+
+
+def test_collect_write_failure(tmp_path):
+    # The artifact dir is a file, so the timings can't be written
+    artifact_dir = tmp_path / "artifacts"
+    artifact_dir.write_text("")
+
+    with pytest.raises(RuntimeError, match="rejected"):
+        with collect(str(artifact_dir)):
+            with timed("phase", "push"):
+                raise RuntimeError("rejected")
+
+
+def test_timed_without_collect():
+    with timed("phase", "push"):
+        pass
+
+
+def test_phases_are_metrics(tmp_path):
+    with metrics.collect(None) as registry, collect(None):
+        with timed("phase", "push"):
+            with timed("git", "push"):
+                pass
+
+    histogram, = registry.histograms.values()
+    assert histogram["count"] == 1
+    assert list(registry.histograms) == [
+        metrics._series("publish_phase_duration_seconds", {"phase": "push"})
+    ]
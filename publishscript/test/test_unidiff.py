@@ -0,0 +1,91 @@
+import pytest
+
+from publishscript.unidiff import PatchError, apply_file_patch, parse_patch
+
+GIT_DIFF = """\
+diff --git a/index.lock b/index.lock
+index 16fcb73..21de1f5 100644
+--- a/index.lock
++++ b/index.lock
+@@ -2,3 +2,4 @@ [worlds]
+ alttp = "1.0.0"
+ factorio = "2.0.0"
++pokemon = "3.0.0"
+ sm64 = "0.1.0"
+"""
+
+DIFF_U = """\
+--- a/meta/expectations.toml\t2024-01-01 00:00:00.000000000 +0000
++++ b/meta/expectations.toml\t2024-01-01 00:00:00.000000000 +0000
+@@ -1,2 +1,2 @@
+-alttp = "ok"
++alttp = "flaky"
+ factorio = "ok"
+\\ No newline at end of file
+--- /dev/null\t2024-01-01 00:00:00.000000000 +0000
++++ b/meta/new.toml\t2024-01-01 00:00:00.000000000 +0000
+@@ -0,0 +1 @@
++new = "ok"
+"""
+
+LOCK = '[worlds]\nalttp = "1.0.0"\nfactorio = "2.0.0"\nsm64 = "0.1.0"\n'
+
+
+def test_parse_patch():
+    lock, = parse_patch(GIT_DIFF)
+    assert (lock.old_path, lock.new_path) == ("index.lock", "index.lock")
+    assert len(lock.hunks) == 1
+
+    expectations, new = parse_patch(DIFF_U)
+    assert expectations.path == "meta/expectations.toml"
+    assert (new.old_path, new.new_path) == (None, "meta/new.toml")
+
+
+def test_apply_file_patch():
+    lock, = parse_patch(GIT_DIFF)
+    assert apply_file_patch(LOCK, lock) == (
+        '[worlds]\nalttp = "1.0.0"\nfactorio = "2.0.0"\npokemon = "3.0.0"\nsm64 = "0.1.0"\n'
+    )
+
+
+def test_apply_file_patch_with_offset():
+    lock, = parse_patch(GIT_DIFF)
+    patched = apply_file_patch("# header\n\n" + LOCK, lock)
+    assert patched.startswith("# header\n\n[worlds]\n")
+    assert 'pokemon = "3.0.0"\nsm64' in patched
+
+
+def test_apply_file_patch_missing_newline_and_new_file():
+    expectations, new = parse_patch(DIFF_U)
+    assert (
+        apply_file_patch('alttp = "ok"\nfactorio = "ok"', expectations)
+        == 'alttp = "flaky"\nfactorio = "ok"'
+    )
+    assert apply_file_patch(None, new) == 'new = "ok"\n'
+
+
+def test_apply_file_patch_missing_newline_before_end_of_file():
+    # No context pins the hunk to the end of the file.
+    patch, = parse_patch(
+        "--- a/f\n+++ b/f\n@@ -1,2 +1 @@\n-a\n-b\n+c\n\\ No newline at end of file\n"
+    )
+    assert apply_file_patch("a\nb\nd\n", patch) == "c\nd\n"
+    assert apply_file_patch("a\nb\n", patch) == "c"
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        LOCK.replace("factorio", "satisfactory"),
+        None,
+    ],
+)
+def test_apply_file_patch_rejects_mismatches(content):
+    lock, = parse_patch(GIT_DIFF)
+    with pytest.raises(PatchError):
+        apply_file_patch(content, lock)
+
+
+def test_parse_patch_rejects_binary():
+    with pytest.raises(PatchError):
+        parse_patch("diff --git a/x b/x\nBinary files a/x and b/x differ\n")
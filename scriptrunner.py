@@ -1,3 +1,4 @@
+import json
 import os
 import subprocess
 import jsone
@@ -12,7 +13,7 @@ taskcluster_root_url: https://taskcluster.bananium.fr
 artifact_upload_timeout: 1200
 task_max_timeout: 1200
 
-task_script: ["bash", "-c", "cd {task_script} && ./run.sh config.json"]
+task_script: ["bash", "-c", "cd {task_script} && ./run.sh {script_config}"]
 
 verbose: true
 
@@ -27,32 +28,71 @@ ed25519_private_key_path: /tmp/ed25519_privkey
 # github_oauth_token: somegithubtoken
 
 
-log_dir: "/tmp/log"
-work_dir: "/tmp/work"
-artifact_dir: "/tmp/artifact"
-task_log_dir: "/tmp/artifact/public/logs"
+log_dir: "/tmp/log{suffix}"
+work_dir: "/tmp/work{suffix}"
+artifact_dir: "/tmp/artifact{suffix}"
+task_log_dir: "/tmp/artifact{suffix}/public/logs"
 """
 
 script_name = os.environ["WORKER_TYPE"]
 trust_level = os.environ.get("TRUST_LEVEL")
 worker_type = f"{script_name}-{trust_level}" if trust_level else script_name
 
-with open("scriptworker.yaml", "w") as fd:
-    fd.write(
-        CONFIG.format(
-            worker_type=worker_type,
-            worker_id=worker_type,
-            task_script=script_name,
-        )
-    )
-
+# Each scriptworker instance claims and runs its own tasks, running several of
+# them lets a worker run that many tasks at once. Scripts have to be safe to
+# run concurrently for this.
+instances = int(os.environ.get("SCRIPTWORKER_INSTANCES", "1"))
 
+rendered_config = None
 if os.path.isfile(os.path.join(script_name, "config.json.tpl")):
     with open(os.path.join(script_name, "config.json.tpl")) as fd:
         context = os.environ.copy()
         rendered_config = jsone.render(fd.read(), context)
 
-    with open(os.path.join(script_name, "config.json"), "w") as fd:
-        fd.write(rendered_config)
+instance_configs = []
+for instance in range(instances):
+    # The first instance keeps the paths of a single instance worker.
+    suffix = f"-{instance}" if instance else ""
+    config_name = f"config{suffix}.json"
+    worker_config = f"scriptworker{suffix}.yaml"
+
+    with open(worker_config, "w") as fd:
+        fd.write(
+            CONFIG.format(
+                worker_type=worker_type,
+                worker_id=f"{worker_type}{suffix}",
+                task_script=script_name,
+                script_config=config_name,
+                suffix=suffix,
+            )
+        )
+    instance_configs.append(worker_config)
+
+    if instance:
+        # The script must read the task from this instance's work dir.
+        script_config = (
+            json.loads(rendered_config, strict=False) if rendered_config else {}
+        )
+        script_config["work_dir"] = f"/tmp/work{suffix}"
+        script_config["artifact_dir"] = f"/tmp/artifact{suffix}"
+        with open(os.path.join(script_name, config_name), "w") as fd:
+            json.dump(script_config, fd)
+    elif rendered_config is not None:
+        with open(os.path.join(script_name, config_name), "w") as fd:
+            fd.write(rendered_config)
+
+# Keep a warm instance of the script around, run.sh hands tasks to it instead
+# of starting a new interpreter for each of them. It inherits this environment
+# so the Taskcluster credentials are the same as for the cold path.
+if os.environ.get("SCRIPT_DAEMON", "1") != "0" and os.path.isfile(
+    os.path.join(script_name, "src", script_name, "daemon.py")
+):
+    os.environ["SCRIPT_SOCKET"] = f"/tmp/{script_name}.sock"
+    subprocess.Popen(["bash", "-c", f"cd {script_name} && ./run.sh --serve"])
 
-subprocess.run("scriptworker")
+workers = [
+    subprocess.Popen(["scriptworker", worker_config])
+    for worker_config in instance_configs
+]
+for worker in workers:
+    worker.wait()